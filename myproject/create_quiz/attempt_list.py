@@ -0,0 +1,106 @@
+"""
+The graders' attempts list: keyset pagination and database-side summaries.
+
+Pages are cut on ``(started_at, id)`` descending, served by the
+``attempt_quiz_started_idx`` index, so page 500 costs the same as page 1.
+The summary (counts, mean, median, score distribution) is computed with
+aggregate queries over the quiz's attempts, never by walking rows in
+Python, and cached under the quiz's result versions.
+"""
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, IntegerField, Q
+from django.db.models.functions import Cast, Floor, Least
+
+from myapp.result_versions import get_versions
+
+PAGE_SIZE = 50
+SUMMARY_TIMEOUT = 60 * 60
+BUCKETS = 10  # score distribution in steps of 10 points
+
+FILTER_ALL = ""
+FILTER_PENDING = "pending"
+FILTER_FINISHED = "finished"
+FILTER_IN_PROGRESS = "in_progress"
+
+STATUS_FILTERS = {
+    FILTER_ALL: Q(),
+    FILTER_PENDING: Q(finished_at__isnull=False, pending_short_count__gt=0),
+    FILTER_FINISHED: Q(finished_at__isnull=False),
+    FILTER_IN_PROGRESS: Q(finished_at__isnull=True),
+}
+
+
+def encode_cursor(attempt):
+    return f"{attempt.started_at.isoformat()}_{attempt.pk}"
+
+
+def decode_cursor(value):
+    """Return ``(started_at, id)`` from a cursor, or None if it is malformed."""
+    if not value:
+        return None
+    started_at, _, pk = value.rpartition("_")
+    try:
+        return datetime.fromisoformat(started_at), int(pk)
+    except ValueError:
+        return None
+
+
+def page_after(attempts, cursor, page_size=PAGE_SIZE):
+    """
+    Return ``(page, next_cursor)``: the ``page_size`` attempts that follow
+    ``cursor`` in newest-first order, and the cursor of the page after it
+    (None on the last page).
+    """
+    attempts = attempts.order_by("-started_at", "-id")
+    position = decode_cursor(cursor)
+    if position is not None:
+        started_at, pk = position
+        attempts = attempts.filter(Q(started_at__lt=started_at) | Q(started_at=started_at, id__lt=pk))
+    page = list(attempts[:page_size + 1])
+    if len(page) > page_size:
+        page = page[:page_size]
+        return page, encode_cursor(page[-1])
+    return page, None
+
+
+def quiz_summary(quiz):
+    """``summarize`` for all of ``quiz``'s attempts, cached until one starts, finishes or is graded."""
+    versions = get_versions("quiz", [quiz.pk])[quiz.pk], get_versions("quiz_attempts", [quiz.pk])[quiz.pk]
+    key = f"attempt_summary:{quiz.pk}:{versions[0]}:{versions[1]}"
+    summary = cache.get(key)
+    if summary is None:
+        summary = summarize(quiz.attempts.all())
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def summarize(attempts):
+    """Counts per status, and mean, median and distribution of finished scores."""
+    summary = attempts.aggregate(
+        total=Count("id"),
+        finished=Count("id", filter=STATUS_FILTERS[FILTER_FINISHED]),
+        in_progress=Count("id", filter=STATUS_FILTERS[FILTER_IN_PROGRESS]),
+        pending=Count("id", filter=STATUS_FILTERS[FILTER_PENDING]),
+        scored=Count("score", filter=STATUS_FILTERS[FILTER_FINISHED]),
+        mean=Avg("score", filter=STATUS_FILTERS[FILTER_FINISHED]),
+    )
+
+    scored = attempts.filter(STATUS_FILTERS[FILTER_FINISHED], score__isnull=False)
+    n = summary["scored"]
+    summary["median"] = None
+    if n:
+        middle = list(scored.order_by("score").values_list("score", flat=True)[(n - 1) // 2:n // 2 + 1])
+        summary["median"] = sum(middle) / len(middle)
+
+    counts = dict(
+        scored.annotate(bucket=Least(Cast(Floor(F("score") / 10), IntegerField()), BUCKETS - 1))
+        .order_by()
+        .values_list("bucket")
+        .annotate(n=Count("id"))
+    )
+    summary["distribution"] = [
+        (f"{i * 10}-{i * 10 + 9 if i < BUCKETS - 1 else 100}", counts.get(i, 0)) for i in range(BUCKETS)
+    ]
+    return summary
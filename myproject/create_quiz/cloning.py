@@ -0,0 +1,125 @@
+"""
+Copying quizzes.
+
+``clone_quiz`` copies a quiz with its questions and choices in a fixed
+number of queries: one bulk insert per table, with the old question ids
+remapped to the new ones in memory. ``copy_questions`` appends chosen
+questions from the question bank to an existing quiz the same way.
+``iter_export_lines`` streams a quiz as
+JSON Lines in the format ``question_io`` imports, so an export can be loaded
+into another quiz or another installation.
+"""
+import json
+
+from django.db import transaction
+
+from myapp.answer_key import bump_content_version
+from myapp.item_analysis import mark_stale
+from myapp.models import Quiz, Question, Choice
+from myapp.question_search import reindex_questions
+from room.models import RoomQuizAssignment
+
+from .ordering import ORDER_GAP, next_order
+
+QUESTION_FIELDS = ("text", "qtype", "order", "correct_text", "match_mode", "match_tolerance")
+
+
+def clone_quiz(quiz, creator, title=None, room=None):
+    """
+    Return an unpublished copy of ``quiz`` owned by ``creator``, assigned to
+    ``room`` when one is given.
+    """
+    with transaction.atomic():
+        new_quiz = Quiz.objects.create(
+            title=title or quiz.title,
+            description=quiz.description,
+            creator=creator,
+            is_published=False,
+            time_limit_minutes=quiz.time_limit_minutes,
+        )
+
+        source = list(
+            Question.objects.filter(quiz=quiz)
+            .order_by("order", "id")
+            .values_list("id", *QUESTION_FIELDS)
+        )
+        created = Question.objects.bulk_create([
+            Question(quiz=new_quiz, **dict(zip(QUESTION_FIELDS, row[1:])))
+            for row in source
+        ])
+        new_ids = {row[0]: q.pk for row, q in zip(source, created)}
+        _copy_children(new_ids, question__quiz=quiz)
+
+        if room is not None:
+            RoomQuizAssignment.objects.create(room=room, quiz=new_quiz, assigned_by=creator)
+    reindex_questions(new_ids.values())
+    return new_quiz
+
+
+def copy_questions(question_ids, quiz):
+    """
+    Append copies of the questions ``question_ids``, in that order, to the
+    end of ``quiz``. Returns the new questions.
+    """
+    question_ids = list(dict.fromkeys(question_ids))
+    with transaction.atomic():
+        rows = {
+            row[0]: row
+            for row in Question.objects.filter(pk__in=question_ids).values_list("id", *QUESTION_FIELDS)
+        }
+        source = [rows[pk] for pk in question_ids if pk in rows]
+        first = next_order(quiz.pk)
+        created = Question.objects.bulk_create([
+            Question(quiz=quiz, **dict(zip(QUESTION_FIELDS, row[1:]), order=first + i * ORDER_GAP))
+            for i, row in enumerate(source)
+        ])
+        new_ids = {row[0]: q.pk for row, q in zip(source, created)}
+        _copy_children(new_ids, question_id__in=list(new_ids))
+    if created:
+        # bulk_create skips the signals that normally rotate the version.
+        bump_content_version([quiz.pk])
+        mark_stale(quiz.pk)
+        reindex_questions(new_ids.values())
+    return created
+
+
+def _copy_children(new_ids, **source):
+    """Copy the choices and tags selected by ``source`` to the new questions in ``new_ids`` (old id -> new id)."""
+    Choice.objects.bulk_create([
+        Choice(question_id=new_ids[question_id], text=text, is_correct=is_correct)
+        for question_id, text, is_correct in Choice.objects.filter(**source)
+        .order_by("id")
+        .values_list("question_id", "text", "is_correct")
+    ])
+    QuestionTag = Question.tags.through
+    QuestionTag.objects.bulk_create([
+        QuestionTag(question_id=new_ids[question_id], tag_id=tag_id)
+        for question_id, tag_id in QuestionTag.objects.filter(**source)
+        .values_list("question_id", "tag_id")
+    ])
+
+
+def iter_export_lines(quiz):
+    """Yield one JSON line per question, choices included, in question order."""
+    questions = (
+        Question.objects.filter(quiz=quiz)
+        .order_by("order", "id")
+        .values_list("id", *QUESTION_FIELDS)
+        .iterator()
+    )
+    # Both streams are in question order, so choices are merged in one pass.
+    choices = (
+        Choice.objects.filter(question__quiz=quiz)
+        .order_by("question__order", "question_id", "id")
+        .values_list("question_id", "text", "is_correct")
+        .iterator()
+    )
+    pending = next(choices, None)
+    for question_id, *values in questions:
+        record = dict(zip(QUESTION_FIELDS, values))
+        del record["order"]
+        record["choices"] = []
+        while pending is not None and pending[0] == question_id:
+            record["choices"].append({"text": pending[1], "is_correct": pending[2]})
+            pending = next(choices, None)
+        yield json.dumps(record, ensure_ascii=False) + "\n"
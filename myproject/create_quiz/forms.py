@@ -1,6 +1,8 @@
 from django import forms
 from django.forms import BaseInlineFormSet, inlineformset_factory
-from myapp.models import Quiz, Question, Choice
+from myapp.models import Quiz, Question, Choice, Tag
+from room.models import Room, RoomMembership
+from myapp.short_grading import MATCH_MANUAL
 
 QTYPE_CHOICES = Question._meta.get_field("qtype").choices
 
@@ -25,20 +27,27 @@ class QuizForm(forms.ModelForm):
                 'rows': 4,
             })
 
+def parse_tag_names(value):
+    """Split a comma-separated tag list, dropping blanks and duplicates."""
+    names = (name.strip()[:Tag._meta.get_field("name").max_length] for name in (value or "").split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+
 class QuestionForm(forms.ModelForm):
     qtype = forms.ChoiceField(choices=QTYPE_CHOICES, initial="short", required=True,label="ประเภทคำถาม")
+    tag_names = forms.CharField(required=False, label="แท็ก", help_text="คั่นแต่ละแท็กด้วยเครื่องหมายจุลภาค (,)")
 
     class Meta:
         model = Question
-        fields = ['text', 'qtype', 'order', 'correct_text'] 
+        fields = ['text', 'qtype', 'correct_text', 'match_mode', 'match_tolerance']
         labels = {
             'text': 'โจทย์',
             'qtype': 'ประเภทคำถาม',
-            'order': 'ลำดับ',
             'correct_text': 'คำตอบที่ถูกต้อง',
+            'match_mode': 'วิธีตรวจคำตอบ',
+            'match_tolerance': 'ค่าความคลาดเคลื่อนที่ยอมรับ',
         }
         widgets = {
-            'order': forms.HiddenInput(),
             'correct_text': forms.Textarea(attrs={'rows':3, 'class': 'form-control'}),
         }
 
@@ -49,22 +58,43 @@ class QuestionForm(forms.ModelForm):
                 field.widget.attrs.update({'class': 'form-control', 'rows': 3})
             else:
                 field.widget.attrs.update({'class': 'form-control'})
+        self.fields['match_mode'].required = False
+        if self.instance.pk and not self.is_bound:
+            self.initial['tag_names'] = ", ".join(tag.name for tag in self.instance.tags.all())
+
+    def clean_match_mode(self):
+        return self.cleaned_data.get('match_mode') or MATCH_MANUAL
+
+    def clean_tag_names(self):
+        return parse_tag_names(self.cleaned_data.get('tag_names'))
+
+    def save_tags(self, question, owner):
+        """Set ``question``'s tags to the entered names, creating ``owner``'s missing tags."""
+        names = self.cleaned_data.get('tag_names') or []
+        existing = {tag.name: tag for tag in Tag.objects.filter(owner=owner, name__in=names)}
+        missing = [Tag(owner=owner, name=name) for name in names if name not in existing]
+        if missing:
+            Tag.objects.bulk_create(missing, ignore_conflicts=True)
+            existing = {tag.name: tag for tag in Tag.objects.filter(owner=owner, name__in=names)}
+        question.tags.set([existing[name] for name in names if name in existing])
+
+def validate_mcq_choices(choices):
+    """``choices`` is an iterable of ``(text, is_correct)``; blank texts are ignored."""
+    choices = [(text, is_correct) for text, is_correct in choices if text]
+    if len(choices) < 2:
+        raise forms.ValidationError("at least 2 choices")
+    if sum(1 for _, is_correct in choices if is_correct) != 1:
+        raise forms.ValidationError("exactly one choice must be marked correct")
+
 
 class BaseChoiceInlineFormSet(BaseInlineFormSet):
     def clean(self):
         super().clean()
         choices = []
-        correct_count = 0
         for form in self.forms:
             if form.cleaned_data.get("DELETE", False):
                 continue
-            text = form.cleaned_data.get("text")
-            is_correct = form.cleaned_data.get("is_correct", False)
-            if not text:
-                continue
-            choices.append(text)
-            if is_correct:
-                correct_count += 1
+            choices.append((form.cleaned_data.get("text"), form.cleaned_data.get("is_correct", False)))
 
         qtype = None
         if hasattr(self.instance, "qtype") and getattr(self.instance, "qtype", None):
@@ -73,10 +103,7 @@ class BaseChoiceInlineFormSet(BaseInlineFormSet):
             qtype = getattr(self, "_parent_qtype", None)
 
         if qtype == "mcq":
-            if len(choices) < 2:
-                raise forms.ValidationError("at least 2 choices")
-            if correct_count != 1:
-                raise forms.ValidationError("exactly one choice must be marked correct")
+            validate_mcq_choices(choices)
 
 
 def make_choice_formset(extra=0, can_delete=True):
@@ -91,3 +118,34 @@ def make_choice_formset(extra=0, can_delete=True):
                 extra=1,
                 can_delete=True
             )
+
+
+IMPORT_FORMAT_CHOICES = (
+    ("auto", "ตามนามสกุลไฟล์"),
+    ("csv", "CSV"),
+    ("json", "JSON / JSON Lines"),
+    ("gift", "Moodle GIFT"),
+)
+
+class QuestionImportForm(forms.Form):
+    file = forms.FileField(label="ไฟล์คำถาม")
+    format = forms.ChoiceField(choices=IMPORT_FORMAT_CHOICES, initial="auto", label="รูปแบบไฟล์")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs.update({'class': 'form-control'})
+
+
+class CloneQuizForm(forms.Form):
+    title = forms.CharField(max_length=255, label="ชื่อ Quiz ใหม่")
+    room = forms.ModelChoiceField(queryset=Room.objects.none(), required=False, label="มอบหมายให้ห้อง", empty_label="ไม่มอบหมาย")
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['room'].queryset = Room.objects.filter(
+            memberships__user=user,
+            memberships__role__in=[RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN],
+        ).order_by('name')
+        for field in self.fields.values():
+            field.widget.attrs.update({'class': 'form-control'})
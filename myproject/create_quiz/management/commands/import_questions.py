@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from myapp.models import Quiz
+from create_quiz import question_io
+
+
+class Command(BaseCommand):
+    help = "Append questions from a CSV, JSON/JSON Lines or GIFT file to a quiz."
+
+    def add_arguments(self, parser):
+        parser.add_argument("quiz_id", type=int)
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["auto", *question_io.PARSERS], default="auto")
+        parser.add_argument("--batch-size", type=int, default=question_io.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            quiz = Quiz.objects.get(pk=options["quiz_id"])
+        except Quiz.DoesNotExist:
+            raise CommandError(f"Quiz {options['quiz_id']} does not exist.")
+
+        with open(options["path"], "rb") as fh:
+            try:
+                rows = question_io.iter_rows(fh, options["format"], options["path"])
+            except question_io.ImportRowError as exc:
+                raise CommandError(str(exc))
+            try:
+                report = question_io.import_questions(quiz, rows, batch_size=options["batch_size"])
+            except IntegrityError:
+                raise CommandError("Questions were being added to the quiz concurrently; some were not imported.")
+
+        for line, message in report.errors:
+            self.stderr.write(f"{line or '-'}: {message}")
+        if report.truncated:
+            self.stderr.write(f"... {report.failed - len(report.errors)} more errors")
+        self.stdout.write(self.style.SUCCESS(f"Imported {report.created} questions, skipped {report.failed}."))
@@ -0,0 +1,97 @@
+"""
+Question ordering keys.
+
+``Question.order`` values are spaced ORDER_GAP apart and unique per quiz, so
+moving one question between two others is a single-row update to the
+midpoint. Only when two neighbours have run out of room is the quiz
+renumbered, and a full renumber is one CASE update into a band that cannot
+overlap the current values, so the unique constraint holds row by row.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, IntegerField, Max, Min, Value, When
+
+from myapp.answer_key import bump_content_version
+from myapp.models import Question
+
+ORDER_GAP = 1024
+APPEND_RETRIES = 5
+
+
+def next_order(quiz_id):
+    last = Question.objects.filter(quiz_id=quiz_id).aggregate(m=Max("order"))["m"] or 0
+    return last + ORDER_GAP
+
+
+def save_appended(question):
+    """Save a new question after the quiz's last one, retrying if a concurrent add took the slot."""
+    for attempt in range(APPEND_RETRIES):
+        question.order = next_order(question.quiz_id)
+        try:
+            with transaction.atomic():
+                question.save()
+            return question
+        except IntegrityError:
+            if attempt == APPEND_RETRIES - 1:
+                raise
+
+
+def apply_order(quiz, question_ids):
+    """
+    Renumber the quiz so ``question_ids`` come first, in that order, followed
+    by any questions not listed, in their current order. One UPDATE.
+    """
+    with transaction.atomic():
+        current = list(
+            Question.objects.select_for_update()
+            .filter(quiz=quiz)
+            .order_by("order", "id")
+            .values_list("id", flat=True)
+        )
+        known = set(current)
+        listed = [pk for pk in dict.fromkeys(question_ids) if pk in known]
+        chosen = set(listed)
+        ordered = listed + [pk for pk in current if pk not in chosen]
+        if not ordered:
+            return
+
+        bounds = Question.objects.filter(quiz=quiz).aggregate(lo=Min("order"), hi=Max("order"))
+        # Low band if it fits below every current value, otherwise above them all.
+        if bounds["lo"] > len(ordered) * ORDER_GAP:
+            base = 0
+        else:
+            base = bounds["hi"]
+        Question.objects.filter(quiz=quiz).update(order=Case(
+            *[When(pk=pk, then=Value(base + i * ORDER_GAP)) for i, pk in enumerate(ordered, start=1)],
+            output_field=IntegerField(),
+        ))
+    bump_content_version([quiz.pk])
+
+
+def move_question(question, after_id=None):
+    """
+    Place ``question`` right after ``after_id`` (or first when None) by
+    giving it the midpoint of its new neighbours. Usually one UPDATE.
+    """
+    for _ in range(2):
+        siblings = Question.objects.filter(quiz_id=question.quiz_id).exclude(pk=question.pk)
+        if after_id is None:
+            low = 0
+        else:
+            low = siblings.filter(pk=after_id).values_list("order", flat=True).first()
+            if low is None:
+                raise Question.DoesNotExist(after_id)
+        high = siblings.filter(order__gt=low).aggregate(m=Min("order"))["m"]
+        new_order = low + ORDER_GAP if high is None else (low + high) // 2
+        if new_order not in (low, high):
+            try:
+                with transaction.atomic():
+                    Question.objects.filter(pk=question.pk).update(order=new_order)
+            except IntegrityError:
+                pass
+            else:
+                question.order = new_order
+                bump_content_version([question.quiz_id])
+                return question
+        # No room between the neighbours (or a concurrent move took it): respace and retry.
+        apply_order(question.quiz, [])
+    raise IntegrityError("could not find a free order slot")
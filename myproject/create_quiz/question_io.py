@@ -0,0 +1,415 @@
+"""
+Bulk question import for create_quiz.
+
+Parsers read a text stream one question at a time and yield ``(line, raw)``
+pairs, where ``raw`` is a dict or an ImportRowError. ``import_questions``
+validates each record with the same rules as the question form and writes
+the valid ones with bulk inserts, a batch at a time, so memory stays bounded
+and the query count depends on the number of batches only. Bad rows are
+reported and skipped; they never abort the import.
+
+Formats:
+
+* CSV with a header row: ``text, qtype, correct_text, match_mode,
+  match_tolerance, choices``. ``choices`` is ``|``-separated, the correct one
+  prefixed with ``*`` (``\\|`` for a literal bar).
+* JSON Lines, or a JSON array, of objects with the same keys; ``choices`` is
+  a list of ``{"text": ..., "is_correct": ...}``.
+* Moodle GIFT: multiple choice, true/false, short answer and numerical
+  questions.
+"""
+import csv
+import io
+import json
+import re
+
+from django import forms
+from django.db import IntegrityError, transaction
+
+from myapp.answer_key import bump_content_version
+from myapp.item_analysis import mark_stale
+from myapp.models import Question, Choice
+from myapp.question_search import reindex_questions
+from myapp.short_grading import MATCH_MANUAL, MATCH_MODE_CHOICES, MATCH_NORMALIZED, MATCH_NUMERIC
+
+from . import ordering
+from .forms import validate_mcq_choices
+from .ordering import APPEND_RETRIES, ORDER_GAP
+
+QTYPES = {value for value, _ in Question._meta.get_field("qtype").choices}
+MATCH_MODES = {value for value, _ in MATCH_MODE_CHOICES}
+CHOICE_MAX_LENGTH = Choice._meta.get_field("text").max_length
+BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+JSON_CHUNK_SIZE = 1 << 16
+
+FORMAT_EXTENSIONS = {
+    ".csv": "csv",
+    ".json": "json",
+    ".jsonl": "json",
+    ".ndjson": "json",
+    ".gift": "gift",
+    ".txt": "gift",
+}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def truncated(self):
+        return self.failed > len(self.errors)
+
+
+# --- parsers ---------------------------------------------------------------
+
+_CHOICE_SPLIT_RE = re.compile(r"(?<!\\)\|")
+
+
+def parse_csv(stream):
+    reader = csv.DictReader(stream)
+    if reader.fieldnames:
+        reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames]
+    for row in reader:
+        choices = []
+        for part in _CHOICE_SPLIT_RE.split(row.get("choices") or ""):
+            part = part.replace("\\|", "|").strip()
+            if part:
+                choices.append((part.lstrip("*").strip(), part.startswith("*")))
+        yield reader.line_num, {
+            "text": row.get("text"),
+            "qtype": row.get("qtype"),
+            "correct_text": row.get("correct_text"),
+            "match_mode": row.get("match_mode"),
+            "match_tolerance": row.get("match_tolerance"),
+            "choices": choices,
+        }
+
+
+def parse_json(stream):
+    """JSON Lines, or a single JSON array decoded element by element."""
+    head = stream.read(JSON_CHUNK_SIZE)
+    if head.lstrip().startswith("["):
+        yield from _iter_json_array(stream, head)
+        return
+
+    for lineno, line in enumerate(_iter_lines(stream, head), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield lineno, json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield lineno, ImportRowError(f"invalid JSON: {exc.msg}")
+
+
+def _iter_lines(stream, head):
+    rest = ""
+    chunk = head
+    while chunk:
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        yield from lines
+        chunk = stream.read(JSON_CHUNK_SIZE)
+    if rest:
+        yield rest
+
+
+def _iter_json_array(stream, buf):
+    decoder = json.JSONDecoder()
+    pos = buf.index("[") + 1
+    index = 0
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Element runs past the buffer: keep the tail and read on.
+            more = stream.read(JSON_CHUNK_SIZE)
+            if not more:
+                if buf[pos:].strip():
+                    yield index + 1, ImportRowError("invalid or truncated JSON")
+                return
+            buf, pos = buf[pos:] + more, 0
+            continue
+        index += 1
+        yield index, value
+        pos = end
+
+
+_GIFT_ESCAPE_RE = re.compile(r"\\([~=#{}:\\])")
+_GIFT_ANSWER_SPLIT_RE = re.compile(r"(?<!\\)([=~])")
+_GIFT_FORMAT_RE = re.compile(r"^\s*\[(?:html|moodle|plain|markdown)\]", re.I)
+_GIFT_TITLE_RE = re.compile(r"^\s*::(.*?)(?<!\\)::", re.S)
+_GIFT_WEIGHT_RE = re.compile(r"^%(-?\d+(?:\.\d+)?)%")
+
+
+def parse_gift(stream):
+    block, start, depth = [], None, 0
+    for lineno, line in enumerate(stream, 1):
+        stripped = line.strip()
+        if stripped.startswith("//") or (depth == 0 and stripped.startswith("$CATEGORY:")):
+            continue
+        if not stripped and depth == 0:
+            if block:
+                yield start, _parse_gift_question("\n".join(block))
+                block, start = [], None
+            continue
+        if start is None:
+            start = lineno
+        block.append(line.rstrip("\r\n"))
+        depth += _unescaped_count(line, "{") - _unescaped_count(line, "}")
+    if block:
+        yield start, _parse_gift_question("\n".join(block))
+
+
+def _unescaped_count(text, char):
+    return len(re.findall(r"(?<!\\)" + re.escape(char), text))
+
+
+def _gift_unescape(text):
+    return _GIFT_ESCAPE_RE.sub(r"\1", text.replace("\\n", "\n")).strip()
+
+
+def _parse_gift_question(source):
+    title = _GIFT_TITLE_RE.match(source)
+    if title:
+        source = source[title.end():]
+    opening = re.search(r"(?<!\\)\{", source)
+    closing = None
+    for closing in re.finditer(r"(?<!\\)\}", source):
+        pass
+    if not opening or not closing or closing.start() < opening.start():
+        return ImportRowError("GIFT question has no answer block")
+
+    before, after = source[:opening.start()], source[closing.end():]
+    text = before.rstrip() + (" _____ " + after.lstrip() if after.strip() else "")
+    text = _gift_unescape(_GIFT_FORMAT_RE.sub("", text))
+    answer = source[opening.end():closing.start()].strip()
+
+    if answer.upper() in ("T", "TRUE", "F", "FALSE"):
+        truth = answer.upper().startswith("T")
+        return {"text": text, "qtype": "mcq", "choices": [("True", truth), ("False", not truth)]}
+
+    if answer.startswith("#"):
+        return _parse_gift_numeric(text, answer[1:])
+
+    if "->" in answer:
+        return ImportRowError("GIFT matching questions are not supported")
+
+    choices = []
+    parts = _GIFT_ANSWER_SPLIT_RE.split(answer)
+    for marker, body in zip(parts[1::2], parts[2::2]):
+        body = re.split(r"(?<!\\)#", body, maxsplit=1)[0].strip()
+        weight = _GIFT_WEIGHT_RE.match(body)
+        if weight:
+            body = body[weight.end():]
+        correct = marker == "=" or bool(weight and float(weight.group(1)) >= 100)
+        choices.append((_gift_unescape(body), correct))
+    if not choices:
+        return ImportRowError("GIFT answer block is empty")
+
+    if all(marker == "=" for marker in parts[1::2]):
+        return {
+            "text": text,
+            "qtype": "short",
+            "correct_text": "\n".join(body for body, _ in choices),
+            "match_mode": MATCH_NORMALIZED,
+        }
+    return {"text": text, "qtype": "mcq", "choices": choices}
+
+
+def _parse_gift_numeric(text, answer):
+    answer = answer.lstrip("=").split("=")[0]
+    answer = re.split(r"(?<!\\)#", answer, maxsplit=1)[0].strip()
+    if ".." in answer:
+        low, high = answer.split("..", 1)
+        try:
+            low, high = float(low), float(high)
+        except ValueError:
+            return ImportRowError("invalid GIFT numeric range")
+        value, tolerance = (low + high) / 2, (high - low) / 2
+    else:
+        value, _, tolerance = answer.partition(":")
+        try:
+            value, tolerance = float(value), float(tolerance or 0)
+        except ValueError:
+            return ImportRowError("invalid GIFT numeric answer")
+    return {
+        "text": text,
+        "qtype": "short",
+        "correct_text": f"{value:g}",
+        "match_mode": MATCH_NUMERIC,
+        "match_tolerance": tolerance,
+    }
+
+
+PARSERS = {"csv": parse_csv, "json": parse_json, "gift": parse_gift}
+
+
+def detect_format(filename):
+    name = (filename or "").lower()
+    for extension, fmt in FORMAT_EXTENSIONS.items():
+        if name.endswith(extension):
+            return fmt
+    return None
+
+
+def iter_rows(binary_stream, fmt="auto", filename=""):
+    """Open an uploaded or on-disk binary stream and return its row iterator."""
+    if fmt in (None, "", "auto"):
+        fmt = detect_format(filename)
+    if fmt not in PARSERS:
+        raise ImportRowError("unknown file format; use .csv, .json, .jsonl or .gift")
+    return PARSERS[fmt](io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline=""))
+
+
+# --- validation and writing ---------------------------------------------------
+
+def _truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "t", "x", "*")
+    return bool(value)
+
+
+def _clean_choice(choice):
+    if isinstance(choice, dict):
+        return str(choice.get("text") or "").strip(), _truthy(choice.get("is_correct"))
+    if isinstance(choice, (list, tuple)) and choice:
+        return str(choice[0] or "").strip(), _truthy(choice[1] if len(choice) > 1 else False)
+    text = str(choice or "").strip()
+    return text.lstrip("*").strip(), text.startswith("*")
+
+
+def clean_record(raw):
+    """Validate one parsed record; returns a dict ready to be written or raises ImportRowError."""
+    if isinstance(raw, Exception):
+        raise raw
+    if not isinstance(raw, dict):
+        raise ImportRowError("expected an object with at least a 'text' key")
+
+    text = str(raw.get("text") or "").strip()
+    if not text:
+        raise ImportRowError("missing question text")
+
+    raw_choices = raw.get("choices") or []
+    if not isinstance(raw_choices, (list, tuple)):
+        raise ImportRowError("'choices' must be a list")
+    choices = [c for c in map(_clean_choice, raw_choices) if c[0]]
+
+    qtype = str(raw.get("qtype") or ("mcq" if choices else "short")).strip().lower()
+    if qtype not in QTYPES:
+        raise ImportRowError(f"unknown qtype {qtype!r}")
+
+    if qtype == "mcq":
+        try:
+            validate_mcq_choices(choices)
+        except forms.ValidationError as exc:
+            raise ImportRowError("; ".join(exc.messages))
+        if any(len(t) > CHOICE_MAX_LENGTH for t, _ in choices):
+            raise ImportRowError(f"choice text longer than {CHOICE_MAX_LENGTH} characters")
+    else:
+        choices = []
+
+    match_mode = str(raw.get("match_mode") or MATCH_MANUAL).strip().lower()
+    if match_mode not in MATCH_MODES:
+        raise ImportRowError(f"unknown match_mode {match_mode!r}")
+    tolerance = raw.get("match_tolerance")
+    if tolerance in (None, ""):
+        tolerance = None
+    else:
+        try:
+            tolerance = float(tolerance)
+        except (TypeError, ValueError):
+            raise ImportRowError("match_tolerance must be a number")
+
+    return {
+        "text": text,
+        "qtype": qtype,
+        "correct_text": str(raw.get("correct_text") or "").strip() if qtype == "short" else "",
+        "match_mode": match_mode,
+        "match_tolerance": tolerance,
+        "choices": choices,
+    }
+
+
+def _write_batch(quiz, records):
+    """
+    Append ``records`` after the quiz's last question. Like
+    ``ordering.save_appended``, a batch whose order slots were taken by a
+    concurrent add is rolled back and retried after the new last question;
+    IntegrityError once the retries run out.
+    """
+    for attempt in range(APPEND_RETRIES):
+        try:
+            with transaction.atomic():
+                first_order = ordering.next_order(quiz.pk)
+                questions = Question.objects.bulk_create([
+                    Question(
+                        quiz=quiz,
+                        text=r["text"],
+                        qtype=r["qtype"],
+                        order=first_order + i * ORDER_GAP,
+                        correct_text=r["correct_text"],
+                        match_mode=r["match_mode"],
+                        match_tolerance=r["match_tolerance"],
+                    )
+                    for i, r in enumerate(records)
+                ])
+                Choice.objects.bulk_create([
+                    Choice(question=q, text=text, is_correct=is_correct)
+                    for q, r in zip(questions, records)
+                    for text, is_correct in r["choices"]
+                ])
+            break
+        except IntegrityError:
+            if attempt == APPEND_RETRIES - 1:
+                raise
+    reindex_questions([q.pk for q in questions])
+
+
+def import_questions(quiz, rows, batch_size=BATCH_SIZE):
+    """
+    Append the questions in ``rows`` (from one of the parsers) to ``quiz``.
+    Each batch is its own transaction; returns an ImportReport. Raises
+    IntegrityError if concurrent adds keep taking a batch's order slots;
+    the batches written before it stay.
+    """
+    report = ImportReport()
+    batch = []
+    try:
+        for line, raw in rows:
+            try:
+                batch.append(clean_record(raw))
+            except ImportRowError as exc:
+                report.add_error(line, str(exc))
+                continue
+            if len(batch) >= batch_size:
+                _write_batch(quiz, batch)
+                report.created += len(batch)
+                batch = []
+    except (csv.Error, UnicodeDecodeError, ValueError) as exc:
+        report.add_error(None, f"file could not be read further: {exc}")
+    if batch:
+        _write_batch(quiz, batch)
+        report.created += len(batch)
+    if report.created:
+        # bulk_create skips the signals that normally rotate the version.
+        bump_content_version([quiz.pk])
+        mark_stale(quiz.pk)
+    return report
@@ -1,11 +1,28 @@
 # create_quiz/tests.py
+import csv
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
 from django.test import TestCase, Client
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import json
 
-from myapp.models import Quiz, Question, Choice
+from myapp.models import Quiz, Question, Choice, QuizStat, Attempt, Answer
+from myapp.question_search import search
+from myapp.result_versions import bump_quiz_attempts
+from myapp.scoring import apply_mark
+from room.models import Room, RoomMembership, RoomQuizAssignment
+from create_quiz import ordering, question_io
+from create_quiz.ordering import ORDER_GAP, move_question, save_appended
 
 User = get_user_model()
 
@@ -14,6 +31,7 @@ CHOICE_PREFIX = "choice_set"
 
 class CreateQuizFlowTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.teacher = User.objects.create_user(username="teacher", password="teachpw")
         self.other = User.objects.create_user(username="other", password="otherpw")
@@ -107,6 +125,46 @@ class CreateQuizFlowTests(TestCase):
         orders = list(Question.objects.filter(quiz=self.quiz).order_by("order").values_list("text", flat=True))
         self.assertEqual(orders, ["C", "A", "B"])
 
+    def test_move_question_updates_one_row_and_respaces_when_full(self):
+        qs = [save_appended(Question(quiz=self.quiz, text=t, qtype="short")) for t in "ABCD"]
+        self.assertEqual([q.order for q in qs], [ORDER_GAP, 2 * ORDER_GAP, 3 * ORDER_GAP, 4 * ORDER_GAP])
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:reorder_questions", args=[self.quiz.pk])
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.post(url, json.dumps({"move": qs[3].pk, "after": qs[0].pk}), content_type="application/json")
+        self.assertEqual(r.status_code, 200)
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE \"myapp_question\"")]
+        self.assertEqual(len(writes), 1)
+
+        def texts():
+            return "".join(Question.objects.filter(quiz=self.quiz).order_by("order").values_list("text", flat=True))
+
+        self.assertEqual(texts(), "ADBC")
+
+        # Keep inserting right after A until the gap is exhausted and the quiz is respaced.
+        for _ in range(12):
+            move_question(Question.objects.get(pk=qs[2].pk), after_id=qs[0].pk)
+            move_question(Question.objects.get(pk=qs[3].pk), after_id=qs[0].pk)
+        self.assertEqual(texts(), "ADCB")
+        r = self.client.post(url, json.dumps({"move": qs[0].pk, "after": None}), content_type="application/json")
+        self.assertEqual(texts(), "ADCB")
+        r = self.client.post(url, json.dumps({"move": qs[1].pk, "after": 12345}), content_type="application/json")
+        self.assertEqual(r.status_code, 400)
+        r = self.client.post(url, json.dumps({"move": qs[1].pk, "after": qs[1].pk}), content_type="application/json")
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(texts(), "ADCB")
+
+    def test_move_question_conflict_is_reported_as_409(self):
+        a, b = (save_appended(Question(quiz=self.quiz, text=t, qtype="short")) for t in "AB")
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:reorder_questions", args=[self.quiz.pk])
+        with mock.patch("create_quiz.views.move_question",
+                        side_effect=IntegrityError("could not find a free order slot")):
+            r = self.client.post(url, json.dumps({"move": b.pk, "after": None}), content_type="application/json")
+        self.assertEqual(r.status_code, 409)
+        self.assertFalse(r.json()["ok"])
+
 
     def test_create_requires_login(self):
         url = reverse("create_quiz:quiz_create")
@@ -179,3 +237,340 @@ class CreateQuizFlowTests(TestCase):
         url = reverse("create_quiz:reorder_questions", args=[self.quiz.pk])
         r = self.client.post(url, json.dumps({"order": [q1.pk]}), content_type="application/json")
         self.assertIn(r.status_code, (403, 404))
+
+    def test_mark_answer_applies_delta_to_attempt_counters(self):
+        student = User.objects.create_user(username="stud", password="pw")
+        mcq = Question.objects.create(quiz=self.quiz, text="M", qtype="mcq", order=1)
+        right = Choice.objects.create(question=mcq, text="ok", is_correct=True)
+        Choice.objects.create(question=mcq, text="no", is_correct=False)
+        short = Question.objects.create(quiz=self.quiz, text="S", qtype="short", order=2)
+        attempt = Attempt.objects.create(quiz=self.quiz, taker=student, finished_at=timezone.now())
+        Answer.objects.create(attempt=attempt, question=mcq, selected_choice=right, is_correct=True)
+        short_answer = Answer.objects.create(attempt=attempt, question=short, text="hi")
+
+        call_command("rebuild_attempt_counters", quiz_ids=[self.quiz.pk], stdout=StringIO())
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.correct_count, attempt.gradable_count, attempt.pending_short_count), (1, 2, 1))
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:mark_answer", args=[short_answer.pk])
+        self.client.post(url, {"mark": "correct", "next": "/"})
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.correct_count, attempt.pending_short_count), (2, 0))
+        self.assertAlmostEqual(attempt.score, 100.0)
+        self.assertTrue(attempt.graded)
+
+        self.client.post(url, {"mark": "incorrect", "next": "/"})
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.correct_count, attempt.pending_short_count), (1, 0))
+        self.assertAlmostEqual(attempt.score, 50.0)
+
+        # The row vanishes between the view's lookup and the mark (re-finalized attempt).
+        loaded = Answer.objects.select_related("question").get(pk=short_answer.pk)
+        Answer.objects.filter(pk=short_answer.pk).delete()
+        self.assertFalse(apply_mark(loaded, True))
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.correct_count, attempt.pending_short_count), (1, 0))
+
+    def test_grade_question_marks_whole_cluster(self):
+        short = Question.objects.create(quiz=self.quiz, text="Capital of France?", qtype="short", order=1)
+        texts = ["Paris", " paris ", "PARIS", "Lyon", "Paris"]
+        attempts = []
+        for i, text in enumerate(texts):
+            student = User.objects.create_user(username=f"s{i}", password="pw")
+            attempt = Attempt.objects.create(quiz=self.quiz, taker=student, finished_at=timezone.now(),
+                                             gradable_count=1, pending_short_count=1)
+            Answer.objects.create(attempt=attempt, question=short, text=text.strip())
+            attempts.append(attempt)
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:grade_question", args=[short.pk])
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        sizes = [(c["key"], c["size"], len(c["texts"])) for c in r.context["clusters"]]
+        self.assertEqual(sizes, [("paris", 4, 3), ("lyon", 1, 1)])
+
+        self.client.post(url, {"cluster": "paris", "mark": "correct"})
+        scores = dict(Attempt.objects.filter(quiz=self.quiz).values_list("pk", "score"))
+        self.assertEqual([scores[a.pk] for a in attempts], [100.0, 100.0, 100.0, None, 100.0])
+        self.assertEqual(Attempt.objects.filter(quiz=self.quiz, pending_short_count=0).count(), 4)
+
+        assert self.client.login(username="other", password="otherpw")
+        self.assertEqual(self.client.post(url, {"cluster": "lyon", "mark": "correct"}).status_code, 403)
+
+    def test_import_questions_reports_bad_rows_and_bulk_inserts(self):
+        Question.objects.create(quiz=self.quiz, text="Existing", qtype="short", order=1)
+        QuizStat.objects.create(quiz=self.quiz, dirty=False)
+        version = Quiz.objects.get(pk=self.quiz.pk).content_version
+        rows = ["text,qtype,correct_text,match_mode,choices"]
+        rows += [f"Q{i},mcq,,,*right|wrong" for i in range(40)]
+        rows += ["Bad,mcq,,,a|b", "Capital of France?,short,Paris,normalized,"]
+        upload = SimpleUploadedFile("questions.csv", "\n".join(rows).encode("utf-8"), content_type="text/csv")
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:import_questions", args=[self.quiz.pk])
+        # One batch: inserts, plus a fixed set of queries to index it for the
+        # question bank, the room access version lookup and marking stats stale.
+        with self.assertNumQueries(20):
+            r = self.client.post(url, {"file": upload, "format": "auto"})
+        report = r.context["report"]
+        self.assertEqual((report.created, report.failed), (41, 1))
+        self.assertEqual(report.errors, [(42, "exactly one choice must be marked correct")])
+
+        questions = list(self.quiz.questions.order_by("order"))
+        self.assertEqual([q.order for q in questions[:3]], [1, 1025, 2049])
+        self.assertEqual(questions[-1].match_mode, "normalized")
+        self.assertEqual(Choice.objects.filter(question__quiz=self.quiz, is_correct=True).count(), 40)
+        self.assertNotEqual(Quiz.objects.get(pk=self.quiz.pk).content_version, version)
+        self.assertTrue(QuizStat.objects.get(quiz=self.quiz).dirty)
+
+    def test_import_questions_retries_when_a_concurrent_add_takes_the_slot(self):
+        taken = Question.objects.create(quiz=self.quiz, text="Added meanwhile", qtype="short", order=1024)
+        real_next_order = ordering.next_order
+        stale = iter([1024])  # the slot as read before the concurrent add
+
+        def next_order(quiz_id):
+            return next(stale, None) or real_next_order(quiz_id)
+
+        def upload():
+            rows = "text,qtype,correct_text\nQ1,short,a\nQ2,short,b"
+            return SimpleUploadedFile("questions.csv", rows.encode("utf-8"), content_type="text/csv")
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:import_questions", args=[self.quiz.pk])
+        with mock.patch("create_quiz.ordering.next_order", side_effect=next_order):
+            r = self.client.post(url, {"file": upload(), "format": "auto"})
+        self.assertEqual(r.status_code, 302)
+        self.assertEqual(list(self.quiz.questions.order_by("order").values_list("text", flat=True)),
+                         [taken.text, "Q1", "Q2"])
+
+        # Slots that stay taken end in a form error, not a 500.
+        with mock.patch("create_quiz.ordering.next_order", return_value=1024):
+            r = self.client.post(url, {"file": upload(), "format": "auto"})
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.context["form"].non_field_errors())
+        self.assertEqual(self.quiz.questions.count(), 3)
+
+    def test_import_questions_command_reads_gift(self):
+        gift = "::q1:: 2+2? {=4 ~3 ~5}\n\nThe sky is {T}\n\nPi? {#3.14:0.01}\n\nNo answer block\n"
+        with tempfile.NamedTemporaryFile("w", suffix=".gift", delete=False, encoding="utf-8") as fh:
+            fh.write(gift)
+        self.addCleanup(os.unlink, fh.name)
+
+        out, err = StringIO(), StringIO()
+        call_command("import_questions", str(self.quiz.pk), fh.name, stdout=out, stderr=err)
+        self.assertIn("Imported 3 questions, skipped 1", out.getvalue())
+        self.assertIn("no answer block", err.getvalue())
+        pi = self.quiz.questions.get(qtype="short")
+        self.assertEqual((pi.correct_text, pi.match_mode, pi.match_tolerance), ("3.14", "numeric", 0.01))
+
+    def _quiz_with_questions(self, n):
+        quiz = Quiz.objects.create(title=f"Quiz {n}", creator=self.teacher)
+        for i in range(n):
+            q = Question.objects.create(quiz=quiz, text=f"Q{i}", qtype="mcq", order=i + 1)
+            Choice.objects.create(question=q, text="yes", is_correct=True)
+            Choice.objects.create(question=q, text="no", is_correct=False)
+        Question.objects.create(quiz=quiz, text="Short", qtype="short", order=n + 1,
+                                correct_text="ok", match_mode="normalized")
+        return quiz
+
+    def test_clone_quiz_is_constant_query_and_assigns_room(self):
+        room = Room.objects.create(name="Term 2", owner=self.teacher)
+        RoomMembership.objects.create(room=room, user=self.teacher, role=RoomMembership.ROLE_OWNER)
+        assert self.client.login(username="teacher", password="teachpw")
+
+        counts = []
+        for n in (3, 30):
+            source = self._quiz_with_questions(n)
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.post(reverse("create_quiz:clone_quiz", args=[source.pk]),
+                                     {"title": f"Copy {n}", "room": room.pk})
+            self.assertEqual(r.status_code, 302)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+        copy = Quiz.objects.get(title="Copy 30")
+        self.assertFalse(copy.is_published)
+        self.assertEqual(copy.questions.count(), 31)
+        self.assertEqual(Choice.objects.filter(question__quiz=copy, is_correct=True).count(), 30)
+        self.assertTrue(RoomQuizAssignment.objects.filter(room=room, quiz=copy).exists())
+
+    def test_export_round_trips_through_importer(self):
+        source = self._quiz_with_questions(4)
+        assert self.client.login(username="teacher", password="teachpw")
+        r = self.client.get(reverse("create_quiz:export_quiz", args=[source.pk]))
+        payload = b"".join(r.streaming_content)
+
+        target = Quiz.objects.create(title="Target", creator=self.teacher)
+        report = question_io.import_questions(target, question_io.iter_rows(BytesIO(payload), "json"))
+        self.assertEqual((report.created, report.failed), (5, 0))
+
+        def content(quiz):
+            return [
+                (q.text, q.qtype, q.correct_text, q.match_mode,
+                 [(c.text, c.is_correct) for c in q.choices.order_by("id")])
+                for q in quiz.questions.order_by("order")
+            ]
+        self.assertEqual(content(target), content(source))
+
+    def test_attempts_list_keyset_pages_filters_and_summary(self):
+        student = User.objects.create_user(username="stu", password="pw")
+        now = timezone.now()
+        Attempt.objects.bulk_create(
+            [Attempt(quiz=self.quiz, taker=student, finished_at=now, score=float(i)) for i in range(55)]
+            + [Attempt(quiz=self.quiz, taker=student, finished_at=now, score=None, pending_short_count=1)]
+        )
+        Attempt.objects.create(quiz=self.quiz, taker=student)
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:quiz_attempts", args=[self.quiz.pk])
+        r1 = self.client.get(url)
+        self.assertEqual(len(r1.context["attempts"]), 50)
+        r2 = self.client.get(url, {"after": r1.context["next_cursor"]})
+        self.assertIsNone(r2.context["next_cursor"])
+        seen = [a.pk for a in r1.context["attempts"]] + [a.pk for a in r2.context["attempts"]]
+        self.assertEqual(seen, list(Attempt.objects.filter(quiz=self.quiz).order_by("-started_at", "-id")
+                                    .values_list("pk", flat=True)))
+
+        summary = r1.context["summary"]
+        self.assertEqual((summary["total"], summary["finished"], summary["in_progress"], summary["pending"]),
+                         (57, 56, 1, 1))
+        self.assertEqual(summary["median"], 27.0)
+        self.assertAlmostEqual(summary["mean"], 27.0)
+        self.assertEqual(summary["distribution"][0], ("0-9", 10))
+        self.assertEqual(summary["distribution"][5], ("50-59", 5))
+
+        pending = self.client.get(url, {"status": "pending"}).context["attempts"]
+        self.assertEqual([a.pending_short_count for a in pending], [1])
+        # The rows agree with the summary: only the pending attempt awaits grading.
+        self.assertContains(self.client.get(url), "รอการตรวจให้คะแนน", count=1)
+        self.assertEqual(len(self.client.get(url, {"status": "in_progress"}).context["attempts"]), 1)
+
+        Attempt.objects.create(quiz=self.quiz, taker=self.other)
+        self.assertEqual(self.client.get(url).context["summary"]["in_progress"], 1)  # cached
+        bump_quiz_attempts(self.quiz.pk)
+        self.assertEqual(self.client.get(url).context["summary"]["in_progress"], 2)
+
+    def test_item_analysis_report_refreshes_and_flags_items(self):
+        quiz = self._quiz_with_questions(1)
+        mcq = quiz.questions.get(qtype="mcq")
+        for n in range(3):
+            taker = User.objects.create_user(username=f"ia{n}", password="pw")
+            a = Attempt.objects.create(quiz=quiz, taker=taker, finished_at=timezone.now())
+            Answer.objects.create(attempt=a, question=mcq, selected_choice=mcq.choices.get(text="yes"), is_correct=True)
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:item_analysis", args=[quiz.pk])
+        self.assertIsNone(self.client.get(url).context["quiz_stat"])
+        self.assertEqual(self.client.post(url).status_code, 302)
+        r = self.client.get(url)
+        self.assertEqual(r.context["quiz_stat"].attempts, 3)
+        self.assertEqual(r.context["rows"][0]["flags"], ["ง่ายเกินไป"])
+        self.assertEqual([(c.text, picked) for c, picked, _ in r.context["rows"][0]["choices"]], [("yes", 3), ("no", 0)])
+
+        self.client.logout()
+        assert self.client.login(username="other", password="otherpw")
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_export_results_streams_csv_in_constant_queries(self):
+        quiz = self._quiz_with_questions(2)
+        q1, q2, short = quiz.questions.order_by("order")
+        yes = q1.choices.get(text="yes")
+        no = q2.choices.get(text="no")
+
+        def add_attempts(n):
+            for i in range(n):
+                taker = User.objects.create_user(username=f"s{User.objects.count()}", password="pw")
+                a = Attempt.objects.create(quiz=quiz, taker=taker, finished_at=timezone.now(), score=50.0,
+                                           graded=False, pending_short_count=1)
+                Answer.objects.create(attempt=a, question=short, text="ok ", is_correct=None)
+                Answer.objects.create(attempt=a, question=q1, selected_choice=yes, is_correct=True)
+                Answer.objects.create(attempt=a, question=q2, selected_choice=no, is_correct=False)
+
+        assert self.client.login(username="teacher", password="teachpw")
+        url = reverse("create_quiz:export_results", args=[quiz.pk])
+        b"".join(self.client.get(url).streaming_content)  # warm the cached room access
+        counts = []
+        for n in (1, 20):
+            add_attempts(n)
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.get(url)
+                body = b"".join(r.streaming_content).decode("utf-8")
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+        self.assertTrue(body.startswith("\ufeff"))
+        rows = list(csv.reader(body[1:].splitlines()))
+        self.assertEqual(rows[0][4:], ["score", "graded", "q1_answer", "q1_correct", "q2_answer",
+                                       "q2_correct", "q3_answer", "q3_correct"])
+        self.assertEqual(len(rows), 22)
+        self.assertEqual(rows[1][5:], ["0", "yes", "1", "no", "0", "ok ", ""])
+
+        # Fully auto-graded at submit: no manual mark, still exported as graded.
+        auto = Attempt.objects.create(quiz=quiz, taker=self.other, finished_at=timezone.now(), score=100.0)
+        body = b"".join(self.client.get(url).streaming_content).decode("utf-8")
+        last = list(csv.reader(body[1:].splitlines()))[-1]
+        self.assertEqual((last[0], last[5]), (str(auto.pk), "1"))
+
+        self.client.logout()
+        assert self.client.login(username="other", password="otherpw")
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_question_bank_search_tags_and_add_to_quiz(self):
+        other_quiz = Quiz.objects.create(title="Not mine", creator=self.other)
+        Question.objects.create(quiz=other_quiz, text="Photosynthesis in leaves", qtype="short", order=1)
+        bank = Quiz.objects.create(title="Biology", creator=self.teacher)
+        light = Question.objects.create(quiz=bank, text="What drives photosynthesis?", qtype="mcq", order=1)
+        Choice.objects.create(question=light, text="Sunlight", is_correct=True)
+        Choice.objects.create(question=light, text="Moonlight", is_correct=False)
+        cell = Question.objects.create(quiz=bank, text="Name the powerhouse of the cell", qtype="short",
+                                       order=2, correct_text="mitochondria")
+        both = Question.objects.create(quiz=bank, text="Photosynthesis photosynthesis and the cell", qtype="short", order=3)
+
+        # Prefix terms, choice and answer texts are all searchable; other teachers' questions are not.
+        self.assertEqual(search(self.teacher, "photo")[0], both)
+        self.assertEqual(set(search(self.teacher, "photo")), {light, both})
+        self.assertEqual(search(self.teacher, "sunl"), [light])
+        self.assertEqual(search(self.teacher, "mitochon"), [cell])
+        self.assertEqual(search(self.teacher, 'cell "power*'), [cell])
+        self.assertEqual(search(self.teacher, "nothing-here"), [])
+
+        # Editing a question keeps the index current, and tags are indexed and filterable.
+        assert self.client.login(username="teacher", password="teachpw")
+        r = self.client.post(reverse("create_quiz:edit_question", args=[cell.pk]), {
+            "text": "Name the organelle", "qtype": "short", "correct_text": "mitochondria",
+            "match_mode": "manual", "tag_names": "cells, Unit 3, cells",
+        })
+        self.assertEqual(r.status_code, 302)
+        self.assertEqual(sorted(cell.tags.values_list("name", flat=True)), ["Unit 3", "cells"])
+        self.assertEqual(search(self.teacher, "powerhouse"), [])
+        self.assertEqual(search(self.teacher, "organ"), [cell])
+        self.assertEqual(search(self.teacher, "unit"), [cell])
+        unit = cell.tags.get(name="Unit 3")
+        self.assertEqual(search(self.teacher, "cell", tag=unit), [cell])
+
+        r = self.client.get(reverse("create_quiz:question_bank"), {"q": "photo"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.context["questions"]), 2)
+
+        target = self.quiz
+        Question.objects.create(quiz=target, text="Existing", qtype="short", order=1024)
+        r = self.client.post(reverse("create_quiz:add_to_quiz"), {
+            "quiz": target.pk,
+            "questions": [cell.pk, light.pk, other_quiz.questions.get().pk],
+        })
+        self.assertEqual(r.status_code, 302)
+        copies = list(target.questions.order_by("order"))
+        self.assertEqual([q.text for q in copies], ["Existing", "Name the organelle", "What drives photosynthesis?"])
+        self.assertEqual(list(copies[2].choices.order_by("id").values_list("text", "is_correct")),
+                         [("Sunlight", True), ("Moonlight", False)])
+        self.assertEqual(sorted(copies[1].tags.values_list("name", flat=True)), ["Unit 3", "cells"])
+        self.assertEqual(set(search(self.teacher, "sunl")), {light, copies[2]})
+
+        target.questions.filter(pk=copies[2].pk).delete()
+        self.assertEqual(search(self.teacher, "sunl"), [light])
+
+        self.client.logout()
+        assert self.client.login(username="other", password="otherpw")
+        r = self.client.post(reverse("create_quiz:add_to_quiz"), {"quiz": target.pk, "questions": [light.pk]})
+        self.assertEqual(r.status_code, 403)
@@ -10,12 +10,20 @@ urlpatterns = [
 	path("<int:pk>/edit/", views.QuizUpdateView.as_view(), name="quiz_edit"),
 	path("<int:pk>/detail/", views.QuizDetailView.as_view(), name="quiz_detail"),
 	path("<int:quiz_id>/questions/add/", views.add_question, name="add_question"),
+	path("<int:quiz_id>/questions/import/", views.import_questions, name="import_questions"),
+	path("<int:pk>/clone/", views.clone_quiz, name="clone_quiz"),
+	path("<int:pk>/export/", views.export_quiz, name="export_quiz"),
 	path("questions/<int:pk>/edit/", views.edit_question, name="edit_question"),
 	path("<int:pk>/publish-toggle/", views.toggle_publish, name="toggle_publish"),
     path("<int:quiz_id>/reorder/", views.reorder_questions, name="reorder_questions"),
     path('question/<int:pk>/delete/', views.delete_question, name='delete_question'),
     path('<int:pk>/attempts/', views.QuizAttemptsListView.as_view(), name='quiz_attempts'),
+    path('<int:pk>/attempts/export/', views.export_results, name='export_results'),
+    path('<int:pk>/analysis/', views.item_analysis_report, name='item_analysis'),
+    path('bank/', views.question_bank, name='question_bank'),
+    path('bank/add/', views.add_to_quiz, name='add_to_quiz'),
     path('attempt/<int:attempt_id>/detail/', views.attempt_detail, name='attempt_detail'),
 	path('<int:pk>/delete/', views.quiz_delete, name='quiz_delete'),
     path('answer/<int:answer_id>/mark/', views.mark_answer, name='mark_answer'),
+    path('questions/<int:pk>/grade/', views.grade_question, name='grade_question'),
 ]
@@ -4,11 +4,20 @@ from django.views.generic import ListView, CreateView, UpdateView, DetailView, D
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from myapp.models import Quiz, Question, Choice, Attempt, Answer
-from .forms import QuizForm, QuestionForm, make_choice_formset
-from django.http import HttpResponseRedirect, JsonResponse, HttpResponseForbidden, Http404
+from myapp.models import Quiz, Question, Choice, Attempt, Answer, QuizStat, Tag
+from myapp import question_search
+from myapp.item_analysis import refresh_quiz as refresh_quiz_stats
+from myapp.answer_key import get_attempt_key, freeze_snapshot, normalize_text
+from myapp.scoring import apply_mark, apply_bulk_mark
+from .forms import QuizForm, QuestionForm, QuestionImportForm, CloneQuizForm, make_choice_formset
+from . import attempt_list, question_io
+from .cloning import clone_quiz as clone_quiz_copy, copy_questions, iter_export_lines
+from .ordering import apply_order, move_question, save_appended
+from .results_export import iter_results_csv
+from django.http import HttpResponseRedirect, JsonResponse, HttpResponseForbidden, Http404, StreamingHttpResponse
 from django.views.decorators.http import require_POST
-from room.models import RoomQuizAssignment, RoomMembership, Room
+from room.models import Room
+from room.access import room_access
 from django.contrib.auth import get_user_model
 from django.apps import apps
 from django.contrib import messages
@@ -16,25 +25,11 @@ from django.views import View
 from room.models import Room
 from datetime import timedelta
 from django.utils import timezone
+from django.db import IntegrityError
+from django.db.models import Count, Q
 
 User = get_user_model()
 
-RoomQuizAssignment = apps.get_model('room', 'RoomQuizAssignment')
-RoomMembership     = apps.get_model('room', 'RoomMembership')
-
-def user_is_room_owner_or_admin_for_quiz(user, quiz):
-    room_ids = list(RoomQuizAssignment.objects.filter(quiz=quiz).values_list('room_id', flat=True))
-    if not room_ids:
-        return False
-
-    allowed_roles = [
-        getattr(RoomMembership, 'ROLE_OWNER', 'owner'),
-        getattr(RoomMembership, 'ROLE_ADMIN',  'admin'),
-        'owner', 'admin'
-    ]
-
-    return RoomMembership.objects.filter(user=user, room_id__in=room_ids, role__in=allowed_roles).exists()
-
 @method_decorator(login_required, name="dispatch")
 class QuizListView(ListView):
 	model = Quiz
@@ -100,7 +95,7 @@ class QuizUpdateView(UpdateView):
     def get_object(self, queryset=None):
         pk = self.kwargs.get('pk')
         quiz = get_object_or_404(Quiz, pk=pk)
-        if not (quiz.creator == self.request.user or user_is_room_owner_or_admin_for_quiz(self.request.user, quiz)):
+        if not room_access(self.request).manages_quiz(quiz):
             raise Http404("No quiz found matching the query")
         return quiz
 
@@ -125,13 +120,13 @@ class QuizDetailView(DetailView):
     def get_object(self, queryset=None):
         pk = self.kwargs.get('pk')
         quiz = get_object_or_404(Quiz, pk=pk)
-        if not (quiz.creator == self.request.user or user_is_room_owner_or_admin_for_quiz(self.request.user, quiz)):
+        if not room_access(self.request).manages_quiz(quiz):
             raise Http404("No quiz found matching the query")
         return quiz
     
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        quiz = self.get_object()
+        quiz = self.object
 
         raw_room = self.request.GET.get("room")
 
@@ -148,7 +143,7 @@ class QuizDetailView(DetailView):
 
         ctx["room_code"] = room_code
 
-        ctx["is_room_admin"] = user_is_room_owner_or_admin_for_quiz(self.request.user, quiz)
+        ctx["is_room_admin"] = quiz.pk in room_access(self.request).quiz_ids
 
         return ctx
 
@@ -166,7 +161,7 @@ class QuizDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 @login_required
 def add_question(request, quiz_id):
     quiz = get_object_or_404(Quiz, pk=quiz_id)
-    if not (quiz.creator == request.user or user_is_room_owner_or_admin_for_quiz(request.user, quiz)):
+    if not room_access(request).manages_quiz(quiz):
         return HttpResponseForbidden()
 
     ChoiceFormSetClass = make_choice_formset(extra=1, can_delete=True)
@@ -176,8 +171,6 @@ def add_question(request, quiz_id):
         post = request.POST.copy()
         if not post.get("qtype"):
             post["qtype"] = "short"
-        if not post.get("order"):
-            post["order"] = str(quiz.questions.count() + 1)
 
         qform = QuestionForm(post)
         qform_is_valid = qform.is_valid()
@@ -187,9 +180,8 @@ def add_question(request, quiz_id):
         if qform_is_valid:
             question_instance = qform.save(commit=False)
             question_instance.quiz = quiz
-            if not question_instance.order:
-                question_instance.order = quiz.questions.count() + 1
-            question_instance.save()
+            save_appended(question_instance)
+            qform.save_tags(question_instance, quiz.creator or request.user)
 
         if posted_qtype == "mcq":
             if question_instance:
@@ -230,8 +222,7 @@ def add_question(request, quiz_id):
                 "is_new": True,
             })
 
-    initial_order = quiz.questions.count() + 1
-    qform = QuestionForm(initial={"order": initial_order, "qtype": "short"})
+    qform = QuestionForm(initial={"qtype": "short"})
     formset = ChoiceFormSetClass(prefix=prefix)
     return render(request, "create_quiz/question_form.html", {
         "form": qform,
@@ -241,11 +232,88 @@ def add_question(request, quiz_id):
     })
 
 
+@login_required
+def import_questions(request, quiz_id):
+    quiz = get_object_or_404(Quiz, pk=quiz_id)
+    if not room_access(request).manages_quiz(quiz):
+        return HttpResponseForbidden()
+
+    report = None
+    if request.method == "POST":
+        form = QuestionImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data["file"]
+            try:
+                rows = question_io.iter_rows(upload.file, form.cleaned_data["format"], upload.name)
+            except question_io.ImportRowError as exc:
+                form.add_error("format", str(exc))
+            else:
+                try:
+                    report = question_io.import_questions(quiz, rows)
+                except IntegrityError:
+                    form.add_error(None, "มีการเพิ่มคำถามในแบบทดสอบนี้พร้อมกัน บางส่วนอาจยังไม่ถูกนำเข้า กรุณาตรวจสอบแล้วลองใหม่")
+                if report is not None and report.created and not report.failed:
+                    messages.success(request, f"นำเข้าคำถาม {report.created} ข้อแล้ว")
+                    return redirect("create_quiz:quiz_detail", pk=quiz.pk)
+    else:
+        form = QuestionImportForm()
+
+    return render(request, "create_quiz/import_questions.html", {
+        "form": form,
+        "quiz": quiz,
+        "report": report,
+    })
+
+
+@login_required
+def clone_quiz(request, pk):
+    quiz = get_object_or_404(Quiz, pk=pk)
+    if not room_access(request).manages_quiz(quiz):
+        return HttpResponseForbidden()
+
+    if request.method == "POST":
+        form = CloneQuizForm(request.POST, user=request.user)
+        if form.is_valid():
+            room = form.cleaned_data["room"]
+            new_quiz = clone_quiz_copy(quiz, request.user, title=form.cleaned_data["title"], room=room)
+            messages.success(request, "Quiz copied.")
+            detail_url = reverse("create_quiz:quiz_detail", args=[new_quiz.pk])
+            if room:
+                return redirect(f"{detail_url}?room={room.code}")
+            return redirect(detail_url)
+    else:
+        form = CloneQuizForm(initial={"title": f"{quiz.title} (สำเนา)"}, user=request.user)
+
+    return render(request, "create_quiz/clone_quiz.html", {"form": form, "quiz": quiz})
+
+
+@login_required
+def export_quiz(request, pk):
+    quiz = get_object_or_404(Quiz, pk=pk)
+    if not room_access(request).manages_quiz(quiz):
+        return HttpResponseForbidden()
+
+    response = StreamingHttpResponse(iter_export_lines(quiz), content_type="application/x-ndjson; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="quiz-{quiz.pk}.jsonl"'
+    return response
+
+
+@login_required
+def export_results(request, pk):
+    quiz = get_object_or_404(Quiz, pk=pk)
+    if not room_access(request).manages_quiz(quiz):
+        return HttpResponseForbidden()
+
+    response = StreamingHttpResponse(iter_results_csv(quiz), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="quiz-{quiz.pk}-results.csv"'
+    return response
+
+
 @login_required
 def edit_question(request, pk):
     question = get_object_or_404(Question, pk=pk)
     quiz = question.quiz
-    if not (quiz.creator == request.user or user_is_room_owner_or_admin_for_quiz(request.user, quiz)):
+    if not room_access(request).manages_quiz(quiz):
         return HttpResponseForbidden()
 
     ChoiceFormSetClass = make_choice_formset(extra=0, can_delete=True)
@@ -263,6 +331,7 @@ def edit_question(request, pk):
 
         if form.is_valid() and (formset is None or formset.is_valid()):
             form.save()
+            form.save_tags(question, quiz.creator or request.user)
             if formset:
                 formset.save()
             return redirect("create_quiz:quiz_detail", pk=question.quiz.pk)
@@ -297,26 +366,13 @@ def toggle_publish(request, pk):
 
     quiz = get_object_or_404(Quiz, pk=pk)
 
-    if quiz.creator == request.user:
-        allowed = True
-    else:
-        assignments = RoomQuizAssignment.objects.filter(quiz=quiz).select_related('room')
-        allowed = False
-        for assign in assignments:
-            room = assign.room
-            try:
-                membership = RoomMembership.objects.get(user=request.user, room=room)
-                if membership.role in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
-                    allowed = True
-                    break
-            except RoomMembership.DoesNotExist:
-                continue
-
-    if not allowed:
+    if not room_access(request).manages_quiz(quiz):
         return HttpResponseForbidden()
 
     quiz.is_published = not quiz.is_published
     quiz.save()
+    if quiz.is_published:
+        freeze_snapshot(quiz)
 
     next_url = request.POST.get('next') or request.GET.get('next') or request.META.get('HTTP_REFERER')
     if next_url:
@@ -329,7 +385,7 @@ def toggle_publish(request, pk):
 def reorder_questions(request, quiz_id):
     import json
     quiz = get_object_or_404(Quiz, pk=quiz_id)
-    if not (quiz.creator == request.user or user_is_room_owner_or_admin_for_quiz(request.user, quiz)):
+    if not room_access(request).manages_quiz(quiz):
         return JsonResponse({"ok": False, "error": "forbidden"}, status=403)
 
     try:
@@ -340,17 +396,31 @@ def reorder_questions(request, quiz_id):
     except Exception:
         return JsonResponse({"ok": False, "error": "invalid json"}, status=400)
 
-    q_ids = list(quiz.questions.values_list("id", flat=True))
-    if set(new_order) - set(q_ids):
+    q_ids = set(quiz.questions.values_list("id", flat=True))
+
+    # Drag-and-drop of a single question: {"move": id, "after": id or null}.
+    if "move" in payload:
+        move_id, after_id = payload.get("move"), payload.get("after")
+        if move_id not in q_ids or (after_id is not None and after_id not in q_ids):
+            return JsonResponse({"ok": False, "error": "invalid question ids"}, status=400)
+        if after_id == move_id:
+            return JsonResponse({"ok": False, "error": "cannot move a question after itself"}, status=400)
+        try:
+            move_question(Question(pk=move_id, quiz=quiz), after_id=after_id)
+        except Question.DoesNotExist:
+            # Deleted by a concurrent request since q_ids was read.
+            return JsonResponse({"ok": False, "error": "question no longer exists"}, status=409)
+        except IntegrityError:
+            return JsonResponse({"ok": False, "error": "concurrent reorder, try again"}, status=409)
+        return JsonResponse({"ok": True})
+
+    if set(new_order) - q_ids:
         return JsonResponse({"ok": False, "error": "invalid question ids"}, status=400)
 
-    from django.db import transaction
-    with transaction.atomic():
-        for idx, qid in enumerate(new_order, start=1):
-            Question.objects.filter(pk=qid, quiz=quiz).update(order=idx)
-
+    apply_order(quiz, new_order)
     return JsonResponse({"ok": True})
 
+
 def delete_question(request, pk):
     if request.method != "POST":
         return redirect('create_quiz:quiz_list')
@@ -358,7 +428,7 @@ def delete_question(request, pk):
     question = get_object_or_404(Question, pk=pk)
     quiz = question.quiz
 
-    if not (quiz.creator == request.user or user_is_room_owner_or_admin_for_quiz(request.user, quiz)):
+    if not room_access(request).manages_quiz(quiz):
         return HttpResponseForbidden()
 
     question.delete()
@@ -375,17 +445,34 @@ class QuizAttemptsListView(ListView):
 
     def dispatch(self, request, *args, **kwargs):
         self.quiz = get_object_or_404(apps.get_model('myapp', 'Quiz'), pk=kwargs['pk'])
-        if not (self.quiz.creator == request.user or user_is_room_owner_or_admin_for_quiz(request.user, self.quiz)):
+        if not room_access(request).manages_quiz(self.quiz):
             return HttpResponseForbidden()
         return super().dispatch(request, *args, **kwargs)
 
     def get_queryset(self):
         Attempt = apps.get_model('myapp', 'Attempt')
-        return Attempt.objects.filter(quiz=self.quiz).select_related('taker').order_by('-started_at')
+        self.status = self.request.GET.get('status', attempt_list.FILTER_ALL)
+        if self.status not in attempt_list.STATUS_FILTERS:
+            self.status = attempt_list.FILTER_ALL
+        attempts = Attempt.objects.filter(quiz=self.quiz).filter(attempt_list.STATUS_FILTERS[self.status])
+        page, self.next_cursor = attempt_list.page_after(
+            attempts.select_related('taker'), self.request.GET.get('after'),
+        )
+        return page
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx['quiz'] = self.quiz
+        ctx['status'] = self.status
+        ctx['next_cursor'] = self.next_cursor
+        ctx['is_first_page'] = not self.request.GET.get('after')
+        ctx['summary'] = attempt_list.quiz_summary(self.quiz)
+        ctx['status_filters'] = [
+            (attempt_list.FILTER_ALL, 'ทั้งหมด'),
+            (attempt_list.FILTER_FINISHED, 'ส่งแล้ว'),
+            (attempt_list.FILTER_PENDING, 'รอตรวจ'),
+            (attempt_list.FILTER_IN_PROGRESS, 'กำลังทำ'),
+        ]
         return ctx
     
 
@@ -394,28 +481,33 @@ def attempt_detail(request, attempt_id):
     Attempt = apps.get_model('myapp', 'Attempt')
     Answer = apps.get_model('myapp', 'Answer')
     Choice = apps.get_model('myapp', 'Choice')
-    attempt = get_object_or_404(Attempt, pk=attempt_id)
+    attempt = get_object_or_404(Attempt.objects.select_related('quiz', 'taker'), pk=attempt_id)
     quiz = attempt.quiz
 
-    is_room_admin = user_is_room_owner_or_admin_for_quiz(request.user, quiz)
+    is_room_admin = quiz.pk in room_access(request).quiz_ids
     if not (quiz.creator == request.user or is_room_admin):
         return HttpResponseForbidden()
 
-    answers = attempt.answers.select_related('question', 'selected_choice').all().order_by('question__order', 'question__id')
+    key = get_attempt_key(attempt)
+    answers = sorted(
+        (a for a in attempt.answers.all() if a.question_id in key.by_id),
+        key=lambda a: (key.by_id[a.question_id].order, a.question_id),
+    )
 
     answer_rows = []
     for a in answers:
-        q = a.question
-        if getattr(q, "qtype", None) == "mcq":
-            is_correct_flag = bool(a.selected_choice and getattr(a.selected_choice, "is_correct", False))
-            correct_choice = q.choices.filter(is_correct=True).first()
+        q = key.by_id[a.question_id]
+        selected_choice = key.choices.get(a.selected_choice_id)
+        if q.qtype == "mcq":
+            is_correct_flag = bool(selected_choice and selected_choice.is_correct)
+            correct_choice = q.correct_choice
         else:
             is_correct_flag = a.is_correct
             correct_choice = None
 
         row = {
             'question': q,
-            'selected_choice': a.selected_choice,
+            'selected_choice': selected_choice,
             'text': a.text,
             'is_correct': is_correct_flag,
             'correct_choice': correct_choice,
@@ -440,7 +532,7 @@ def _set_last_room_for_quiz_in_session(request, quiz_pk, room_code):
 def quiz_delete(request, pk):
     quiz = get_object_or_404(Quiz, pk=pk)
 
-    if not (quiz.creator == request.user or user_is_room_owner_or_admin_for_quiz(request.user, quiz)):
+    if not room_access(request).manages_quiz(quiz):
         return HttpResponseForbidden()
 
     posted_room = (request.POST.get('room') or "").strip()
@@ -467,46 +559,163 @@ def quiz_delete(request, pk):
 
 @require_POST
 def mark_answer(request, answer_id):
-    ans = get_object_or_404(Answer, pk=answer_id)
+    ans = get_object_or_404(Answer.objects.select_related('attempt__quiz', 'question'), pk=answer_id)
     attempt = ans.attempt
     quiz = attempt.quiz
 
-    if not (quiz.creator == request.user or user_is_room_owner_or_admin_for_quiz(request.user, quiz)):
+    if not room_access(request).manages_quiz(quiz):
         return HttpResponseForbidden()
 
-    mark = request.POST.get("mark")
-    if mark == "correct":
-        ans.is_correct = True
-    else:
-        ans.is_correct = False
-    ans.save()
+    if not apply_mark(ans, request.POST.get("mark") == "correct"):
+        raise Http404("Answer no longer exists.")
 
-    next_url = request.POST.get('next') or request.GET.get('next') or request.META.get('HTTP_REFERER') or '/'
-    
-    questions = quiz.questions.all()
-    gradable_qs = questions.filter(qtype__in=["mcq", "short"])
-    total_gradable = gradable_qs.count()
+    messages.success(request, "Answer marked.")
+    next_url = request.POST.get("next") or request.META.get("HTTP_REFERER") or "/"
+    return HttpResponseRedirect(next_url)
 
-    correct_count = 0
-    for q in gradable_qs:
-        if q.qtype == "mcq":
-            a = attempt.answers.filter(question=q).first()
-            if a and a.selected_choice and getattr(a.selected_choice, "is_correct", False):
-                correct_count += 1
+
+def _answer_clusters(question):
+    # Group by exact text in the database, then merge spellings that only
+    # differ in case/spacing/width into one cluster.
+    rows = (
+        Answer.objects.filter(question=question)
+        .order_by()
+        .values("text")
+        .annotate(
+            n=Count("id"),
+            n_correct=Count("id", filter=Q(is_correct=True)),
+            n_wrong=Count("id", filter=Q(is_correct=False)),
+        )
+    )
+    clusters = {}
+    for row in rows:
+        key = normalize_text(row["text"])
+        cluster = clusters.get(key)
+        if cluster is None:
+            cluster = clusters[key] = {
+                "key": key, "text": row["text"], "texts": [], "top": 0,
+                "size": 0, "correct": 0, "wrong": 0,
+            }
+        cluster["texts"].append(row["text"])
+        if row["n"] > cluster["top"]:
+            cluster["text"], cluster["top"] = row["text"], row["n"]
+        cluster["size"] += row["n"]
+        cluster["correct"] += row["n_correct"]
+        cluster["wrong"] += row["n_wrong"]
+
+    result = sorted(clusters.values(), key=lambda c: (-c["size"], c["key"]))
+    for c in result:
+        c["pending"] = c["size"] - c["correct"] - c["wrong"]
+    return result
+
+
+@login_required
+def grade_question(request, pk):
+    question = get_object_or_404(Question.objects.select_related('quiz'), pk=pk, qtype="short")
+    quiz = question.quiz
+    if not room_access(request).manages_quiz(quiz):
+        return HttpResponseForbidden()
+
+    if request.method == "POST":
+        cluster_key = request.POST.get("cluster", "")
+        is_correct = request.POST.get("mark") == "correct"
+        texts = [
+            t for t in Answer.objects.filter(question=question).order_by().values_list("text", flat=True).distinct()
+            if normalize_text(t) == cluster_key
+        ]
+        if texts:
+            n_answers, n_attempts = apply_bulk_mark(Answer.objects.filter(question=question, text__in=texts), is_correct)
+            messages.success(request, f"ตรวจแล้ว {n_answers} คำตอบ จาก {n_attempts} การเข้าทำ")
         else:
-            a = attempt.answers.filter(question=q).first()
-            if a and a.is_correct is True:
-                correct_count += 1
+            messages.warning(request, "ไม่พบคำตอบในกลุ่มนี้")
+        return redirect('create_quiz:grade_question', pk=question.pk)
 
-    if total_gradable > 0:
-        attempt.score = (correct_count / total_gradable) * 100.0
-        attempt.graded = True
-    else:
-        attempt.score = None
-        attempt.graded = False
+    clusters = _answer_clusters(question)
+    return render(request, 'create_quiz/grade_question.html', {
+        'quiz': quiz,
+        'question': question,
+        'clusters': clusters,
+        'pending_total': sum(c['pending'] for c in clusters),
+    })
 
-    attempt.save()
 
-    messages.success(request, "Answer marked.")
-    next_url = request.POST.get("next") or request.META.get("HTTP_REFERER") or "/"
-    return HttpResponseRedirect(next_url)
+# Rules of thumb for flagging items worth a second look.
+EASY_P, HARD_P, LOW_DISCRIMINATION = 0.95, 0.2, 0.2
+
+
+@login_required
+def item_analysis_report(request, pk):
+    quiz = get_object_or_404(Quiz, pk=pk)
+    if not room_access(request).manages_quiz(quiz):
+        return HttpResponseForbidden()
+
+    if request.method == "POST":
+        refresh_quiz_stats(quiz.pk)
+        messages.success(request, "คำนวณสถิติใหม่แล้ว")
+        return redirect('create_quiz:item_analysis', pk=quiz.pk)
+
+    quiz_stat = QuizStat.objects.filter(quiz=quiz).first()
+    rows = []
+    questions = (
+        quiz.questions.select_related('item_stat')
+        .prefetch_related('choices')
+        .order_by('order', 'id')
+    )
+    for q in questions:
+        stat = getattr(q, 'item_stat', None)
+        flags = []
+        choices = []
+        if stat is not None and stat.answered:
+            if stat.p_value is not None and stat.p_value >= EASY_P:
+                flags.append("ง่ายเกินไป")
+            if stat.p_value is not None and stat.p_value <= HARD_P:
+                flags.append("ยากเกินไป")
+            if stat.point_biserial is not None and stat.point_biserial < LOW_DISCRIMINATION:
+                flags.append("จำแนกได้ต่ำ")
+            for c in q.choices.all():
+                picked = stat.choice_counts.get(str(c.pk), 0)
+                choices.append((c, picked, picked * 100.0 / stat.answered))
+        rows.append({'question': q, 'stat': stat, 'flags': flags, 'choices': choices})
+
+    return render(request, 'create_quiz/item_analysis.html', {
+        'quiz': quiz,
+        'quiz_stat': quiz_stat,
+        'rows': rows,
+    })
+
+
+@login_required
+def question_bank(request):
+    query = request.GET.get('q', '').strip()
+    tags = Tag.objects.filter(owner=request.user)
+    tag = None
+    if request.GET.get('tag', '').isdigit():
+        tag = tags.filter(pk=request.GET['tag']).first()
+
+    return render(request, 'create_quiz/question_bank.html', {
+        'query': query,
+        'tags': tags,
+        'tag': tag,
+        'questions': question_search.search(request.user, query, tag=tag),
+        'target_quizzes': Quiz.objects.filter(creator=request.user).order_by('-created_at'),
+    })
+
+
+@login_required
+@require_POST
+def add_to_quiz(request):
+    quiz = get_object_or_404(Quiz, pk=request.POST.get('quiz') or 0)
+    if not room_access(request).manages_quiz(quiz):
+        return HttpResponseForbidden()
+
+    question_ids = [int(pk) for pk in request.POST.getlist('questions') if pk.isdigit()]
+    # Only the teacher's own bank can be copied from.
+    allowed = set(
+        Question.objects.filter(pk__in=question_ids, quiz__creator=request.user).values_list('id', flat=True)
+    )
+    created = copy_questions([pk for pk in question_ids if pk in allowed], quiz)
+    if created:
+        messages.success(request, f"เพิ่มคำถาม {len(created)} ข้อลงใน {quiz.title} แล้ว")
+    else:
+        messages.error(request, "กรุณาเลือกคำถามอย่างน้อยหนึ่งข้อ")
+    return redirect(request.POST.get('next') or reverse('create_quiz:question_bank'))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Quiz, Question, Choice, Attempt, Answer, Profile
+from .models import Quiz, Question, Choice, Attempt, Answer, Profile, Tag
 
 admin.site.register(Profile)
 admin.site.register(Quiz)
@@ -7,3 +7,4 @@ admin.site.register(Question)
 admin.site.register(Choice)
 admin.site.register(Attempt)
 admin.site.register(Answer)
+admin.site.register(Tag)
@@ -0,0 +1,242 @@
+"""
+Compiled, cached answer keys for quizzes.
+
+Grading and result pages only need to know, per question, its order, type,
+the correct choice, the set of valid choices and the expected short answer.
+That is compiled once per quiz content version and kept both in a small
+in-process LRU and in Django's cache so all workers share it.
+"""
+import hashlib
+import json
+import unicodedata
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from .models import Quiz, QuizSnapshot, Question, Choice, new_content_version
+from .short_grading import MATCH_MANUAL, compile_matcher
+
+CACHE_TIMEOUT = 60 * 60 * 24
+LOCAL_CACHE_SIZE = 256
+
+_local_keys = OrderedDict()
+
+
+def normalize_text(value):
+    value = unicodedata.normalize("NFKC", value or "")
+    return " ".join(value.split()).casefold()
+
+
+class ChoiceKey:
+    __slots__ = ("id", "question_id", "text", "is_correct")
+
+    def __init__(self, id, question_id, text, is_correct):
+        self.id = id
+        self.question_id = question_id
+        self.text = text
+        self.is_correct = is_correct
+
+    def __str__(self):
+        return self.text
+
+
+class QuestionKey:
+    __slots__ = ("id", "order", "text", "qtype", "choices", "choice_ids",
+                 "correct_choice_id", "correct_text", "normalized_correct_text",
+                 "match_mode", "match_tolerance")
+
+    def __init__(self, id, order, text, qtype, correct_text, match_mode=MATCH_MANUAL, match_tolerance=None):
+        self.id = id
+        self.order = order
+        self.text = text
+        self.qtype = qtype
+        self.choices = []
+        self.choice_ids = frozenset()
+        self.correct_choice_id = None
+        self.correct_text = correct_text or ""
+        self.normalized_correct_text = normalize_text(correct_text)
+        self.match_mode = match_mode
+        self.match_tolerance = match_tolerance
+
+    @property
+    def matcher(self):
+        """Compiled short-answer matcher, or None when answers are marked by hand."""
+        if self.qtype != "short":
+            return None
+        return compile_matcher(self.match_mode, self.correct_text, self.match_tolerance)
+
+    @property
+    def correct_choice(self):
+        for c in self.choices:
+            if c.id == self.correct_choice_id:
+                return c
+        return None
+
+
+class AnswerKey:
+    def __init__(self, quiz_id, version, questions, snapshot_id=None):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.snapshot_id = snapshot_id
+        self.questions = questions
+        self.by_id = {q.id: q for q in questions}
+        self.choices = {c.id: c for q in questions for c in q.choices}
+
+    @property
+    def cache_key(self):
+        if self.snapshot_id:
+            return snapshot_cache_key(self.snapshot_id)
+        return f"answer_key:{self.quiz_id}:{self.version}"
+
+    @property
+    def mcq_count(self):
+        return sum(1 for q in self.questions if q.qtype == "mcq")
+
+    def choice_for(self, question_id, choice_id):
+        """Return the ChoiceKey if ``choice_id`` is a valid choice of the question."""
+        try:
+            choice_id = int(choice_id)
+        except (TypeError, ValueError):
+            return None
+        choice = self.choices.get(choice_id)
+        if choice is None or choice.question_id != question_id:
+            return None
+        return choice
+
+
+def build_answer_key(quiz_id, version):
+    questions = [
+        QuestionKey(*row)
+        for row in Question.objects.filter(quiz_id=quiz_id)
+        .order_by("order", "id")
+        .values_list("id", "order", "text", "qtype", "correct_text", "match_mode", "match_tolerance")
+    ]
+    by_id = {q.id: q for q in questions}
+    choice_rows = (
+        Choice.objects.filter(question__quiz_id=quiz_id)
+        .order_by("id")
+        .values_list("id", "question_id", "text", "is_correct")
+    )
+    for row in choice_rows:
+        choice = ChoiceKey(*row)
+        q = by_id[choice.question_id]
+        q.choices.append(choice)
+        if choice.is_correct and q.correct_choice_id is None:
+            q.correct_choice_id = choice.id
+    for q in questions:
+        q.choice_ids = frozenset(c.id for c in q.choices)
+    return AnswerKey(quiz_id, version, questions)
+
+
+def key_to_payload(key):
+    return {
+        "questions": [
+            {
+                "id": q.id,
+                "order": q.order,
+                "text": q.text,
+                "qtype": q.qtype,
+                "correct_text": q.correct_text,
+                "match_mode": q.match_mode,
+                "match_tolerance": q.match_tolerance,
+                "choices": [[c.id, c.text, c.is_correct] for c in q.choices],
+            }
+            for q in key.questions
+        ],
+    }
+
+
+def key_from_payload(quiz_id, version, payload, snapshot_id=None):
+    questions = []
+    for item in payload["questions"]:
+        q = QuestionKey(
+            item["id"], item["order"], item["text"], item["qtype"], item["correct_text"],
+            item.get("match_mode", MATCH_MANUAL), item.get("match_tolerance"),
+        )
+        for choice_id, text, is_correct in item["choices"]:
+            q.choices.append(ChoiceKey(choice_id, q.id, text, is_correct))
+            if is_correct and q.correct_choice_id is None:
+                q.correct_choice_id = choice_id
+        q.choice_ids = frozenset(c.id for c in q.choices)
+        questions.append(q)
+    return AnswerKey(quiz_id, version, questions, snapshot_id=snapshot_id)
+
+
+def snapshot_cache_key(snapshot_id):
+    return f"answer_key:snapshot:{snapshot_id}"
+
+
+def _remember(key):
+    _local_keys[key.cache_key] = key
+    _local_keys.move_to_end(key.cache_key)
+    while len(_local_keys) > LOCAL_CACHE_SIZE:
+        _local_keys.popitem(last=False)
+
+
+def _cached_key(cache_key, build):
+    key = _local_keys.get(cache_key)
+    if key is not None:
+        _local_keys.move_to_end(cache_key)
+        return key
+
+    key = cache.get(cache_key)
+    if key is None:
+        key = build()
+        cache.set(cache_key, key, CACHE_TIMEOUT)
+    _remember(key)
+    return key
+
+
+def get_answer_key(quiz):
+    """Return the live AnswerKey for ``quiz`` without touching the database when cached."""
+    return _cached_key(
+        f"answer_key:{quiz.pk}:{quiz.content_version}",
+        lambda: build_answer_key(quiz.pk, quiz.content_version),
+    )
+
+
+def get_snapshot_key(snapshot_id):
+    """Snapshots never change, so their keys are cached without a version."""
+    def build():
+        snapshot = QuizSnapshot.objects.only("quiz_id", "content_version", "payload").get(pk=snapshot_id)
+        return key_from_payload(snapshot.quiz_id, snapshot.content_version, snapshot.payload, snapshot_id=snapshot_id)
+    return _cached_key(snapshot_cache_key(snapshot_id), build)
+
+
+def get_attempt_key(attempt):
+    """The key an attempt is graded and shown against: its snapshot, or the live quiz for older attempts."""
+    if attempt.snapshot_id:
+        return get_snapshot_key(attempt.snapshot_id)
+    return get_answer_key(attempt.quiz)
+
+
+def freeze_snapshot(quiz):
+    """
+    Store the current content of ``quiz`` as a snapshot and make it the one new
+    attempts use. Unchanged content reuses the existing snapshot row.
+    """
+    payload = key_to_payload(get_answer_key(quiz))
+    digest = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    snapshot, created = QuizSnapshot.objects.get_or_create(
+        quiz=quiz,
+        digest=digest,
+        defaults={"payload": payload, "content_version": quiz.content_version},
+    )
+    if not created and snapshot.content_version != quiz.content_version:
+        snapshot.content_version = quiz.content_version
+        QuizSnapshot.objects.filter(pk=snapshot.pk).update(content_version=quiz.content_version)
+    if quiz.published_snapshot_id != snapshot.pk:
+        quiz.published_snapshot = snapshot
+        Quiz.objects.filter(pk=quiz.pk).update(published_snapshot=snapshot)
+    return snapshot
+
+
+def bump_content_version(quiz_ids):
+    """Invalidate cached keys for the given quizzes. Use after bulk writes, which skip signals."""
+    if isinstance(quiz_ids, int):
+        quiz_ids = [quiz_ids]
+    quiz_ids = [pk for pk in quiz_ids if pk]
+    if quiz_ids:
+        Quiz.objects.filter(pk__in=quiz_ids).update(content_version=new_content_version())
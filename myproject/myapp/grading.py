@@ -0,0 +1,248 @@
+"""
+Set-based grading of submitted attempts.
+
+Grading happens in memory against the cached answer key; the database only
+sees one delete, one bulk insert and one bulk update per batch of attempts,
+however many questions or attempts are involved. Used by submit_quiz, the
+process_submissions worker and the sweep_expired_attempts sweeper.
+"""
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .answer_key import get_attempt_key
+from .models import Attempt, Answer, AttemptDraft, Choice, Question, SubmissionIntake
+from .item_analysis import mark_stale
+from .result_versions import bump_quiz_results
+from .scoring import GRADABLE_QTYPES
+
+ATTEMPT_RESULT_FIELDS = ["finished_at", "score", "correct_count", "gradable_count", "pending_short_count"]
+
+
+def grade_responses(attempt, key, responses):
+    """
+    Build unsaved Answer rows for ``responses`` (form field name -> raw value)
+    and set the attempt's counters. Returns ``(answers, score)``.
+    """
+    answers = []
+    correct_count = 0
+    mcq_correct_count = 0
+    pending_short_count = 0
+    for q in key.questions:
+        raw = responses.get(f"question_{q.id}")
+        if q.qtype == "mcq":
+            selected_choice = key.choice_for(q.id, raw) if raw else None
+            is_correct = bool(selected_choice and selected_choice.is_correct)
+            if is_correct:
+                correct_count += 1
+                mcq_correct_count += 1
+            answers.append(Answer(
+                attempt=attempt,
+                question_id=q.id,
+                selected_choice_id=selected_choice.id if selected_choice else None,
+                text="",
+                is_correct=is_correct,
+            ))
+        else:
+            text = (raw or "").strip()
+            is_correct = None
+            if q.qtype == "short":
+                matcher = q.matcher
+                if matcher is not None:
+                    is_correct = matcher(text)
+                if is_correct is True:
+                    correct_count += 1
+                elif is_correct is None:
+                    pending_short_count += 1
+            answers.append(Answer(
+                attempt=attempt,
+                question_id=q.id,
+                selected_choice=None,
+                text=text,
+                is_correct=is_correct,
+            ))
+
+    attempt.correct_count = correct_count
+    attempt.gradable_count = sum(1 for q in key.questions if q.qtype in GRADABLE_QTYPES)
+    attempt.pending_short_count = pending_short_count
+
+    # Fully graded: score over every gradable question, like a teacher's mark.
+    # Otherwise a provisional MCQ-only score until the short answers are marked.
+    mcq_count = key.mcq_count
+    if pending_short_count == 0 and attempt.gradable_count > 0:
+        score = (correct_count / attempt.gradable_count) * 100.0
+    elif mcq_count > 0:
+        score = (mcq_correct_count / mcq_count) * 100.0
+    else:
+        score = None
+    return answers, score
+
+
+def deadline_for(quiz, started_at):
+    if not quiz.time_limit_minutes:
+        return None
+    return started_at + timedelta(minutes=quiz.time_limit_minutes)
+
+
+def is_late(attempt, submitted_at):
+    return attempt.deadline is not None and submitted_at > attempt.deadline
+
+
+def finalize_attempts(submissions):
+    """
+    Grade and close a batch of attempts.
+
+    ``submissions`` is a list of dicts with ``attempt`` (quiz loaded),
+    ``responses``, ``submitted_at`` and ``auto_submitted``. A late manual
+    submission is closed without a score, as before. Returns the list of
+    attempts that were late.
+    """
+    all_answers = []
+    attempts = []
+    late_attempts = []
+    from_snapshot = False
+    for sub in submissions:
+        attempt = sub["attempt"]
+        key = get_attempt_key(attempt)
+        from_snapshot = from_snapshot or bool(key.snapshot_id)
+        answers, score = grade_responses(attempt, key, sub["responses"])
+        if is_late(attempt, sub["submitted_at"]):
+            late_attempts.append(attempt)
+            if not sub["auto_submitted"]:
+                score = None
+        attempt.finished_at = sub["submitted_at"]
+        attempt.score = score
+        attempts.append(attempt)
+        all_answers.extend(answers)
+
+    if not attempts:
+        return late_attempts
+
+    if from_snapshot:
+        all_answers = _drop_deleted_references(all_answers)
+
+    attempt_ids = [a.pk for a in attempts]
+    with transaction.atomic():
+        Answer.objects.filter(attempt_id__in=attempt_ids).delete()
+        Answer.objects.bulk_create(all_answers)
+        Attempt.objects.bulk_update(attempts, ATTEMPT_RESULT_FIELDS)
+        AttemptDraft.objects.filter(attempt_id__in=attempt_ids).delete()
+    quiz_ids = {a.quiz_id for a in attempts}
+    bump_quiz_results(quiz_ids)
+    mark_stale(quiz_ids)
+    return late_attempts
+
+
+def _drop_deleted_references(answers):
+    # A snapshot can outlive the live rows it was taken from; answers still
+    # need a real question, and a deleted choice reads as no selection.
+    question_ids = set(Question.objects.filter(pk__in={a.question_id for a in answers}).values_list("pk", flat=True))
+    choice_ids = set(Choice.objects.filter(
+        pk__in={a.selected_choice_id for a in answers if a.selected_choice_id}
+    ).values_list("pk", flat=True))
+    kept = []
+    for a in answers:
+        if a.question_id not in question_ids:
+            continue
+        if a.selected_choice_id and a.selected_choice_id not in choice_ids:
+            a.selected_choice_id = None
+        kept.append(a)
+    return kept
+
+
+def drain_submission_intake(batch_size=200):
+    """
+    Finalize up to ``batch_size`` queued submissions. Returns how many intake
+    rows were consumed. Rows are claimed under a per-call token first, so
+    several workers can drain the queue without grading a row twice.
+    """
+    claim_token = uuid.uuid4().hex
+    while True:
+        ids = list(
+            SubmissionIntake.objects.filter(processed_at__isnull=True, claim_token__isnull=True)
+            .order_by("id")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        # Another worker may take some or all of these between the two queries.
+        if SubmissionIntake.objects.filter(
+            pk__in=ids, processed_at__isnull=True, claim_token__isnull=True,
+        ).update(claim_token=claim_token):
+            break
+    rows = list(
+        SubmissionIntake.objects.filter(claim_token=claim_token)
+        .select_related("attempt__quiz")
+        .order_by("id")
+    )
+
+    submissions = []
+    seen = set()
+    for row in rows:
+        attempt = row.attempt
+        if attempt.finished_at or attempt.pk in seen:
+            continue
+        seen.add(attempt.pk)
+        submissions.append({
+            "attempt": attempt,
+            # Already merged with the draft at submit time.
+            "responses": row.payload,
+            "submitted_at": row.received_at,
+            "auto_submitted": row.auto_submitted,
+        })
+
+    try:
+        with transaction.atomic():
+            finalize_attempts(submissions)
+            SubmissionIntake.objects.filter(pk__in=[row.pk for row in rows]).update(processed_at=timezone.now())
+    except Exception:
+        # Hand the rows back for the next run.
+        SubmissionIntake.objects.filter(claim_token=claim_token, processed_at__isnull=True).update(claim_token=None)
+        raise
+    return len(rows)
+
+
+def finalize_expired_attempts(now=None, batch_size=500):
+    """
+    Close every open attempt whose deadline has passed, grading its
+    autosaved answers as an auto-submission at the deadline. Works in
+    batches of ``batch_size``; returns how many attempts were closed.
+    """
+    now = now or timezone.now()
+    # Each run claims its batches under its own key, so a concurrent sweeper
+    # or a late submit_quiz never grades the same attempt twice.
+    claim_key = f"expired:{uuid.uuid4().hex[:16]}"
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Attempt.objects.filter(finished_at__isnull=True, submit_key__isnull=True, deadline__lt=now)
+                .order_by("deadline")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+            Attempt.objects.filter(
+                pk__in=ids, finished_at__isnull=True, submit_key__isnull=True,
+            ).update(submit_key=claim_key)
+
+            attempts = list(
+                Attempt.objects.filter(pk__in=ids, submit_key=claim_key, finished_at__isnull=True)
+                .select_related("quiz")
+            )
+            drafts = dict(
+                AttemptDraft.objects.filter(attempt_id__in=[a.pk for a in attempts])
+                .values_list("attempt_id", "answers")
+            )
+            finalize_attempts([
+                {
+                    "attempt": attempt,
+                    "responses": drafts.get(attempt.pk) or {},
+                    "submitted_at": attempt.deadline,
+                    "auto_submitted": True,
+                }
+                for attempt in attempts
+            ])
+            total += len(attempts)
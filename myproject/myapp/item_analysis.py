@@ -0,0 +1,169 @@
+"""
+Item analysis: difficulty, discrimination and distractor counts per question.
+
+Statistics cover finished, fully graded attempts and are computed in one
+streaming pass over their Answer rows, grouped by attempt. Each attempt only
+adds to running sums (per quiz: N, sum T, sum T^2; per item: n, sum x,
+sum T, sum T^2, sum xT, where x is the 0/1 item score and T the attempt's
+number of items correct), from which p-values, point-biserial correlations
+and KR-20 follow. Memory therefore does not grow with the number of
+attempts.
+
+Results are stored in QuizStat / QuestionStat. Grading marks a quiz's stats
+dirty (``mark_stale``) and ``refresh_stale`` recomputes only those quizzes,
+so report pages just read the stored rows.
+"""
+import math
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Answer, Question, Quiz, QuizStat, QuestionStat, GRADABLE_QTYPES
+
+CHUNK_SIZE = 5000
+
+
+def mark_stale(quiz_ids):
+    """Flag the stored stats of these quizzes for recomputation. Call after grading changes."""
+    if isinstance(quiz_ids, int):
+        quiz_ids = [quiz_ids]
+    quiz_ids = [pk for pk in quiz_ids if pk]
+    if quiz_ids:
+        QuizStat.objects.filter(quiz_id__in=quiz_ids, dirty=False).update(dirty=True)
+
+
+class _ItemSums:
+    __slots__ = ("n", "x", "t", "tt", "xt", "choices")
+
+    def __init__(self):
+        self.n = self.x = self.t = self.tt = self.xt = 0
+        self.choices = Counter()
+
+
+def _point_biserial(item):
+    """Correlation of the item score with the total score, over the attempts that had the item."""
+    if not item.n or not item.x or item.x == item.n:
+        return None
+    mean = item.t / item.n
+    variance = item.tt / item.n - mean * mean
+    if variance <= 1e-12:
+        return None
+    p = item.x / item.n
+    mean_correct = item.xt / item.x
+    return (mean_correct - mean) / math.sqrt(variance) * math.sqrt(p / (1 - p))
+
+
+def _kr20(p_values, variance):
+    k = len(p_values)
+    if k < 2 or not variance or variance <= 1e-12:
+        return None
+    return k / (k - 1) * (1 - sum(p * (1 - p) for p in p_values) / variance)
+
+
+def _attempt_groups(rows):
+    group = []
+    for row in rows:
+        if group and row[0] != group[0][0]:
+            yield group
+            group = []
+        group.append(row)
+    if group:
+        yield group
+
+
+def compute(quiz_id, chunk_size=CHUNK_SIZE):
+    """Return ``(quiz_fields, {question_id: question_fields})`` for ``quiz_id``."""
+    item_ids = list(
+        Question.objects.filter(quiz_id=quiz_id, qtype__in=GRADABLE_QTYPES)
+        .order_by("order", "id")
+        .values_list("id", flat=True)
+    )
+    items = {question_id: _ItemSums() for question_id in item_ids}
+    rows = (
+        Answer.objects.filter(
+            attempt__quiz_id=quiz_id,
+            attempt__finished_at__isnull=False,
+            attempt__pending_short_count=0,
+            question_id__in=item_ids,
+        )
+        .order_by("attempt_id")
+        .values_list("attempt_id", "question_id", "is_correct", "selected_choice_id", "selected_choice__is_correct")
+        .iterator(chunk_size=chunk_size)
+    )
+
+    n = t_sum = tt_sum = 0
+    for group in _attempt_groups(rows):
+        scores = {}
+        for _, question_id, is_correct, choice_id, choice_correct in group:
+            # Older MCQ rows have no stored verdict; fall back to the choice, as rebuild_counters does.
+            scores[question_id] = int(bool(is_correct if is_correct is not None else choice_correct))
+            if choice_id is not None:
+                items[question_id].choices[str(choice_id)] += 1
+        total = sum(scores.values())
+        n += 1
+        t_sum += total
+        tt_sum += total * total
+        for question_id, x in scores.items():
+            item = items[question_id]
+            item.n += 1
+            item.x += x
+            item.t += total
+            item.tt += total * total
+            item.xt += x * total
+
+    mean = t_sum / n if n else None
+    variance = tt_sum / n - mean * mean if n else None
+    questions = {}
+    p_values = []
+    for question_id, item in items.items():
+        p = item.x / item.n if item.n else None
+        if p is not None:
+            p_values.append(p)
+        questions[question_id] = {
+            "answered": item.n,
+            "correct": item.x,
+            "p_value": p,
+            "point_biserial": _point_biserial(item),
+            "choice_counts": dict(item.choices),
+        }
+    quiz_fields = {
+        "attempts": n,
+        "items": len(items),
+        "mean_total": mean,
+        "variance_total": variance,
+        "kr20": _kr20(p_values, variance),
+    }
+    return quiz_fields, questions
+
+
+def refresh_quiz(quiz_id):
+    """Recompute and store the stats of one quiz."""
+    # Clear the flag before reading, so attempts finishing meanwhile leave it set for the next run.
+    QuizStat.objects.update_or_create(quiz_id=quiz_id, defaults={"dirty": False})
+    quiz_fields, questions = compute(quiz_id)
+    with transaction.atomic():
+        QuizStat.objects.filter(quiz_id=quiz_id).update(computed_at=timezone.now(), **quiz_fields)
+        QuestionStat.objects.filter(quiz_id=quiz_id).delete()
+        QuestionStat.objects.bulk_create([
+            QuestionStat(quiz_id=quiz_id, question_id=question_id, **fields)
+            for question_id, fields in questions.items()
+        ])
+
+
+def stale_quiz_ids():
+    dirty = QuizStat.objects.filter(dirty=True).values_list("quiz_id", flat=True)
+    never = (
+        Quiz.objects.filter(item_stat__isnull=True, attempts__finished_at__isnull=False)
+        .values_list("id", flat=True)
+        .distinct()
+    )
+    return sorted(set(dirty) | set(never))
+
+
+def refresh_stale(limit=None):
+    """Refresh every quiz whose stats are dirty or missing. Returns how many were refreshed."""
+    quiz_ids = stale_quiz_ids()[:limit]
+    for quiz_id in quiz_ids:
+        refresh_quiz(quiz_id)
+    return len(quiz_ids)
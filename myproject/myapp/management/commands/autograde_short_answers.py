@@ -0,0 +1,92 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from myapp.models import Answer, Attempt, Question
+from myapp.item_analysis import mark_stale
+from myapp.result_versions import bump_quiz_results
+from myapp.scoring import rebuild_counters, recompute_scores
+from myapp.short_grading import MATCH_MANUAL, grade_texts
+
+
+class Command(BaseCommand):
+    help = "Grade stored short answers with each question's match mode (e.g. after changing the answer key)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", type=int, action="append", dest="quiz_ids", help="Only questions of this quiz (repeatable).")
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes; 1 grades inline.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--overwrite", action="store_true", help="Also re-grade answers that were already marked.")
+
+    def handle(self, *args, **options):
+        questions = Question.objects.filter(qtype="short").exclude(match_mode=MATCH_MANUAL)
+        if options["quiz_ids"]:
+            questions = questions.filter(quiz_id__in=options["quiz_ids"])
+        specs = {
+            qid: (mode, correct_text, tolerance)
+            for qid, mode, correct_text, tolerance in questions.values_list(
+                "id", "match_mode", "correct_text", "match_tolerance"
+            )
+        }
+        if not specs:
+            self.stdout.write("No auto-graded short-answer questions.")
+            return
+
+        answers = Answer.objects.filter(question_id__in=list(specs)).order_by("pk")
+        if not options["overwrite"]:
+            answers = answers.filter(is_correct__isnull=True)
+        rows = answers.values_list("id", "question_id", "text", "is_correct")
+
+        changed = 0
+        quiz_ids = set()
+        for changes in self._grade(specs, self._chunks(rows, options["chunk_size"]), options["workers"]):
+            if not changes:
+                continue
+            verdicts = dict(changes)
+            batch = list(Answer.objects.filter(pk__in=list(verdicts)).only("id", "attempt_id", "is_correct"))
+            for answer in batch:
+                answer.is_correct = verdicts[answer.pk]
+            Answer.objects.bulk_update(batch, ["is_correct"])
+            changed += len(batch)
+            # Settle each chunk's attempts as we go: a single IN over every
+            # attempt of the run would exceed SQLite's variable limit.
+            affected = Attempt.objects.filter(pk__in={answer.attempt_id for answer in batch})
+            rebuild_counters(affected)
+            recompute_scores(affected.filter(finished_at__isnull=False))
+            quiz_ids.update(affected.values_list("quiz_id", flat=True).distinct())
+
+        if quiz_ids:
+            bump_quiz_results(quiz_ids)
+            mark_stale(quiz_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {changed} answers across {len(quiz_ids)} quizzes."
+        ))
+
+    def _chunks(self, rows, size):
+        # Keyset pages rather than one open cursor: rows are updated while
+        # later pages are still being read.
+        last_pk = 0
+        while True:
+            chunk = list(rows.filter(pk__gt=last_pk)[:size])
+            if not chunk:
+                return
+            last_pk = chunk[-1][0]
+            yield chunk
+
+    def _grade(self, specs, chunks, workers):
+        if workers <= 1:
+            for chunk in chunks:
+                yield grade_texts(specs, chunk)
+            return
+        # Keep a bounded number of chunks in flight so the answer stream is
+        # never fully materialized.
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(grade_texts, specs, chunk))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import Attempt
+from myapp.scoring import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute Attempt correct/gradable/pending counters from stored answers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", type=int, action="append", dest="quiz_ids", help="Only attempts of this quiz (repeatable).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        attempts = Attempt.objects.order_by("pk")
+        if options["quiz_ids"]:
+            attempts = attempts.filter(quiz_id__in=options["quiz_ids"])
+
+        batch_size = options["batch_size"]
+        ids = list(attempts.values_list("pk", flat=True))
+        total = 0
+        for i in range(0, len(ids), batch_size):
+            total += rebuild_counters(Attempt.objects.filter(pk__in=ids[i:i + batch_size]))
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {total} attempts."))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.item_analysis import refresh_quiz, refresh_stale
+
+
+class Command(BaseCommand):
+    help = "Recompute item-analysis statistics for quizzes whose results changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", type=int, action="append", dest="quiz_ids", help="Recompute this quiz even if unchanged (repeatable).")
+        parser.add_argument("--limit", type=int, default=None, help="At most this many quizzes per pass.")
+        parser.add_argument("--loop", action="store_true", help="Keep refreshing instead of exiting after one pass.")
+        parser.add_argument("--sleep", type=float, default=60.0, help="Seconds to wait between passes in --loop mode.")
+
+    def handle(self, *args, **options):
+        if options["quiz_ids"]:
+            for quiz_id in options["quiz_ids"]:
+                refresh_quiz(quiz_id)
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {len(options['quiz_ids'])} quizzes."))
+            return
+
+        total = 0
+        while True:
+            total += refresh_stale(limit=options["limit"])
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {total} quizzes."))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:13
+
+import myapp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_attempt_graded_alter_question_qtype'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='content_version',
+            field=models.CharField(default=myapp.models.new_content_version, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Attempt = apps.get_model('myapp', 'Attempt')
+    Answer = apps.get_model('myapp', 'Answer')
+    Question = apps.get_model('myapp', 'Question')
+
+    def answers(condition):
+        return Coalesce(Subquery(
+            Answer.objects.filter(condition, attempt=OuterRef('pk'))
+            .order_by().values('attempt').annotate(n=Count('pk')).values('n')
+        ), 0)
+
+    Attempt.objects.update(
+        gradable_count=Coalesce(Subquery(
+            Question.objects.filter(quiz=OuterRef('quiz_id'), qtype__in=('mcq', 'short'))
+            .order_by().values('quiz').annotate(n=Count('pk')).values('n')
+        ), 0),
+        correct_count=answers(
+            Q(question__qtype='mcq', selected_choice__is_correct=True)
+            | Q(question__qtype='short', is_correct=True)
+        ),
+        pending_short_count=answers(Q(question__qtype='short', is_correct__isnull=True)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_quiz_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='correct_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='gradable_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='pending_short_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
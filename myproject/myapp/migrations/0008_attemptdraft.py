@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_attempt_scoring_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttemptDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attempt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='draft', to='myapp.attempt')),
+            ],
+        ),
+    ]
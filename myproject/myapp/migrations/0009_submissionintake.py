@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_attemptdraft'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionIntake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('auto_submitted', models.BooleanField(default=False)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intakes', to='myapp.attempt')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='intake_pending_idx')],
+            },
+        ),
+    ]
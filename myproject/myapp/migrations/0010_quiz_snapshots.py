@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_submissionintake'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+                ('content_version', models.CharField(max_length=32)),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='myapp.quiz')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attempts', to='myapp.quizsnapshot'),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='published_snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='myapp.quizsnapshot'),
+        ),
+        migrations.AddConstraint(
+            model_name='quizsnapshot',
+            constraint=models.UniqueConstraint(fields=('quiz', 'digest'), name='unique_quiz_snapshot_digest'),
+        ),
+    ]
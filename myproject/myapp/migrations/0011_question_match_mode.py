@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_quiz_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='match_mode',
+            field=models.CharField(choices=[('manual', 'ตรวจเอง'), ('exact', 'ตรงทุกตัวอักษร'), ('normalized', 'ไม่สนตัวพิมพ์เล็ก/ใหญ่และช่องว่าง'), ('unicode', 'ปรับรูปแบบ Unicode/ภาษาไทย'), ('numeric', 'ตัวเลข (ยอมให้คลาดเคลื่อนได้)'), ('fuzzy', 'ใกล้เคียง (สะกดผิดได้เล็กน้อย)')], default='manual', help_text='How short answers are graded automatically against correct_text (one accepted answer per line).', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='match_tolerance',
+            field=models.FloatField(blank=True, help_text='Allowed difference for numeric answers, or maximum typos for fuzzy matching.', null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.utils import timezone
+
+
+def close_duplicate_open_attempts(apps, schema_editor):
+    # Keep the earliest open attempt per (quiz, taker); close the extras so
+    # the partial unique constraint can be created.
+    Attempt = apps.get_model('myapp', 'Attempt')
+    duplicates = (
+        Attempt.objects.filter(finished_at__isnull=True, quiz__isnull=False, taker__isnull=False)
+        .values('quiz_id', 'taker_id')
+        .annotate(n=Count('pk'), keep=Min('pk'))
+        .filter(n__gt=1)
+    )
+    now = timezone.now()
+    for row in duplicates:
+        (Attempt.objects
+         .filter(quiz_id=row['quiz_id'], taker_id=row['taker_id'], finished_at__isnull=True)
+         .exclude(pk=row['keep'])
+         .update(finished_at=now, score=None))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_question_match_mode'),
+        ('room', '0002_roominvitation_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_attempts, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='attempt',
+            name='submit_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['quiz', 'taker'], name='attempt_quiz_taker_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='attempt',
+            constraint=models.UniqueConstraint(condition=models.Q(('finished_at__isnull', True)), fields=('quiz', 'taker'), name='unique_open_attempt_per_taker'),
+        ),
+    ]
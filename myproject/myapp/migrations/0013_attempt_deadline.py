@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:30
+
+from django.conf import settings
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_deadlines(apps, schema_editor):
+    Attempt = apps.get_model('myapp', 'Attempt')
+    batch = []
+    rows = (
+        Attempt.objects.filter(deadline__isnull=True, quiz__time_limit_minutes__gt=0)
+        .only('pk', 'started_at', 'quiz__time_limit_minutes')
+        .select_related('quiz')
+        .iterator(chunk_size=2000)
+    )
+    for attempt in rows:
+        attempt.deadline = attempt.started_at + timedelta(minutes=attempt.quiz.time_limit_minutes)
+        batch.append(attempt)
+        if len(batch) >= 2000:
+            Attempt.objects.bulk_update(batch, ['deadline'])
+            batch = []
+    if batch:
+        Attempt.objects.bulk_update(batch, ['deadline'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_attempt_open_unique'),
+        ('room', '0002_roominvitation_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_deadlines, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(condition=models.Q(('finished_at__isnull', True)), fields=['deadline'], name='attempt_open_deadline_idx'),
+        ),
+    ]
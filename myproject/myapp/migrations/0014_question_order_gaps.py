@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:36
+
+from django.db import migrations, models
+
+ORDER_GAP = 1024
+
+
+def respace_question_order(apps, schema_editor):
+    # Existing orders are 1..n and may repeat; spread them ORDER_GAP apart,
+    # ties broken by id, before the unique constraint goes on.
+    Question = apps.get_model('myapp', 'Question')
+    rows = list(Question.objects.order_by('quiz_id', 'order', 'id').values_list('pk', 'quiz_id'))
+    batch = []
+    quiz_id, position = None, 0
+    for pk, row_quiz_id in rows:
+        if row_quiz_id != quiz_id:
+            quiz_id, position = row_quiz_id, 0
+        position += 1
+        batch.append(Question(pk=pk, order=position * ORDER_GAP))
+        if len(batch) >= 2000:
+            Question.objects.bulk_update(batch, ['order'])
+            batch = []
+    if batch:
+        Question.objects.bulk_update(batch, ['order'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_attempt_deadline'),
+    ]
+
+    operations = [
+        migrations.RunPython(respace_question_order, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(fields=('quiz', 'order'), name='unique_question_order'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_question_order_gaps'),
+        ('room', '0002_roominvitation_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['quiz', '-started_at', '-id'], name='attempt_quiz_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['quiz', 'score'], name='attempt_quiz_score_idx'),
+        ),
+    ]
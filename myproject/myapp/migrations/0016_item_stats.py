@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_attempt_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answered', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('p_value', models.FloatField(blank=True, null=True)),
+                ('point_biserial', models.FloatField(blank=True, null=True)),
+                ('choice_counts', models.JSONField(blank=True, default=dict)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='item_stat', to='myapp.question')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_stats', to='myapp.quiz')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuizStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('mean_total', models.FloatField(blank=True, null=True)),
+                ('variance_total', models.FloatField(blank=True, null=True)),
+                ('kr20', models.FloatField(blank=True, null=True)),
+                ('dirty', models.BooleanField(default=True)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='item_stat', to='myapp.quiz')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('dirty', True)), fields=['dirty'], name='quizstat_dirty_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# See myapp.question_search. The index is backfilled from question, answer
+# and choice texts in one statement; no tags exist yet.
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE myapp_question_search USING fts5("
+    "body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "INSERT INTO myapp_question_search (rowid, body) "
+    "SELECT q.id, q.text || char(10) || q.correct_text || char(10) || COALESCE("
+    "(SELECT group_concat(c.text, char(10)) FROM myapp_choice c WHERE c.question_id = q.id), '') "
+    "FROM myapp_question q",
+]
+POSTGRES_INDEX = [
+    "CREATE TABLE myapp_question_search ("
+    "question_id bigint PRIMARY KEY REFERENCES myapp_question (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX myapp_question_search_document ON myapp_question_search USING GIN (document)",
+    "INSERT INTO myapp_question_search (question_id, document) "
+    "SELECT q.id, to_tsvector('simple', q.text || E'\\n' || q.correct_text || E'\\n' || COALESCE("
+    "(SELECT string_agg(c.text, E'\\n') FROM myapp_choice c WHERE c.question_id = q.id), '')) "
+    "FROM myapp_question q",
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_INDEX, "postgresql": POSTGRES_INDEX}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS myapp_question_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_item_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='question_tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='questions', to='myapp.tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('owner', 'name'), name='unique_tag_per_owner'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
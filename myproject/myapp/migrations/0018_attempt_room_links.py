@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:12
+
+from django.conf import settings
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def link_attempt_rooms(apps, schema_editor):
+    # Same rule as room.assigned.membership_for_attempt: the room named by
+    # room_code if the quiz is assigned there, else the taker's only room
+    # that has the quiz assigned.
+    Attempt = apps.get_model('myapp', 'Attempt')
+    RoomMembership = apps.get_model('room', 'RoomMembership')
+    RoomQuizAssignment = apps.get_model('room', 'RoomQuizAssignment')
+
+    rooms_by_quiz = defaultdict(set)
+    for room_id, quiz_id in RoomQuizAssignment.objects.values_list('room_id', 'quiz_id'):
+        rooms_by_quiz[quiz_id].add(room_id)
+    memberships = {}
+    user_rooms = defaultdict(set)
+    codes = {}
+    for pk, room_id, user_id, code in RoomMembership.objects.values_list('pk', 'room_id', 'user_id', 'room__code'):
+        memberships[room_id, user_id] = pk
+        user_rooms[user_id].add(room_id)
+        codes[room_id] = code.upper()
+
+    batch = []
+    rows = (
+        Attempt.objects.filter(room__isnull=True, taker__isnull=False, quiz__isnull=False)
+        .values_list('pk', 'quiz_id', 'taker_id', 'room_code')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for pk, quiz_id, taker_id, room_code in rows:
+        candidates = rooms_by_quiz[quiz_id] & user_rooms[taker_id]
+        room_id = None
+        if room_code:
+            room_id = next((r for r in candidates if codes[r] == room_code.upper()), None)
+        if room_id is None and len(candidates) == 1:
+            room_id = next(iter(candidates))
+        if room_id is None:
+            continue
+        batch.append(Attempt(pk=pk, room_id=room_id, room_membership_id=memberships[room_id, taker_id]))
+        if len(batch) >= BATCH_SIZE:
+            Attempt.objects.bulk_update(batch, ['room', 'room_membership'])
+            batch = []
+    if batch:
+        Attempt.objects.bulk_update(batch, ['room', 'room_membership'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_question_bank'),
+        ('room', '0002_roominvitation_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(link_attempt_rooms, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['room', 'quiz'], name='attempt_room_quiz_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['room_membership', 'quiz'], name='attempt_membership_quiz_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:37
+
+import myapp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0018_attempt_room_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32)),
+                ('object_id', models.PositiveIntegerField()),
+                ('version', models.CharField(default=myapp.models.new_content_version, max_length=32)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_result_version')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_result_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionintake',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
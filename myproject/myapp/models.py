@@ -1,9 +1,18 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
+from .short_grading import MATCH_MANUAL, MATCH_MODE_CHOICES
+
 User = get_user_model()
 
 
+def new_content_version():
+    return uuid.uuid4().hex
+
+
 class Profile(models.Model):
     user = models.OneToOneField(
         User,
@@ -25,11 +34,67 @@ class Quiz(models.Model):
     is_published = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     time_limit_minutes = models.PositiveIntegerField(null=True, blank=True)
+    # Changes whenever a question or choice of this quiz changes; cached
+    # answer keys are stored under it (see myapp.answer_key).
+    content_version = models.CharField(max_length=32, default=new_content_version, editable=False)
+    published_snapshot = models.ForeignKey(
+        "QuizSnapshot",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
 
     def __str__(self):
         return self.title
 
 
+class QuizSnapshot(models.Model):
+    """
+    Frozen copy of a quiz's questions, choices and answer key, taken when the
+    quiz is published. Identical content is stored once per quiz (``digest``).
+    """
+    quiz = models.ForeignKey(
+        Quiz,
+        on_delete=models.CASCADE,
+        related_name="snapshots",
+    )
+    digest = models.CharField(max_length=64)
+    content_version = models.CharField(max_length=32)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["quiz", "digest"], name="unique_quiz_snapshot_digest"),
+        ]
+
+
+# Question types that are scored right/wrong and count towards an attempt's score.
+GRADABLE_QTYPES = ("mcq", "short")
+
+
+class Tag(models.Model):
+    """A teacher's own label for questions in the question bank."""
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="question_tags",
+        null=True,
+        blank=True,
+    )
+    name = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "name"], name="unique_tag_per_owner"),
+        ]
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
 class Question(models.Model):
     quiz = models.ForeignKey(
         Quiz,
@@ -48,6 +113,24 @@ class Question(models.Model):
     )
     order = models.PositiveIntegerField(default=0)
     correct_text = models.TextField(blank=True, default="", help_text="...")
+    match_mode = models.CharField(
+        max_length=20,
+        choices=MATCH_MODE_CHOICES,
+        default=MATCH_MANUAL,
+        help_text="How short answers are graded automatically against correct_text (one accepted answer per line).",
+    )
+    match_tolerance = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Allowed difference for numeric answers, or maximum typos for fuzzy matching.",
+    )
+    tags = models.ManyToManyField(Tag, blank=True, related_name="questions")
+
+    class Meta:
+        constraints = [
+            # Gap-spaced and unique per quiz (see create_quiz.ordering).
+            models.UniqueConstraint(fields=["quiz", "order"], name="unique_question_order"),
+        ]
 
 
 class Choice(models.Model):
@@ -79,8 +162,14 @@ class Attempt(models.Model):
     )
     started_at = models.DateTimeField(auto_now_add=True)
     finished_at = models.DateTimeField(null=True, blank=True)
+    # started_at + the quiz time limit, fixed when the attempt starts.
+    deadline = models.DateTimeField(null=True, blank=True)
     score = models.FloatField(null=True, blank=True)
     graded = models.BooleanField(default=False)
+    # Running scoring state, maintained with F() deltas (see myapp.scoring).
+    correct_count = models.PositiveIntegerField(default=0)
+    gradable_count = models.PositiveIntegerField(default=0)
+    pending_short_count = models.PositiveIntegerField(default=0)
 
     room = models.ForeignKey(
         'room.Room',
@@ -95,6 +184,76 @@ class Attempt(models.Model):
         on_delete=models.SET_NULL,
     )
     room_code = models.CharField(max_length=20, null=True, blank=True)
+    snapshot = models.ForeignKey(
+        QuizSnapshot,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="attempts",
+    )
+    # Idempotency key of the submission that closed this attempt; retries
+    # carrying the same key are answered from the stored result.
+    submit_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["quiz", "taker"],
+                condition=models.Q(finished_at__isnull=True),
+                name="unique_open_attempt_per_taker",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["quiz", "taker"], name="attempt_quiz_taker_idx"),
+            models.Index(fields=["quiz", "-started_at", "-id"], name="attempt_quiz_started_idx"),
+            models.Index(fields=["quiz", "score"], name="attempt_quiz_score_idx"),
+            models.Index(fields=["room", "quiz"], name="attempt_room_quiz_idx"),
+            models.Index(fields=["room_membership", "quiz"], name="attempt_membership_quiz_idx"),
+            models.Index(
+                fields=["deadline"],
+                condition=models.Q(finished_at__isnull=True),
+                name="attempt_open_deadline_idx",
+            ),
+        ]
+
+    @property
+    def is_open(self):
+        """Still being taken: not finished, and no submission has claimed it."""
+        return self.finished_at is None and self.submit_key is None
+
+
+class AttemptDraft(models.Model):
+    """Autosaved, not yet submitted answers of an open attempt, keyed by form field name."""
+    attempt = models.OneToOneField(
+        Attempt,
+        on_delete=models.CASCADE,
+        related_name="draft",
+    )
+    answers = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class SubmissionIntake(models.Model):
+    """
+    Append-only queue of accepted submissions waiting to be graded by the
+    process_submissions worker. ``received_at`` is what deadlines are judged by.
+    """
+    attempt = models.ForeignKey(
+        Attempt,
+        on_delete=models.CASCADE,
+        related_name="intakes",
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    auto_submitted = models.BooleanField(default=False)
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Set by the worker that took the row, so concurrent workers never grade it twice.
+    claim_token = models.CharField(max_length=32, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["processed_at", "id"], name="intake_pending_idx"),
+        ]
 
 
 class Answer(models.Model):
@@ -119,3 +278,56 @@ class Answer(models.Model):
     )
     text = models.TextField(blank=True)
     is_correct = models.BooleanField(null=True, blank=True, help_text="...")
+
+
+class QuizStat(models.Model):
+    """Item-analysis summary of a quiz, refreshed by myapp.item_analysis."""
+    quiz = models.OneToOneField(
+        Quiz,
+        on_delete=models.CASCADE,
+        related_name="item_stat",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    mean_total = models.FloatField(null=True, blank=True)
+    variance_total = models.FloatField(null=True, blank=True)
+    kr20 = models.FloatField(null=True, blank=True)
+    # Set when attempts finish or are re-graded; refresh_item_stats picks these up.
+    dirty = models.BooleanField(default=True)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["dirty"], condition=models.Q(dirty=True), name="quizstat_dirty_idx"),
+        ]
+
+
+class QuestionStat(models.Model):
+    question = models.OneToOneField(
+        Question,
+        on_delete=models.CASCADE,
+        related_name="item_stat",
+    )
+    quiz = models.ForeignKey(
+        Quiz,
+        on_delete=models.CASCADE,
+        related_name="question_stats",
+    )
+    answered = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    p_value = models.FloatField(null=True, blank=True)
+    point_biserial = models.FloatField(null=True, blank=True)
+    # choice id (as a string) -> times picked, for MCQ questions
+    choice_counts = models.JSONField(default=dict, blank=True)
+
+
+class ResultVersion(models.Model):
+    """The token keying cached results of one (kind, object); see myapp.result_versions."""
+    kind = models.CharField(max_length=32)
+    object_id = models.PositiveIntegerField()
+    version = models.CharField(max_length=32, default=new_content_version)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="unique_result_version"),
+        ]
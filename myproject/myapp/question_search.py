@@ -0,0 +1,144 @@
+"""
+Full-text index over the question bank.
+
+Each question has one row in ``myapp_question_search`` holding its text,
+accepted answers, choice texts and tag names. On SQLite the table is an FTS5
+virtual table (rowid = question id, with prefix indexes for 2 and 3
+characters); on PostgreSQL it holds a ``tsvector`` with a GIN index. The
+table is created by migration 0017 and kept in sync by the signals in
+``myapp.signals``; bulk writers, which skip signals, call
+``reindex_questions`` themselves.
+
+``search`` ranks by bm25 / ``ts_rank`` and treats every term as a prefix, so
+"photo" finds "photosynthesis". Other databases fall back to a plain
+``icontains`` filter.
+"""
+import re
+
+from django.db import connection, transaction
+
+from .models import Choice, Question
+
+TABLE = "myapp_question_search"
+BATCH_SIZE = 500
+SEARCH_LIMIT = 50
+
+# Characters with a meaning in FTS5 or tsquery syntax; terms are split on them.
+_TERM_SPLIT = re.compile(r"[\s\"'*():^&|!<>\\+\-]+")
+
+
+def _vendor():
+    return connection.vendor
+
+
+def terms(query):
+    return [term for term in _TERM_SPLIT.split(query or "") if term]
+
+
+def _documents(question_ids):
+    """Return ``{question_id: body}`` for the questions that still exist."""
+    parts = {}
+    for pk, text, correct_text in Question.objects.filter(pk__in=question_ids).values_list("id", "text", "correct_text"):
+        parts[pk] = [text, correct_text]
+    for question_id, text in Choice.objects.filter(question_id__in=parts).values_list("question_id", "text"):
+        parts[question_id].append(text)
+    for question_id, name in Question.tags.through.objects.filter(question_id__in=parts).values_list("question_id", "tag__name"):
+        parts[question_id].append(name)
+    return {pk: "\n".join(p for p in texts if p) for pk, texts in parts.items()}
+
+
+def reindex_questions(question_ids):
+    """Rebuild the index rows of these questions; ids that no longer exist are removed."""
+    question_ids = sorted({pk for pk in question_ids if pk})
+    vendor = _vendor()
+    if vendor not in ("sqlite", "postgresql"):
+        return
+    for start in range(0, len(question_ids), BATCH_SIZE):
+        batch = question_ids[start:start + BATCH_SIZE]
+        documents = _documents(batch)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if vendor == "sqlite":
+                # FTS5 has no upsert: delete and re-insert.
+                cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})", batch)
+                cursor.executemany(f"INSERT INTO {TABLE} (rowid, body) VALUES (%s, %s)", list(documents.items()))
+            else:
+                missing = [pk for pk in batch if pk not in documents]
+                if missing:
+                    cursor.execute(f"DELETE FROM {TABLE} WHERE question_id = ANY(%s)", [missing])
+                cursor.executemany(
+                    f"INSERT INTO {TABLE} (question_id, document) VALUES (%s, to_tsvector('simple', %s)) "
+                    "ON CONFLICT (question_id) DO UPDATE SET document = EXCLUDED.document",
+                    list(documents.items()),
+                )
+
+
+def remove_questions(question_ids):
+    question_ids = [pk for pk in question_ids if pk]
+    vendor = _vendor()
+    if not question_ids or vendor not in ("sqlite", "postgresql"):
+        return
+    column = "rowid" if vendor == "sqlite" else "question_id"
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE {column} IN ({', '.join(['%s'] * len(question_ids))})", question_ids)
+
+
+def _ranked_ids(user, words, tag, limit):
+    tag_clause, tag_params = "", []
+    if tag is not None:
+        tag_clause = " AND q.id IN (SELECT question_id FROM myapp_question_tags WHERE tag_id = %s)"
+        tag_params = [tag.pk]
+
+    if _vendor() == "sqlite":
+        match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+        sql = (
+            f"SELECT q.id FROM {TABLE} "
+            f"JOIN myapp_question q ON q.id = {TABLE}.rowid "
+            "JOIN myapp_quiz z ON z.id = q.quiz_id "
+            f"WHERE {TABLE} MATCH %s AND z.creator_id = %s{tag_clause} "
+            f"ORDER BY {TABLE}.rank LIMIT %s"
+        )
+        params = [match, user.pk, *tag_params, limit]
+    else:
+        match = " & ".join(f"'{word}':*" for word in words)
+        sql = (
+            "SELECT q.id FROM myapp_question_search s "
+            "JOIN myapp_question q ON q.id = s.question_id "
+            "JOIN myapp_quiz z ON z.id = q.quiz_id "
+            f"WHERE s.document @@ to_tsquery('simple', %s) AND z.creator_id = %s{tag_clause} "
+            "ORDER BY ts_rank(s.document, to_tsquery('simple', %s)) DESC, q.id LIMIT %s"
+        )
+        params = [match, user.pk, *tag_params, match, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search(user, query, tag=None, limit=SEARCH_LIMIT):
+    """
+    Return up to ``limit`` of ``user``'s questions (those in quizzes they
+    created) matching ``query``, best match first, with their quiz, choices
+    and tags loaded. With no query, the most recent questions are listed,
+    optionally only those tagged ``tag``.
+    """
+    words = terms(query)
+    questions = (
+        Question.objects.filter(quiz__creator=user)
+        .select_related("quiz")
+        .prefetch_related("choices", "tags")
+    )
+    if not words:
+        if tag is not None:
+            questions = questions.filter(tags=tag)
+        return list(questions.order_by("-id")[:limit])
+
+    if _vendor() not in ("sqlite", "postgresql"):
+        for word in words:
+            questions = questions.filter(text__icontains=word)
+        if tag is not None:
+            questions = questions.filter(tags=tag)
+        return list(questions.order_by("-id")[:limit])
+
+    ids = _ranked_ids(user, words, tag, limit)
+    by_id = questions.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
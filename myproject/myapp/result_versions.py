@@ -0,0 +1,67 @@
+"""
+Version counters for derived result data.
+
+Anything computed from attempts (gradebooks, attempt summaries) is cached
+under the current version of the quizzes and rooms it covers. Grading bumps
+the quiz version, starting an attempt bumps the quiz_attempts version and
+roster changes bump the room version, so stale entries are simply never read
+again.
+
+Versions are rows of ``ResultVersion`` rather than cache entries: with a
+per-process cache (LocMem) a cache-held token is only renewed in the worker
+that made the change, while the database is shared by all of them. Reading
+any number of versions of one kind is a single query; an object that was
+never bumped has version "0". A bump is part of the writer's transaction,
+so readers see the new version exactly when they can see the new rows, and
+as every bump draws a fresh random token, one that is rolled back is never
+handed out again.
+"""
+import uuid
+
+from django.db import transaction
+
+from .models import ResultVersion
+
+
+def get_versions(kind, ids):
+    """Return ``{pk: version}`` for ``ids``."""
+    ids = list(ids)
+    versions = dict.fromkeys(ids, "0")
+    if ids:
+        versions.update(
+            ResultVersion.objects.filter(kind=kind, object_id__in=ids).values_list("object_id", "version")
+        )
+    return versions
+
+
+def bump(kind, ids):
+    ids = sorted({pk for pk in ids if pk})
+    if not ids:
+        return
+    version = uuid.uuid4().hex
+    with transaction.atomic():
+        ResultVersion.objects.bulk_create(
+            [ResultVersion(kind=kind, object_id=pk, version=version) for pk in ids], ignore_conflicts=True
+        )
+        ResultVersion.objects.filter(kind=kind, object_id__in=ids).update(version=version)
+
+
+def bump_quiz_results(quiz_ids):
+    """Call after attempts of these quizzes finish or are (re)graded."""
+    if isinstance(quiz_ids, int):
+        quiz_ids = [quiz_ids]
+    bump("quiz", quiz_ids)
+
+
+def bump_quiz_attempts(quiz_ids):
+    """Call after attempts of these quizzes start; covers in-progress counts."""
+    if isinstance(quiz_ids, int):
+        quiz_ids = [quiz_ids]
+    bump("quiz_attempts", quiz_ids)
+
+
+def bump_room_results(room_ids):
+    """Call after a room's members or assigned quizzes change."""
+    if isinstance(room_ids, int):
+        room_ids = [room_ids]
+    bump("room", room_ids)
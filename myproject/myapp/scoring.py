@@ -0,0 +1,123 @@
+"""
+Incremental scoring state for attempts.
+
+Each Attempt keeps ``correct_count``, ``gradable_count`` and
+``pending_short_count``. Marking an answer applies a delta to those columns
+with a single F() update, so concurrent graders never overwrite each other
+and a mark costs the same regardless of quiz size.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .item_analysis import mark_stale
+from .models import Attempt, Answer, Question, GRADABLE_QTYPES
+from .result_versions import bump_quiz_results
+
+
+def _score_expression(correct):
+    return Case(
+        When(gradable_count__gt=0, then=correct * 100.0 / F("gradable_count")),
+        default=None,
+        output_field=FloatField(),
+    )
+
+
+def apply_mark(answer, is_correct):
+    """
+    Set ``answer.is_correct`` and fold the change into its attempt's counters.
+    Returns False, changing nothing, if the answer row no longer exists (its
+    attempt was re-finalized or its question deleted meanwhile).
+    """
+    is_short = answer.question.qtype == "short"
+    with transaction.atomic():
+        # Compare-and-set so the delta is always taken against the value we replaced.
+        while True:
+            old = answer.is_correct
+            if Answer.objects.filter(pk=answer.pk, is_correct=old).update(is_correct=is_correct):
+                break
+            current = Answer.objects.filter(pk=answer.pk).values_list("is_correct").first()
+            if current is None:
+                return False
+            answer.is_correct = current[0]
+        answer.is_correct = is_correct
+
+        correct_delta = int(is_correct is True) - int(old is True)
+        pending_delta = -1 if (is_short and old is None) else 0
+
+        Attempt.objects.filter(pk=answer.attempt_id).update(
+            correct_count=F("correct_count") + correct_delta,
+            pending_short_count=F("pending_short_count") + pending_delta,
+            score=_score_expression(F("correct_count") + correct_delta),
+            graded=Case(When(gradable_count__gt=0, then=Value(True)), default=Value(False)),
+        )
+    bump_quiz_results(answer.question.quiz_id)
+    mark_stale(answer.question.quiz_id)
+    return True
+
+
+def apply_bulk_mark(answers, is_correct):
+    """
+    Mark every answer in ``answers`` with one UPDATE and rebuild the counters
+    and scores of the attempts they belong to. Returns ``(answers, attempts)``
+    counts.
+    """
+    with transaction.atomic():
+        pairs = list(answers.order_by().values_list("attempt_id", "attempt__quiz_id").distinct())
+        attempt_ids = [attempt_id for attempt_id, _ in pairs]
+        updated = answers.update(is_correct=is_correct)
+        if attempt_ids:
+            affected = Attempt.objects.filter(pk__in=attempt_ids)
+            rebuild_counters(affected)
+            recompute_scores(affected)
+    quiz_ids = {quiz_id for _, quiz_id in pairs}
+    bump_quiz_results(quiz_ids)
+    mark_stale(quiz_ids)
+    return updated, len(attempt_ids)
+
+
+def _count_answers(condition):
+    return Coalesce(
+        Subquery(
+            Answer.objects.filter(condition, attempt=OuterRef("pk"))
+            .order_by()
+            .values("attempt")
+            .annotate(n=Count("pk"))
+            .values("n")
+        ),
+        0,
+    )
+
+
+def rebuild_counters(attempts):
+    """Recompute the counters of ``attempts`` from their Answer rows in one UPDATE."""
+    gradable = Coalesce(
+        Subquery(
+            Question.objects.filter(quiz=OuterRef("quiz_id"), qtype__in=GRADABLE_QTYPES)
+            .order_by()
+            .values("quiz")
+            .annotate(n=Count("pk"))
+            .values("n")
+        ),
+        0,
+    )
+    # is_correct is stored at submit time against the attempt's key (or
+    # snapshot); only MCQ rows from before that fall back to the live choice.
+    correct = _count_answers(
+        Q(question__qtype__in=GRADABLE_QTYPES, is_correct=True)
+        | Q(question__qtype="mcq", is_correct__isnull=True, selected_choice__is_correct=True)
+    )
+    pending = _count_answers(Q(question__qtype="short", is_correct__isnull=True))
+    return attempts.update(
+        gradable_count=gradable,
+        correct_count=correct,
+        pending_short_count=pending,
+    )
+
+
+def recompute_scores(attempts):
+    """Derive ``score`` from the stored counters, as a mark would."""
+    return attempts.filter(gradable_count__gt=0).update(
+        score=_score_expression(F("correct_count")),
+        graded=True,
+    )
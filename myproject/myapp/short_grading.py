@@ -0,0 +1,135 @@
+"""
+Automatic grading of short answers.
+
+Each short question picks a match mode; ``Question.correct_text`` holds the
+accepted answers, one per line. A compiled matcher returns True (correct),
+False (wrong) or None (ambiguous: left for a human to mark). Matchers are
+plain functions over plain data so they can be cached per process and run
+inside a process pool for bulk regrades.
+"""
+import functools
+import unicodedata
+
+MATCH_MANUAL = "manual"
+MATCH_EXACT = "exact"
+MATCH_NORMALIZED = "normalized"
+MATCH_UNICODE = "unicode"
+MATCH_NUMERIC = "numeric"
+MATCH_FUZZY = "fuzzy"
+
+MATCH_MODE_CHOICES = (
+    (MATCH_MANUAL, "ตรวจเอง"),
+    (MATCH_EXACT, "ตรงทุกตัวอักษร"),
+    (MATCH_NORMALIZED, "ไม่สนตัวพิมพ์เล็ก/ใหญ่และช่องว่าง"),
+    (MATCH_UNICODE, "ปรับรูปแบบ Unicode/ภาษาไทย"),
+    (MATCH_NUMERIC, "ตัวเลข (ยอมให้คลาดเคลื่อนได้)"),
+    (MATCH_FUZZY, "ใกล้เคียง (สะกดผิดได้เล็กน้อย)"),
+)
+
+# Invisible characters that commonly sneak into Thai text typed on phones.
+_INVISIBLE = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff\u00ad"))
+
+
+def normalize_spacing(value):
+    return " ".join((value or "").split()).casefold()
+
+
+def normalize_unicode(value):
+    value = unicodedata.normalize("NFKC", value or "").translate(_INVISIBLE)
+    # NIKHAHIT + SARA AA is how SARA AM is often (mis)typed.
+    value = value.replace("\u0e4d\u0e32", "\u0e33")
+    return normalize_spacing(value)
+
+
+def parse_number(value):
+    value = unicodedata.normalize("NFKC", value or "").strip().replace(",", "").replace(" ", "")
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or ``limit + 1`` as soon as it is known to exceed ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def accepted_answers(correct_text):
+    return [line.strip() for line in (correct_text or "").splitlines() if line.strip()]
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_matcher(mode, correct_text, tolerance=None):
+    """Return ``matcher(answer_text) -> True | False | None``, or None when the question is graded by hand."""
+    alternatives = accepted_answers(correct_text)
+    if mode == MATCH_MANUAL or not alternatives:
+        return None
+
+    if mode == MATCH_NUMERIC:
+        targets = [n for n in map(parse_number, alternatives) if n is not None]
+        if not targets:
+            return None
+        tol = abs(tolerance or 0.0)
+
+        def match(text):
+            value = parse_number(text)
+            if value is None:
+                return None if (text or "").strip() else False
+            return any(abs(value - t) <= tol + 1e-9 for t in targets)
+        return match
+
+    if mode == MATCH_FUZZY:
+        targets = [normalize_unicode(a) for a in alternatives]
+        limit = int(tolerance) if tolerance is not None else 1
+
+        def match(text):
+            value = normalize_unicode(text)
+            if not value:
+                return False
+            best = min(edit_distance(value, t, 2 * limit) for t in targets)
+            if best <= limit:
+                return True
+            # Close, but not close enough to decide automatically.
+            return None if best <= 2 * limit else False
+        return match
+
+    normalize = {
+        MATCH_EXACT: lambda v: (v or "").strip(),
+        MATCH_NORMALIZED: normalize_spacing,
+        MATCH_UNICODE: normalize_unicode,
+    }.get(mode)
+    if normalize is None:
+        return None
+    targets = frozenset(normalize(a) for a in alternatives)
+
+    def match(text):
+        return normalize(text) in targets
+    return match
+
+
+def grade_texts(specs, rows):
+    """
+    Process-pool entry point. ``specs`` maps question id to
+    ``(mode, correct_text, tolerance)``; ``rows`` are ``(answer_id,
+    question_id, text, is_correct)``. Returns ``(answer_id, verdict)`` for
+    every answer whose stored verdict should change.
+    """
+    changes = []
+    for answer_id, question_id, text, is_correct in rows:
+        matcher = compile_matcher(*specs[question_id])
+        if matcher is None:
+            continue
+        verdict = matcher(text)
+        if verdict is not None and verdict != is_correct:
+            changes.append((answer_id, verdict))
+    return changes
@@ -0,0 +1,44 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Quiz, Question, Choice, new_content_version
+from .answer_key import bump_content_version
+from .item_analysis import mark_stale
+from .question_search import reindex_questions, remove_questions
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    bump_content_version(instance.quiz_id)
+    if kwargs.get("created", True):
+        # Adding or removing an item changes KR-20 and every total score.
+        mark_stale(instance.quiz_id)
+
+
+@receiver(post_save, sender=Question)
+def question_saved_search(sender, instance, **kwargs):
+    reindex_questions([instance.pk])
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted_search(sender, instance, **kwargs):
+    remove_questions([instance.pk])
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    if instance.question_id:
+        Quiz.objects.filter(questions=instance.question_id).update(content_version=new_content_version())
+        reindex_questions([instance.question_id])
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def question_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        reindex_questions([instance.pk])
+    elif pk_set:
+        reindex_questions(pk_set)
@@ -1,3 +1,140 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from myapp.models import Quiz, Question, Choice, Attempt, Answer
+from myapp.answer_key import get_answer_key
+from myapp.short_grading import compile_matcher
+
+User = get_user_model()
+
+
+class AnswerKeyTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username="teacher", password="pw")
+        self.quiz = Quiz.objects.create(title="Key Quiz", creator=self.teacher, is_published=True)
+        self.q = Question.objects.create(quiz=self.quiz, text="2 + 2 = ?", qtype="mcq", order=1)
+        self.wrong = Choice.objects.create(question=self.q, text="3", is_correct=False)
+        self.right = Choice.objects.create(question=self.q, text="4", is_correct=True)
+        self.short = Question.objects.create(quiz=self.quiz, text="Say hi", qtype="short", order=2, correct_text="  Hello   World ")
+
+    def test_key_contents_and_cached_lookup(self):
+        self.quiz.refresh_from_db()
+        key = get_answer_key(self.quiz)
+        self.assertEqual([q.id for q in key.questions], [self.q.id, self.short.id])
+        self.assertEqual(key.by_id[self.q.id].correct_choice_id, self.right.id)
+        self.assertEqual(key.by_id[self.q.id].choice_ids, {self.wrong.id, self.right.id})
+        self.assertEqual(key.by_id[self.short.id].normalized_correct_text, "hello world")
+        self.assertIsNone(key.choice_for(self.short.id, self.right.id))
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_answer_key(self.quiz), key)
+
+    def test_choice_change_invalidates_key(self):
+        self.quiz.refresh_from_db()
+        old_key = get_answer_key(self.quiz)
+
+        self.right.is_correct = False
+        self.right.save()
+        self.wrong.is_correct = True
+        self.wrong.save()
+
+        self.quiz.refresh_from_db()
+        new_key = get_answer_key(self.quiz)
+        self.assertNotEqual(old_key.version, new_key.version)
+        self.assertEqual(new_key.by_id[self.q.id].correct_choice_id, self.wrong.id)
+
+
+class ShortGradingTests(TestCase):
+    def test_match_modes(self):
+        self.assertIsNone(compile_matcher("manual", "Paris"))
+        self.assertTrue(compile_matcher("exact", "Paris\nParis, France")("Paris, France"))
+        self.assertFalse(compile_matcher("exact", "Paris")("paris"))
+        self.assertTrue(compile_matcher("normalized", "New  York")(" new york "))
+        self.assertTrue(compile_matcher("unicode", "\uff21\uff22\uff23")("abc"))
+        numeric = compile_matcher("numeric", "3.14", 0.01)
+        self.assertTrue(numeric("3.145"))
+        self.assertFalse(numeric("3.2"))
+        self.assertIsNone(numeric("pi"))
+        fuzzy = compile_matcher("fuzzy", "photosynthesis", 1)
+        self.assertTrue(fuzzy("Photosynthesys"))
+        self.assertIsNone(fuzzy("fotosynthesis"))
+        self.assertFalse(fuzzy("respiration"))
+
+    def test_autograde_command_marks_pending_answers(self):
+        teacher = User.objects.create_user(username="teacher", password="pw")
+        student = User.objects.create_user(username="student", password="pw")
+        quiz = Quiz.objects.create(title="Capitals", creator=teacher, is_published=True)
+        q = Question.objects.create(quiz=quiz, text="Capital of France?", qtype="short", order=1, correct_text="Paris")
+        attempt = Attempt.objects.create(quiz=quiz, taker=student, finished_at=timezone.now(), gradable_count=1, pending_short_count=1)
+        answer = Answer.objects.create(attempt=attempt, question=q, text="  paris ")
+        other = Attempt.objects.create(quiz=quiz, taker=teacher, finished_at=timezone.now(), gradable_count=1, pending_short_count=1)
+        Answer.objects.create(attempt=other, question=q, text="Lyon")
+
+        call_command("autograde_short_answers", stdout=StringIO())
+        answer.refresh_from_db()
+        self.assertIsNone(answer.is_correct)
+
+        Question.objects.filter(pk=q.pk).update(match_mode="normalized")
+        out = StringIO()
+        # One answer per chunk: every chunk settles its own attempts.
+        call_command("autograde_short_answers", "--quiz", str(quiz.pk), "--chunk-size", "1", stdout=out)
+        self.assertIn("Updated 2 answers across 1 quizzes", out.getvalue())
+        answer.refresh_from_db()
+        attempt.refresh_from_db()
+        other.refresh_from_db()
+        self.assertTrue(answer.is_correct)
+        self.assertEqual((attempt.correct_count, attempt.pending_short_count), (1, 0))
+        self.assertEqual(attempt.score, 100.0)
+        self.assertEqual((other.pending_short_count, other.score), (0, 0.0))
+
+
+class ItemAnalysisTests(TestCase):
+    def test_statistics_match_hand_computation_and_refresh_when_stale(self):
+        import statistics
+        from myapp.item_analysis import compute
+        from myapp.models import QuizStat, QuestionStat
+        from myapp.scoring import apply_mark
+
+        teacher = User.objects.create_user(username="teacher", password="pw")
+        quiz = Quiz.objects.create(title="Items", creator=teacher)
+        items = []
+        for i in range(3):
+            q = Question.objects.create(quiz=quiz, text=f"Q{i}", qtype="mcq", order=i + 1)
+            items.append((q, Choice.objects.create(question=q, text="right", is_correct=True),
+                          Choice.objects.create(question=q, text="wrong", is_correct=False)))
+
+        matrix = [[1, 1, 1], [1, 1, 0], [1, 0, 0], [0, 0, 0]]
+        for n, row in enumerate(matrix):
+            taker = User.objects.create_user(username=f"s{n}", password="pw")
+            attempt = Attempt.objects.create(quiz=quiz, taker=taker, finished_at=timezone.now())
+            for (q, right, wrong), x in zip(items, row):
+                Answer.objects.create(attempt=attempt, question=q, selected_choice=right if x else wrong, is_correct=bool(x))
+        # Not fully graded yet: left out.
+        pending = Attempt.objects.create(quiz=quiz, taker=teacher, finished_at=timezone.now(), pending_short_count=1)
+        Answer.objects.create(attempt=pending, question=items[0][0], selected_choice=items[0][1], is_correct=True)
+
+        quiz_fields, questions = compute(quiz.pk)
+        self.assertEqual(quiz_fields["attempts"], 4)
+        self.assertAlmostEqual(quiz_fields["kr20"], 0.75)
+        totals = [sum(row) for row in matrix]
+        for i, (q, right, wrong) in enumerate(items):
+            column = [row[i] for row in matrix]
+            self.assertAlmostEqual(questions[q.pk]["p_value"], sum(column) / 4)
+            self.assertAlmostEqual(questions[q.pk]["point_biserial"], statistics.correlation(column, totals))
+        self.assertEqual(questions[items[0][0].pk]["choice_counts"], {str(items[0][1].pk): 3, str(items[0][2].pk): 1})
+
+        call_command("refresh_item_stats", stdout=StringIO())
+        stat = QuizStat.objects.get(quiz=quiz)
+        self.assertFalse(stat.dirty)
+        self.assertEqual(QuestionStat.objects.filter(quiz=quiz).count(), 3)
 
-# Create your tests here.
+        answer = Answer.objects.select_related("question").get(attempt__taker__username="s3", question=items[0][0])
+        apply_mark(answer, True)
+        self.assertTrue(QuizStat.objects.get(quiz=quiz).dirty)
+        call_command("refresh_item_stats", stdout=StringIO())
+        self.assertEqual(QuestionStat.objects.get(question=items[0][0]).correct, 4)
+        self.assertFalse(QuizStat.objects.get(quiz=quiz).dirty)
@@ -86,6 +86,21 @@ DATABASES = {
 }
 
 
+# Cache
+# Compiled answer keys and other derived data live here. The default is
+# per-process; point DJANGO_CACHE_BACKEND/DJANGO_CACHE_LOCATION at a shared
+# backend (database, redis, memcached) so every gunicorn worker sees the same
+# entries.
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'takeq'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -129,6 +144,11 @@ STATICFILES_STORAGE ='whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# When enabled, submit_quiz only records the submission and the
+# process_submissions worker grades it shortly after. Keeps submit latency flat
+# when a timed quiz expires for a whole class at once.
+QUIZ_ASYNC_GRADING = os.environ.get('QUIZ_ASYNC_GRADING', '') == '1'
+
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
 LOGIN_URL = '/login/'
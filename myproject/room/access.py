@@ -0,0 +1,96 @@
+"""
+Room permissions.
+
+``room_access(request)`` answers "which role does this user hold in each
+room, and which quizzes may they manage through rooms they own or
+administer?" with one query joining memberships to assignments. The answer
+is memoized on the request and cached per user across requests under the
+user's "room_access" version (``myapp.result_versions``). The receivers in
+``room.signals`` bump that version whenever a membership or an assignment
+changes. It is kept in the database, so a revocation reaches every worker
+even with a per-process cache, at the cost of one indexed lookup per
+request. Bulk writes skip signals, so call ``invalidate_users`` or
+``invalidate_rooms`` after them.
+"""
+from django.core.cache import cache
+
+from myapp.result_versions import bump, get_versions
+
+from .models import RoomMembership
+
+CACHE_TIMEOUT = 600
+MANAGER_ROLES = (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN)
+
+
+class RoomAccess:
+    """A user's role per room and the quizzes those roles let them manage."""
+
+    __slots__ = ("user_id", "roles", "quiz_ids")
+
+    def __init__(self, user_id, roles, quiz_ids):
+        self.user_id = user_id
+        self.roles = roles
+        self.quiz_ids = quiz_ids
+
+    def role_in(self, room):
+        return self.roles.get(room.pk)
+
+    def manages_room(self, room):
+        return self.role_in(room) in MANAGER_ROLES
+
+    @property
+    def managed_room_ids(self):
+        return [room_id for room_id, role in self.roles.items() if role in MANAGER_ROLES]
+
+    def manages_quiz(self, quiz):
+        """The quiz's creator, or an owner/admin of a room it is assigned to."""
+        return quiz.creator_id == self.user_id or quiz.pk in self.quiz_ids
+
+
+NO_ACCESS = RoomAccess(None, {}, frozenset())
+
+
+def cache_key(user_id, version):
+    return f"room_access:{user_id}:{version}"
+
+
+def load_access(user_id):
+    roles = {}
+    quiz_ids = set()
+    rows = RoomMembership.objects.filter(user_id=user_id).values_list(
+        "room_id", "role", "room__assignments__quiz_id"
+    )
+    for room_id, role, quiz_id in rows:
+        roles[room_id] = role
+        if quiz_id is not None and role in MANAGER_ROLES:
+            quiz_ids.add(quiz_id)
+    return RoomAccess(user_id, roles, frozenset(quiz_ids))
+
+
+def access_for_user(user):
+    if not user.is_authenticated:
+        return NO_ACCESS
+    key = cache_key(user.pk, get_versions("room_access", [user.pk])[user.pk])
+    access = cache.get(key)
+    if access is None:
+        access = load_access(user.pk)
+        cache.set(key, access, CACHE_TIMEOUT)
+    return access
+
+
+def room_access(request):
+    """The RoomAccess of ``request.user``, loaded at most once per request."""
+    access = getattr(request, "_room_access", None)
+    if access is None:
+        access = request._room_access = access_for_user(request.user)
+    return access
+
+
+def invalidate_users(user_ids):
+    bump("room_access", user_ids)
+
+
+def invalidate_rooms(room_ids):
+    invalidate_users(
+        RoomMembership.objects.filter(room_id__in=list(room_ids)).values_list("user_id", flat=True)
+    )
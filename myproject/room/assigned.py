@@ -0,0 +1,92 @@
+"""
+The quizzes assigned to a room, as listed on the room page.
+
+``assigned_quizzes`` loads them in one query, each annotated with the
+viewer's attempt at it through correlated subqueries on the
+``(quiz, taker)`` index, so the cost depends on the number of assigned
+quizzes only, not on how many attempts the viewer or the room has.
+
+``membership_for_attempt`` picks the room an attempt belongs to when it
+starts, so it can be stored on ``Attempt.room`` / ``room_membership``.
+"""
+from django.db.models import F, OuterRef, Subquery
+
+from myapp.models import Attempt, Quiz
+
+from .models import RoomMembership
+
+STATUS_NOT_STARTED = "not_started"
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+
+
+def _viewer_attempt(user, field):
+    # Same precedence as take_quiz.start_quiz: the open attempt, else the latest one.
+    attempts = (
+        Attempt.objects.filter(quiz=OuterRef("pk"), taker=user)
+        .order_by(F("finished_at").asc(nulls_first=True), "-id")
+        .values(field)[:1]
+    )
+    return Subquery(attempts)
+
+
+def attempt_status(quiz):
+    if quiz.attempt_id is None:
+        return STATUS_NOT_STARTED
+    if quiz.attempt_finished_at is None:
+        # Submitted but still queued for grading: closed, waiting for its result.
+        return STATUS_IN_PROGRESS if quiz.attempt_submit_key is None else STATUS_PENDING
+    if quiz.attempt_pending:
+        return STATUS_PENDING
+    return STATUS_DONE
+
+
+def assigned_quizzes(room, viewer=None, published_only=False):
+    """
+    Return ``room``'s assigned quizzes, newest first. With a ``viewer``,
+    each has ``attempt_id``, ``attempt_finished_at``, ``attempt_score``,
+    ``attempt_pending`` and ``attempt_status`` describing the viewer's
+    attempt (None / not_started when there is none).
+    """
+    quizzes = (
+        Quiz.objects.filter(roomquizassignment__room=room)
+        .select_related("creator")
+        .order_by("-created_at")
+    )
+    if viewer is not None:
+        quizzes = quizzes.annotate(
+            attempt_id=_viewer_attempt(viewer, "id"),
+            attempt_finished_at=_viewer_attempt(viewer, "finished_at"),
+            attempt_score=_viewer_attempt(viewer, "score"),
+            attempt_pending=_viewer_attempt(viewer, "pending_short_count"),
+            attempt_submit_key=_viewer_attempt(viewer, "submit_key"),
+        )
+    if published_only:
+        quizzes = quizzes.filter(is_published=True)
+    quizzes = list(quizzes)
+    if viewer is not None:
+        for quiz in quizzes:
+            quiz.attempt_status = attempt_status(quiz)
+    return quizzes
+
+
+def membership_for_attempt(quiz, user, room_code=None):
+    """
+    Return the ``user``'s RoomMembership (room selected) in the room an
+    attempt at ``quiz`` belongs to: the room named by ``room_code`` if the
+    quiz is assigned there, else the only room of the user's that has it
+    assigned. None when there is no such room or it is ambiguous. One query.
+    """
+    memberships = list(
+        RoomMembership.objects.filter(user=user, room__assignments__quiz=quiz)
+        .select_related("room")
+        .distinct()
+    )
+    if room_code:
+        for membership in memberships:
+            if membership.room.code == room_code.upper():
+                return membership
+    if len(memberships) == 1:
+        return memberships[0]
+    return None
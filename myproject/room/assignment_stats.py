@@ -0,0 +1,87 @@
+"""
+Per-assignment progress for room managers: how many of the room's students
+finished, are still working on or await grading for each assigned quiz,
+and the mean and median of their best scores.
+
+Stats come from one aggregate over the students' attempts grouped by
+(quiz, taker), reduced per quiz in Python. Each quiz's entry is cached
+separately under the room's and that quiz's result versions, so when an
+attempt starts, finishes or is graded only that quiz is recomputed on the
+next page load; the other assignments are read from the cache. The versions
+are read from the database, so a change made through any worker is seen by
+all of them even when the cache is per-process.
+"""
+import statistics
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+from myapp.models import Attempt
+from myapp.result_versions import get_versions
+
+from .models import RoomMembership
+
+CACHE_TIMEOUT = 60 * 60
+
+AssignmentStats = namedtuple("AssignmentStats", "students finished in_progress pending mean median")
+
+
+def compute(room, quiz_ids):
+    """Return ``{quiz_id: AssignmentStats}`` for ``quiz_ids`` in ``room``. Two queries."""
+    students = RoomMembership.objects.filter(room=room, role=RoomMembership.ROLE_STUDENT).count()
+    per_quiz = {quiz_id: {"finished": 0, "in_progress": 0, "pending": 0, "scores": []} for quiz_id in quiz_ids}
+    if students and quiz_ids:
+        finished = Q(finished_at__isnull=False)
+        grouped = (
+            Attempt.objects.filter(
+                quiz_id__in=quiz_ids,
+                taker__room_memberships__room=room,
+                taker__room_memberships__role=RoomMembership.ROLE_STUDENT,
+            )
+            .values_list("quiz_id", "taker_id")
+            .annotate(
+                done=Count("id", filter=finished),
+                open=Count("id", filter=Q(finished_at__isnull=True)),
+                pending=Count("id", filter=finished & Q(pending_short_count__gt=0)),
+                best=Max("score", filter=finished),
+            )
+            .order_by()
+        )
+        for quiz_id, _, done, open_, pending, best in grouped:
+            entry = per_quiz[quiz_id]
+            entry["finished"] += bool(done)
+            entry["in_progress"] += bool(open_)
+            entry["pending"] += bool(pending)
+            if best is not None:
+                entry["scores"].append(best)
+
+    return {
+        quiz_id: AssignmentStats(
+            students=students,
+            finished=entry["finished"],
+            in_progress=entry["in_progress"],
+            pending=entry["pending"],
+            mean=statistics.fmean(entry["scores"]) if entry["scores"] else None,
+            median=statistics.median(entry["scores"]) if entry["scores"] else None,
+        )
+        for quiz_id, entry in per_quiz.items()
+    }
+
+
+def get_assignment_stats(room, quiz_ids):
+    """``compute`` for ``quiz_ids``, recomputing only the quizzes whose results changed."""
+    room_version = get_versions("room", [room.pk])[room.pk]
+    results = get_versions("quiz", quiz_ids)
+    attempts = get_versions("quiz_attempts", quiz_ids)
+    keys = {
+        f"assignment_stats:{room.pk}:{quiz_id}:{room_version}:{results[quiz_id]}:{attempts[quiz_id]}": quiz_id
+        for quiz_id in quiz_ids
+    }
+    stats = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    stale = [quiz_id for quiz_id in quiz_ids if quiz_id not in stats]
+    if stale:
+        fresh = compute(room, stale)
+        cache.set_many({key: fresh[quiz_id] for key, quiz_id in keys.items() if quiz_id in fresh}, CACHE_TIMEOUT)
+        stats.update(fresh)
+    return stats
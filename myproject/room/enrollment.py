@@ -0,0 +1,113 @@
+"""
+Enrolling many users at once.
+
+* Enrollment links carry a signed token naming a room and a role. Tokens
+  expire after ``ROOM_ENROLL_TOKEN_DAYS`` days and are bound to the room's
+  code, so they need no table and cannot be altered to pick another room
+  or role.
+* ``accept_all_invitations`` turns every pending invitation of a user
+  into a membership with one bulk insert and one status update.
+* ``copy_members`` enrolls the students of one room into another in a
+  constant number of queries.
+
+Bulk writes skip the membership signals, so these functions invalidate the
+cached room access and room results themselves.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+
+from myapp.result_versions import bump_room_results
+
+from .access import invalidate_users
+from .models import Room, RoomInvitation, RoomMembership
+
+TOKEN_SALT = "room.enrollment"
+ENROLL_ROLES = (RoomMembership.ROLE_STUDENT, RoomMembership.ROLE_ADMIN)
+
+
+def token_max_age():
+    return timedelta(days=getattr(settings, "ROOM_ENROLL_TOKEN_DAYS", 14))
+
+
+def make_token(room, role=RoomMembership.ROLE_STUDENT):
+    if role not in ENROLL_ROLES:
+        raise ValueError(f"cannot enroll as {role!r}")
+    return signing.dumps({"room": room.pk, "code": room.code, "role": role}, salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token):
+    """Return ``(room, role)`` for a valid, unexpired token, else None."""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=token_max_age())
+    except signing.BadSignature:  # includes SignatureExpired
+        return None
+    if data.get("role") not in ENROLL_ROLES:
+        return None
+    room = Room.objects.filter(pk=data.get("room"), code=data.get("code")).first()
+    if room is None:
+        return None
+    return room, data["role"]
+
+
+def enroll(room, user, role):
+    """Add ``user`` to ``room`` as ``role``; returns False if they already were a member."""
+    membership, created = RoomMembership.objects.get_or_create(room=room, user=user, defaults={"role": role})
+    if created:
+        # Invitations to this room are settled by joining it.
+        RoomInvitation.objects.filter(
+            room=room, invited_user=user, status=RoomInvitation.STATUS_PENDING
+        ).update(status=RoomInvitation.STATUS_ACCEPTED, responded_at=timezone.now())
+    return created
+
+
+def accept_all_invitations(user):
+    """Accept every pending invitation of ``user``. Returns the number of rooms joined."""
+    with transaction.atomic():
+        pending = list(
+            RoomInvitation.objects.select_for_update()
+            .filter(invited_user=user, status=RoomInvitation.STATUS_PENDING)
+            .values_list("id", "room_id", "role")
+        )
+        if not pending:
+            return 0
+        # An invitation to a room the user already joined is just marked accepted.
+        member_of = set(
+            RoomMembership.objects.filter(user=user, room_id__in=[room_id for _, room_id, _ in pending])
+            .values_list("room_id", flat=True)
+        )
+        joined = RoomMembership.objects.bulk_create(
+            [RoomMembership(room_id=room_id, user=user, role=role)
+             for _, room_id, role in pending if room_id not in member_of],
+            ignore_conflicts=True,
+        )
+        RoomInvitation.objects.filter(pk__in=[pk for pk, _, _ in pending]).update(
+            status=RoomInvitation.STATUS_ACCEPTED, responded_at=timezone.now()
+        )
+    invalidate_users([user.pk])
+    bump_room_results([room_id for _, room_id, _ in pending])
+    return len(joined)
+
+
+def copy_members(source, target):
+    """
+    Enroll ``source``'s students in ``target`` as students, skipping users
+    who are already members there. Returns how many were added.
+    """
+    with transaction.atomic():
+        user_ids = list(
+            RoomMembership.objects.filter(room=source, role=RoomMembership.ROLE_STUDENT)
+            .exclude(user_id__in=RoomMembership.objects.filter(room=target).values("user_id"))
+            .values_list("user_id", flat=True)
+        )
+        RoomMembership.objects.bulk_create(
+            [RoomMembership(room=target, user_id=user_id, role=RoomMembership.ROLE_STUDENT) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+    if user_ids:
+        invalidate_users(user_ids)
+        bump_room_results(target.pk)
+    return len(user_ids)
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Room
+from .roster import MAX_ROSTER_ROWS, RosterError, parse_roster
 
 class RoomCreateForm(forms.ModelForm):
     class Meta:
@@ -26,3 +27,39 @@ class InviteForm(forms.Form):
         self.fields["role"].widget.attrs.update({
             "class": "form-select"
         })
+
+
+class BulkInviteForm(forms.Form):
+    roster = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 8}),
+        help_text='ชื่อผู้ใช้หรืออีเมล บรรทัดละหนึ่งรายการ (หรือคั่นด้วยจุลภาค)',
+    )
+    file = forms.FileField(required=False, help_text='หรือไฟล์ CSV ที่มีคอลัมน์ username หรือ email')
+    role = forms.ChoiceField(choices=[('student','สมาชิก'),('admin','ผู้ดูแลห้อง')])
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["roster"].widget.attrs.update({"class": "form-control"})
+        self.fields["file"].widget.attrs.update({"class": "form-control", "accept": ".csv,.txt"})
+        self.fields["role"].widget.attrs.update({"class": "form-select"})
+
+    def clean(self):
+        cleaned = super().clean()
+        texts = [cleaned.get('roster') or '']
+        upload = cleaned.get('file')
+        if upload:
+            try:
+                texts.append(upload.read().decode('utf-8-sig'))
+            except UnicodeDecodeError:
+                raise forms.ValidationError('ไฟล์ต้องเป็น CSV แบบ UTF-8')
+        try:
+            entries = [entry for text in texts for entry in parse_roster(text)]
+        except RosterError as exc:
+            raise forms.ValidationError(str(exc))
+        cleaned['entries'] = list(dict.fromkeys(entries))
+        if len(cleaned['entries']) > MAX_ROSTER_ROWS:
+            raise forms.ValidationError(f'at most {MAX_ROSTER_ROWS} entries per upload')
+        if not cleaned['entries']:
+            raise forms.ValidationError('กรุณาระบุผู้ใช้อย่างน้อยหนึ่งคน')
+        return cleaned
@@ -0,0 +1,162 @@
+"""
+Room gradebook: students x assigned quizzes.
+
+The cells come from one aggregated query over attempts, grouped by
+(taker, quiz), and are pivoted into a matrix with two index lookups per
+row. A student whose only attempts are still open shows as in progress.
+The matrix is cached under the room's and its quizzes' result versions
+(``myapp.result_versions``), so it is rebuilt only after an attempt starts,
+finishes or is graded, or the roster or assignments change.
+"""
+import csv
+import hashlib
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from create_quiz.results_export import BOM, Echo
+from myapp.models import Attempt
+from myapp.result_versions import get_versions
+
+from .models import RoomMembership, RoomQuizAssignment
+
+CACHE_TIMEOUT = 60 * 60
+
+STATUS_MISSING = "missing"
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_PENDING = "pending"
+STATUS_GRADED = "graded"
+STATUS_UNSCORED = "unscored"
+
+Cell = namedtuple("Cell", "score status attempts")
+EMPTY_CELL = Cell(None, STATUS_MISSING, 0)
+
+
+class Gradebook:
+    __slots__ = ("version", "quizzes", "rows", "averages")
+
+    def __init__(self, version, quizzes, rows, averages):
+        self.version = version
+        self.quizzes = quizzes    # [(quiz_id, title)]
+        self.rows = rows          # [(user_id, username, [Cell, ...])]
+        self.averages = averages  # [float | None] per quiz
+
+    def html_rows(self):
+        """
+        ``(username, cells_html)`` per student. Cells are rendered here rather
+        than in the template, once per distinct value, to keep large rooms fast.
+        """
+        rendered = {}
+
+        def td(cell):
+            html = rendered.get(cell)
+            if html is None:
+                html = rendered[cell] = format_html('<td class="{}">{}</td>', *_cell_display(cell))
+            return html
+
+        return [(username, mark_safe("".join(map(td, cells)))) for _, username, cells in self.rows]
+
+
+def _cell_display(cell):
+    if cell.status == STATUS_MISSING:
+        return "text-muted", "-"
+    if cell.status == STATUS_IN_PROGRESS:
+        return "table-info", "กำลังทำ"
+    if cell.status == STATUS_UNSCORED:
+        return "", "ไม่มีคะแนน"
+    if cell.status == STATUS_PENDING:
+        return "table-warning", "รอตรวจ" if cell.score is None else f"{cell.score:.0f}*"
+    return "", f"{cell.score:.0f}"
+
+
+def _cell(best, attempts, pending, open_):
+    if not attempts:
+        return Cell(None, STATUS_IN_PROGRESS, 0) if open_ else EMPTY_CELL
+    if pending:
+        return Cell(best, STATUS_PENDING, attempts)
+    if best is None:
+        return Cell(None, STATUS_UNSCORED, attempts)
+    return Cell(best, STATUS_GRADED, attempts)
+
+
+def build_rows(room, quiz_ids):
+    """Return ``(rows, averages)`` for ``room`` over ``quiz_ids``. Two queries."""
+    students = list(
+        RoomMembership.objects.filter(room=room, role=RoomMembership.ROLE_STUDENT)
+        .order_by("user__username")
+        .values_list("user_id", "user__username")
+    )
+    column = {quiz_id: i for i, quiz_id in enumerate(quiz_ids)}
+    row_of = {user_id: i for i, (user_id, _) in enumerate(students)}
+    matrix = [[EMPTY_CELL] * len(quiz_ids) for _ in students]
+
+    if students and quiz_ids:
+        finished = Q(finished_at__isnull=False)
+        grouped = (
+            Attempt.objects.filter(
+                quiz_id__in=quiz_ids,
+                taker__room_memberships__room=room,
+                taker__room_memberships__role=RoomMembership.ROLE_STUDENT,
+            )
+            .values_list("taker_id", "quiz_id")
+            .annotate(
+                best=Max("score", filter=finished),
+                attempts=Count("id", filter=finished),
+                pending=Count("id", filter=finished & Q(pending_short_count__gt=0)),
+                open=Count("id", filter=Q(finished_at__isnull=True)),
+            )
+            .order_by()
+        )
+        for taker_id, quiz_id, best, attempts, pending, open_ in grouped:
+            matrix[row_of[taker_id]][column[quiz_id]] = _cell(best, attempts, pending, open_)
+
+    averages = []
+    for i in range(len(quiz_ids)):
+        scores = [row[i].score for row in matrix if row[i].score is not None]
+        averages.append(sum(scores) / len(scores) if scores else None)
+    rows = [(user_id, username, cells) for (user_id, username), cells in zip(students, matrix)]
+    return rows, averages
+
+
+def get_gradebook(room):
+    quizzes = list(
+        RoomQuizAssignment.objects.filter(room=room)
+        .order_by("assigned_at", "id")
+        .values_list("quiz_id", "quiz__title")
+    )
+    quiz_ids = [quiz_id for quiz_id, _ in quizzes]
+    versions = get_versions("quiz", quiz_ids)
+    started = get_versions("quiz_attempts", quiz_ids)
+    tokens = [get_versions("room", [room.pk])[room.pk]]
+    tokens += [f"{versions[pk]}:{started[pk]}:{title}" for pk, title in quizzes]
+    version = hashlib.sha1("\n".join(tokens).encode()).hexdigest()
+
+    key = f"gradebook:{room.pk}:{version}"
+    cached = cache.get(key)
+    if cached is None:
+        cached = build_rows(room, quiz_ids)
+        cache.set(key, cached, CACHE_TIMEOUT)
+    rows, averages = cached
+    return Gradebook(version, quizzes, rows, averages)
+
+
+def _score_cell(cell):
+    if cell.score is None:
+        return ""
+    return round(cell.score, 2)
+
+
+def iter_gradebook_csv(gradebook):
+    writer = csv.writer(Echo())
+    header = ["username"]
+    for _, title in gradebook.quizzes:
+        header += [title, f"{title} (status)"]
+    yield BOM + writer.writerow(header)
+    for _, username, cells in gradebook.rows:
+        line = [username]
+        for cell in cells:
+            line += [_score_cell(cell), cell.status]
+        yield writer.writerow(line)
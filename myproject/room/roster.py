@@ -0,0 +1,144 @@
+"""
+Bulk room invitations from a pasted list or CSV of usernames and emails.
+
+``invite_roster`` handles any number of entries in a fixed number of
+queries: usernames and then emails are resolved with one ``IN`` query
+each, existing members are found with one query, and invitations are
+created with ``bulk_create`` or refreshed with ``bulk_update``.
+"""
+import csv
+import io
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import RoomInvitation, RoomMembership
+
+User = get_user_model()
+
+MAX_ROSTER_ROWS = 2000
+
+STATUS_INVITED = "invited"
+STATUS_ALREADY_MEMBER = "already_member"
+STATUS_NOT_FOUND = "not_found"
+
+HEADER_COLUMNS = ("username", "email")
+_SPLIT_RE = re.compile(r"[\s,;]+")
+
+
+class RosterError(ValueError):
+    pass
+
+
+def parse_roster(text):
+    """
+    Return the usernames/emails in ``text``: either a CSV with a
+    ``username`` or ``email`` header column, or any list separated by
+    newlines, commas, semicolons or spaces. Order is kept, repeats dropped.
+    """
+    text = (text or "").lstrip("\ufeff")
+    first_line = text.split("\n", 1)[0].strip().lower()
+    header = [cell.strip() for cell in next(csv.reader([first_line]), [])]
+    if any(column in header for column in HEADER_COLUMNS):
+        entries = []
+        for row in csv.DictReader(io.StringIO(text)):
+            row = {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+            entries.append(row.get("username") or row.get("email") or "")
+    else:
+        entries = _SPLIT_RE.split(text)
+
+    entries = list(dict.fromkeys(entry for entry in entries if entry))
+    if len(entries) > MAX_ROSTER_ROWS:
+        raise RosterError(f"at most {MAX_ROSTER_ROWS} entries per upload")
+    return entries
+
+
+class RosterReport:
+    def __init__(self):
+        self.rows = []  # [(entry, status, user)]
+
+    def add(self, entry, status, user=None):
+        self.rows.append((entry, status, user))
+
+    def count(self, status):
+        return sum(1 for _, row_status, _ in self.rows if row_status == status)
+
+    @property
+    def invited(self):
+        return self.count(STATUS_INVITED)
+
+    @property
+    def already_member(self):
+        return self.count(STATUS_ALREADY_MEMBER)
+
+    @property
+    def not_found(self):
+        return self.count(STATUS_NOT_FOUND)
+
+
+def resolve_users(entries):
+    """Return ``{entry: user}``, matching usernames first and then emails (case-insensitive)."""
+    by_username = User.objects.in_bulk(entries, field_name="username")
+    found = {entry: by_username[entry] for entry in entries if entry in by_username}
+
+    remaining = {entry.lower(): entry for entry in entries if entry not in found and "@" in entry}
+    if remaining:
+        users = (
+            User.objects.annotate(email_lower=Lower("email"))
+            .filter(email_lower__in=list(remaining))
+            .order_by("-id")
+        )
+        # Ordered newest first so that the oldest account wins on shared emails.
+        by_email = {user.email_lower: user for user in users}
+        for email, entry in remaining.items():
+            if email in by_email:
+                found[entry] = by_email[email]
+    return found
+
+
+def invite_roster(room, entries, role, invited_by, message=""):
+    """Invite the users named in ``entries`` to ``room`` as ``role``; returns a RosterReport."""
+    report = RosterReport()
+    users = resolve_users(entries)
+    user_ids = {user.pk for user in users.values()}
+    members = set(
+        RoomMembership.objects.filter(room=room, user_id__in=user_ids).values_list("user_id", flat=True)
+    )
+
+    to_invite = {}
+    for entry in entries:
+        user = users.get(entry)
+        if user is None:
+            report.add(entry, STATUS_NOT_FOUND)
+        elif user.pk in members:
+            report.add(entry, STATUS_ALREADY_MEMBER, user)
+        else:
+            report.add(entry, STATUS_INVITED, user)
+            to_invite[user.pk] = user
+
+    if to_invite:
+        now = timezone.now()
+        fields = {
+            "invited_by": invited_by,
+            "role": role,
+            "status": RoomInvitation.STATUS_PENDING,
+            "message": message,
+            "created_at": now,
+            "responded_at": None,
+        }
+        with transaction.atomic():
+            existing = list(RoomInvitation.objects.filter(room=room, invited_user_id__in=list(to_invite)))
+            for invitation in existing:
+                for name, value in fields.items():
+                    setattr(invitation, name, value)
+            RoomInvitation.objects.bulk_update(existing, list(fields))
+            refreshed = {invitation.invited_user_id for invitation in existing}
+            RoomInvitation.objects.bulk_create([
+                RoomInvitation(room=room, invited_user=user, **fields)
+                for pk, user in to_invite.items()
+                if pk not in refreshed
+            ], ignore_conflicts=True)
+    return report
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from myapp.result_versions import bump_room_results
+
+from .models import RoomMembership, RoomQuizAssignment
+from .access import invalidate_users, invalidate_rooms
+
+
+@receiver(post_save, sender=RoomMembership)
+@receiver(post_delete, sender=RoomMembership)
+def membership_changed(sender, instance, **kwargs):
+    invalidate_users([instance.user_id])
+    bump_room_results(instance.room_id)
+
+
+@receiver(post_save, sender=RoomQuizAssignment)
+@receiver(post_delete, sender=RoomQuizAssignment)
+def assignment_changed(sender, instance, **kwargs):
+    invalidate_rooms([instance.room_id])
+    bump_room_results(instance.room_id)
@@ -1,14 +1,24 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from myapp.models import Quiz
+from myapp.models import Quiz, Question, Attempt, Answer, ResultVersion
+from myapp.result_versions import bump_quiz_attempts, bump_quiz_results, get_versions
+from myapp.scoring import apply_mark
+from room import enrollment
 from room.models import Room, RoomMembership, RoomInvitation, RoomQuizAssignment
+from room.access import access_for_user, cache_key
 
 User = get_user_model()
 
 class RoomAppBehaviorTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.owner = User.objects.create_user(username='owner', password='pw')
         self.admin = User.objects.create_user(username='admin', password='pw')
         self.student = User.objects.create_user(username='student', password='pw')
@@ -120,3 +130,291 @@ class RoomAppBehaviorTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertContains(resp, self.room.name)
         self.assertContains(resp, 'Pending')
+
+    def test_room_access_is_one_query_cached_and_invalidated(self):
+        cache.clear()
+        with self.assertNumQueries(2):  # version + memberships
+            access = access_for_user(self.admin)
+        self.assertEqual(access.role_in(self.room), RoomMembership.ROLE_ADMIN)
+        self.assertTrue(access.manages_quiz(self.quiz))
+        with self.assertNumQueries(1):  # version only
+            access_for_user(self.admin)
+
+        membership = RoomMembership.objects.get(room=self.room, user=self.admin)
+        membership.role = RoomMembership.ROLE_STUDENT
+        membership.save()
+        self.assertFalse(access_for_user(self.admin).manages_quiz(self.quiz))
+
+        other_quiz = Quiz.objects.create(title='Quiz B', creator=self.other)
+        self.assertFalse(access_for_user(self.owner).manages_quiz(other_quiz))
+        RoomQuizAssignment.objects.create(room=self.room, quiz=other_quiz, assigned_by=self.owner)
+        self.assertTrue(access_for_user(self.owner).manages_quiz(other_quiz))
+
+    def test_revocation_reaches_workers_whose_cache_still_holds_the_grant(self):
+        self.assertTrue(access_for_user(self.admin).manages_quiz(self.quiz))
+        key = cache_key(self.admin.pk, get_versions('room_access', [self.admin.pk])[self.admin.pk])
+        granted = cache.get(key)
+        self.assertIsNotNone(granted)
+
+        # Revoked through another worker: this worker's cache is left holding
+        # its copy of the grant.
+        RoomMembership.objects.filter(room=self.room, user=self.admin).delete()
+        cache.clear()
+        cache.set(key, granted)
+        self.assertFalse(access_for_user(self.admin).manages_quiz(self.quiz))
+
+        self.client.force_login(self.admin)
+        resp = self.client.post(reverse('create_quiz:toggle_publish', args=[self.quiz.pk]))
+        self.assertEqual(resp.status_code, 403)
+
+    def test_quiz_detail_checks_access_once(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse('create_quiz:quiz_detail', args=[self.quiz.pk]))
+        self.assertEqual(resp.status_code, 200)
+        membership_queries = [q for q in ctx.captured_queries if 'room_roommembership' in q['sql']]
+        quiz_queries = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'FROM "myapp_quiz"' in q['sql']]
+        self.assertEqual(len(membership_queries), 1)
+        self.assertEqual(len(quiz_queries), 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('create_quiz:quiz_detail', args=[self.quiz.pk]))
+        self.assertFalse([q for q in ctx.captured_queries if 'room_roommembership' in q['sql']])
+
+    def test_gradebook_pivots_scores_and_refreshes_after_grading(self):
+        short = Question.objects.create(quiz=self.quiz, text='Why?', qtype='short', order=1)
+        attempt = Attempt.objects.create(quiz=self.quiz, taker=self.student, finished_at=timezone.now(),
+                                         score=None, gradable_count=1, pending_short_count=1)
+        answer = Answer.objects.create(attempt=attempt, question=short, text='because')
+        url = reverse('room:gradebook', args=[self.room.code])
+
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.admin)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        cells = resp.context['gradebook'].rows[0][2]
+        self.assertEqual([self.student.username], [r[1] for r in resp.context['gradebook'].rows])
+        self.assertEqual(cells[0].status, 'pending')
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if 'myapp_attempt' in q['sql']])
+
+        # Result versions live in the database, not in the (per-process) cache:
+        # a worker with an empty cache sees the same version before grading...
+        version = resp.context['gradebook'].version
+        cache.clear()
+        self.assertEqual(self.client.get(url).context['gradebook'].version, version)
+
+        apply_mark(Answer.objects.select_related('question').get(pk=answer.pk), True)
+        resp = self.client.get(url)
+        # ...and a new one after it, whichever worker graded.
+        self.assertNotEqual(resp.context['gradebook'].version, version)
+        self.assertEqual(resp.context['gradebook'].rows[0][2][0], (100.0, 'graded', 1))
+        self.assertContains(resp, '>100<')
+
+        body = b''.join(self.client.get(reverse('room:gradebook_export', args=[self.room.code])).streaming_content)
+        self.assertEqual(body.decode('utf-8').splitlines()[1], 'student,100.0,graded')
+
+        # An attempt that is still open shows as in progress, not missing.
+        late = User.objects.create_user(username='student2', password='pw')
+        RoomMembership.objects.create(room=self.room, user=late, role=RoomMembership.ROLE_STUDENT)
+        self.assertEqual(self.client.get(url).context['gradebook'].rows[1][2][0].status, 'missing')
+        Attempt.objects.create(quiz=self.quiz, taker=late)
+        bump_quiz_attempts(self.quiz.pk)
+        resp = self.client.get(url)
+        self.assertEqual(resp.context['gradebook'].rows[1][2][0], (None, 'in_progress', 0))
+        self.assertEqual(resp.context['gradebook'].averages, [100.0])
+        self.assertContains(resp, 'กำลังทำ')
+        body = b''.join(self.client.get(reverse('room:gradebook_export', args=[self.room.code])).streaming_content)
+        self.assertEqual(body.decode('utf-8').splitlines()[2], 'student2,,in_progress')
+
+    def test_room_detail_annotates_viewer_attempts_in_fixed_queries(self):
+        url = reverse('room:detail', args=[self.room.code])
+        self.quiz.is_published = True
+        self.quiz.save()
+        finished = Quiz.objects.create(title='Quiz Done', creator=self.owner, is_published=True)
+        hidden = Quiz.objects.create(title='Quiz Hidden', creator=self.owner, is_published=False)
+        for quiz in (finished, hidden):
+            RoomQuizAssignment.objects.create(room=self.room, quiz=quiz, assigned_by=self.owner)
+        done = Attempt.objects.create(quiz=finished, taker=self.student, finished_at=timezone.now(), score=75.0)
+        open_attempt = Attempt.objects.create(quiz=self.quiz, taker=self.student)
+
+        self.client.force_login(self.student)
+        self.client.get(url)  # warm the cached room access
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        baseline = len(ctx.captured_queries)
+        quizzes = {q.title: q for q in resp.context['assigned_quizzes']}
+        self.assertEqual(set(quizzes), {'Quiz A', 'Quiz Done'})
+        self.assertEqual((quizzes['Quiz Done'].attempt_id, quizzes['Quiz Done'].attempt_status), (done.pk, 'done'))
+        self.assertEqual((quizzes['Quiz A'].attempt_id, quizzes['Quiz A'].attempt_status), (open_attempt.pk, 'in_progress'))
+        self.assertContains(resp, reverse('take_quiz:attempt_result', args=[done.pk]))
+        self.assertContains(resp, '75.0')
+
+        # A longer history elsewhere and more assigned quizzes cost no extra queries.
+        elsewhere = Quiz.objects.create(title='Elsewhere', creator=self.other, is_published=True)
+        for _ in range(5):
+            Attempt.objects.create(quiz=elsewhere, taker=self.student, finished_at=timezone.now(), score=10.0)
+        for i in range(5):
+            extra = Quiz.objects.create(title=f'Extra {i}', creator=self.owner, is_published=True)
+            RoomQuizAssignment.objects.create(room=self.room, quiz=extra, assigned_by=self.owner)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), baseline)
+        self.assertEqual(len(resp.context['assigned_quizzes']), 7)
+
+        self.client.force_login(self.owner)
+        resp = self.client.get(url)
+        self.assertEqual(len(resp.context['assigned_quizzes']), 8)
+
+    def test_assignment_stats_are_grouped_cached_and_refreshed_per_quiz(self):
+        second = User.objects.create_user(username='student2', password='pw')
+        RoomMembership.objects.create(room=self.room, user=second, role=RoomMembership.ROLE_STUDENT)
+        quiz_b = Quiz.objects.create(title='Quiz B', creator=self.owner)
+        RoomQuizAssignment.objects.create(room=self.room, quiz=quiz_b, assigned_by=self.owner)
+        Attempt.objects.create(quiz=self.quiz, taker=self.student, finished_at=timezone.now(), score=40.0)
+        Attempt.objects.create(quiz=self.quiz, taker=self.student, finished_at=timezone.now(), score=80.0)
+        Attempt.objects.create(quiz=self.quiz, taker=second, finished_at=timezone.now(), score=None,
+                               pending_short_count=1)
+        Attempt.objects.create(quiz=quiz_b, taker=second)
+        Attempt.objects.create(quiz=self.quiz, taker=self.other, finished_at=timezone.now(), score=0.0)
+
+        url = reverse('room:detail', args=[self.room.code])
+        self.client.force_login(self.owner)
+        stats = {q.title: q.stats for q in self.client.get(url).context['assigned_quizzes']}
+        self.assertEqual(stats['Quiz A'], (2, 2, 0, 1, 80.0, 80.0))
+        self.assertEqual(stats['Quiz B'], (2, 0, 1, 0, None, None))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if 'myapp_attempt' in q['sql']])
+
+        # Grading one quiz recomputes only that quiz's entry.
+        Attempt.objects.filter(taker=second, quiz=self.quiz).update(score=60.0, pending_short_count=0)
+        bump_quiz_results(self.quiz.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            stats = {q.title: q.stats for q in self.client.get(url).context['assigned_quizzes']}
+        grouped = [q['sql'] for q in ctx.captured_queries if 'GROUP BY' in q['sql'] and 'myapp_attempt' in q['sql']]
+        self.assertEqual(len(grouped), 1)
+        self.assertIn(f'IN ({self.quiz.pk})', grouped[0])
+        self.assertEqual(stats['Quiz A'], (2, 2, 0, 0, 70.0, 70.0))
+
+        Attempt.objects.create(quiz=quiz_b, taker=self.student)
+        bump_quiz_attempts(quiz_b.pk)
+        stats = {q.title: q.stats for q in self.client.get(url).context['assigned_quizzes']}
+        self.assertEqual(stats['Quiz B'].in_progress, 2)
+        self.assertContains(self.client.get(url), 'ส่งแล้ว 2/2 คน')
+
+        # A version written by another worker is seen here although this
+        # worker's cache still holds the old entry.
+        Attempt.objects.filter(quiz=quiz_b, taker=self.student).update(finished_at=timezone.now(), score=50.0)
+        ResultVersion.objects.update_or_create(kind='quiz', object_id=quiz_b.pk, defaults={'version': 'elsewhere'})
+        stats = {q.title: q.stats for q in self.client.get(url).context['assigned_quizzes']}
+        self.assertEqual((stats['Quiz B'].finished, stats['Quiz B'].mean), (1, 50.0))
+
+    def test_bulk_invite_reports_each_row_in_fixed_queries(self):
+        url = reverse('room:bulk_invite', args=[self.room.code])
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.owner)
+        self.client.get(url)  # warm the cached room access
+        declined = User.objects.create_user(username='declined', password='pw')
+        RoomInvitation.objects.create(room=self.room, invited_user=declined, invited_by=self.admin,
+                                      role='student', status=RoomInvitation.STATUS_DECLINED)
+
+        def post(count, **data):
+            users = [User.objects.create_user(username=f'b{count}_{i}', password='pw', email=f'B{count}_{i}@Example.com')
+                     for i in range(count)]
+            roster = '\n'.join([u.username for u in users[::2]] + [u.email.lower() for u in users[1::2]])
+            roster += '\nstudent, nobody@example.com; declined'
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post(url, {'roster': roster, 'role': 'student', **data})
+            return resp, len(ctx.captured_queries)
+
+        resp, small = post(2)
+        _, large = post(40)
+        self.assertEqual(small, large)
+        report = resp.context['report']
+        self.assertEqual(report.rows[0][:2], ('b2_0', 'invited'))
+        self.assertEqual(report.rows[1][:2], ('b2_1@example.com', 'invited'))
+        self.assertEqual([row[1] for row in report.rows[2:]], ['already_member', 'not_found', 'invited'])
+        self.assertEqual((report.invited, report.already_member, report.not_found), (3, 1, 1))
+        refreshed = RoomInvitation.objects.get(room=self.room, invited_user=declined)
+        self.assertEqual((refreshed.status, refreshed.invited_by), (RoomInvitation.STATUS_PENDING, self.owner))
+        self.assertEqual(RoomInvitation.objects.filter(room=self.room, status='pending').count(), 43)
+
+        upload = SimpleUploadedFile('roster.csv', '\ufeffName,Email\nOwner,OWNER@x.org\nX,none@x.org\n'.encode('utf-8'))
+        self.owner.email = 'owner@x.org'
+        self.owner.save()
+        resp = self.client.post(url, {'file': upload, 'role': 'student'})
+        self.assertEqual([row[1] for row in resp.context['report'].rows], ['already_member', 'not_found'])
+
+        self.client.force_login(self.admin)
+        resp = self.client.post(url, {'roster': 'other', 'role': 'admin'})
+        self.assertEqual(resp.status_code, 403)
+
+    def test_enrollment_links_accept_all_and_copy_members(self):
+        # Signed links: valid ones enroll, tampered or expired ones do not.
+        token = enrollment.make_token(self.room, 'admin')
+        joiner = User.objects.create_user(username='joiner', password='pw')
+        self.client.force_login(joiner)
+        self.assertEqual(self.client.get(reverse('room:enroll', args=[token])).status_code, 200)
+        self.client.post(reverse('room:enroll', args=[token[:-2] + 'xx']))
+        self.assertFalse(RoomMembership.objects.filter(room=self.room, user=joiner).exists())
+        with override_settings(ROOM_ENROLL_TOKEN_DAYS=-1):
+            self.client.post(reverse('room:enroll', args=[token]))
+        self.assertFalse(RoomMembership.objects.filter(room=self.room, user=joiner).exists())
+        resp = self.client.post(reverse('room:enroll', args=[token]))
+        self.assertRedirects(resp, reverse('room:detail', args=[self.room.code]))
+        self.assertEqual(RoomMembership.objects.get(room=self.room, user=joiner).role, 'admin')
+        self.assertTrue(access_for_user(joiner).manages_room(self.room))
+
+        # Accepting all invitations: constant queries, and cached access is refreshed.
+        def invite_rooms(n):
+            rooms = [Room.objects.create(name=f'R{Room.objects.count()}', owner=self.owner) for _ in range(n)]
+            for room in rooms:
+                RoomInvitation.objects.create(room=room, invited_user=self.other, invited_by=self.owner, role='student')
+            return rooms
+
+        self.client.force_login(self.other)
+        url = reverse('room:accept_all_invitations')
+        counts = []
+        for n in (1, 5):
+            rooms = invite_rooms(n)
+            access_for_user(self.other)
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(url)
+            counts.append(len(ctx.captured_queries))
+            self.assertTrue(all(access_for_user(self.other).role_in(room) == 'student' for room in rooms))
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(RoomInvitation.objects.filter(invited_user=self.other, status='pending').exists())
+
+        # Copying members: only students not already in the target, in fixed queries.
+        target = Room.objects.create(name='Next term', owner=self.owner)
+        RoomMembership.objects.create(room=target, user=self.owner, role=RoomMembership.ROLE_OWNER)
+        self.client.force_login(self.owner)
+        copy_url = reverse('room:copy_members', args=[target.code])
+        self.client.get(reverse('room:manage_members', args=[target.code]))  # warm the cached room access
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(copy_url, {'source_room': self.room.pk})
+        few = len(ctx.captured_queries)
+        self.assertEqual(set(target.memberships.values_list('user__username', 'role')),
+                         {('owner', 'owner'), ('student', 'student')})
+        self.assertEqual(access_for_user(self.student).role_in(target), 'student')
+
+        for i in range(10):
+            extra = User.objects.create_user(username=f'copy{i}', password='pw')
+            RoomMembership.objects.create(room=self.room, user=extra, role=RoomMembership.ROLE_STUDENT)
+        self.client.get(reverse('room:manage_members', args=[target.code]))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(copy_url, {'source_room': self.room.pk})
+        self.assertEqual(len(ctx.captured_queries), few)
+        self.assertEqual(target.memberships.count(), 12)
+
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.post(copy_url, {'source_room': self.room.pk}).status_code, 403)
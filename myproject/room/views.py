@@ -1,24 +1,23 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, StreamingHttpResponse
 from .models import Room, RoomMembership, RoomInvitation, RoomQuizAssignment
-from .forms import RoomCreateForm, JoinRoomByCodeForm, InviteForm
+from .forms import RoomCreateForm, JoinRoomByCodeForm, InviteForm, BulkInviteForm
+from .roster import invite_roster
+from . import enrollment
+from .access import room_access
+from .assigned import assigned_quizzes
+from .assignment_stats import get_assignment_stats
+from .gradebook import get_gradebook, iter_gradebook_csv
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from myapp.models import Quiz
 from django.utils import timezone
-from myapp.models import Attempt
 
 User = get_user_model()
 
-def user_role_in_room(user, room):
-	try:
-		m = RoomMembership.objects.get(user=user, room=room)
-		return m.role
-	except RoomMembership.DoesNotExist:
-		return None
-
 class CreateRoomView(LoginRequiredMixin, View):
 	def get(self, request):
 		form = RoomCreateForm()
@@ -37,33 +36,30 @@ class CreateRoomView(LoginRequiredMixin, View):
 class RoomDetailView(LoginRequiredMixin, View):
     def get(self, request, code):
         room = get_object_or_404(Room, code=code)
-        role = user_role_in_room(request.user, room)
-        members = room.memberships.select_related('user').all()
-        assignments = room.assignments.select_related('quiz').all()
-
-        assigned_ids = list(assignments.values_list('quiz_id', flat=True))
-
-        assigned_quizzes = Quiz.objects.filter(pk__in=assigned_ids).select_related('creator').order_by('-created_at')
+        role = room_access(request).role_in(room)
+        manages = role in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN)
+        # Managers see progress for the whole room instead of their own attempts.
+        if manages:
+            quizzes = assigned_quizzes(room)
+        else:
+            quizzes = assigned_quizzes(room, viewer=request.user, published_only=True)
 
         owner_quizzes = []
-        if role in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
-            owner_quizzes = Quiz.objects.filter(creator=request.user).exclude(pk__in=assigned_ids).order_by('-created_at')
-
-        visible_assigned_for_students = assigned_quizzes.filter(is_published=True) if not (role in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN)) else assigned_quizzes
-        attempts = Attempt.objects.filter(taker=request.user)
-        attempt_map = {a.quiz_id: a.id for a in attempts}
-        attempted_quiz_ids = list(attempt_map.keys())
+        if manages:
+            stats = get_assignment_stats(room, [q.pk for q in quizzes])
+            for q in quizzes:
+                q.stats = stats[q.pk]
+            owner_quizzes = (
+                Quiz.objects.filter(creator=request.user)
+                .exclude(pk__in=[q.pk for q in quizzes])
+                .order_by('-created_at')
+            )
 
         return render(request, 'room/detail.html', {
             'room': room,
             'role': role,
-            'members': members,
-            'assignments': assignments,
-            'assigned_quizzes': assigned_quizzes,
+            'assigned_quizzes': quizzes,
             'owner_quizzes': owner_quizzes,
-            'visible_assigned_for_students': visible_assigned_for_students,
-            'attempt_map': attempt_map,
-            'attempted_quiz_ids': attempted_quiz_ids,
         })
 
 class JoinByCodeView(LoginRequiredMixin, View):
@@ -82,7 +78,7 @@ class InviteUserView(LoginRequiredMixin, View):
     def post(self, request, code):
         form = InviteForm(request.POST)
         room = get_object_or_404(Room, code=code)
-        role = user_role_in_room(request.user, room)
+        role = room_access(request).role_in(room)
 
         if role not in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
             return HttpResponseForbidden()
@@ -142,13 +138,42 @@ class InvitationResponseView(LoginRequiredMixin, View):
 
 class InvitationsListView(LoginRequiredMixin, View):
 	def get(self, request):
-		invs = RoomInvitation.objects.filter(invited_user=request.user).order_by('-created_at')
-		return render(request, 'room/invitations_list.html', {'invitations': invs})
+		invs = list(RoomInvitation.objects.filter(invited_user=request.user).select_related('room', 'invited_by').order_by('-created_at'))
+		has_pending = any(inv.status == RoomInvitation.STATUS_PENDING for inv in invs)
+		return render(request, 'room/invitations_list.html', {'invitations': invs, 'has_pending': has_pending})
+
+class AcceptAllInvitationsView(LoginRequiredMixin, View):
+    def post(self, request):
+        joined = enrollment.accept_all_invitations(request.user)
+        if joined:
+            messages.success(request, f'เข้าร่วมแล้ว {joined} ห้อง')
+        return redirect('room:invitations')
+
+class EnrollView(LoginRequiredMixin, View):
+    def get(self, request, token):
+        found = enrollment.read_token(token)
+        if found is None:
+            messages.error(request, 'ลิงก์เข้าร่วมห้องไม่ถูกต้องหรือหมดอายุแล้ว')
+            return redirect('home')
+        room, role = found
+        if room_access(request).role_in(room):
+            return redirect('room:detail', code=room.code)
+        return render(request, 'room/enroll.html', {'room': room, 'role': role, 'token': token})
+
+    def post(self, request, token):
+        found = enrollment.read_token(token)
+        if found is None:
+            messages.error(request, 'ลิงก์เข้าร่วมห้องไม่ถูกต้องหรือหมดอายุแล้ว')
+            return redirect('home')
+        room, role = found
+        if enrollment.enroll(room, request.user, role):
+            messages.success(request, f'เข้าร่วมห้อง {room.name} แล้ว')
+        return redirect('room:detail', code=room.code)
 
 class AssignQuizToRoomView(LoginRequiredMixin, View):
 	def post(self, request, code):
 		room = get_object_or_404(Room, code=code)
-		role = user_role_in_room(request.user, room)
+		role = room_access(request).role_in(room)
 		if role not in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
 			return HttpResponseForbidden()
 		quiz_id = int(request.POST.get('quiz_id'))
@@ -170,10 +195,31 @@ class DeleteRoomView(LoginRequiredMixin, View):
         return redirect('/')  
 
 
+class GradebookView(LoginRequiredMixin, View):
+    def get(self, request, code):
+        room = get_object_or_404(Room, code=code)
+        if not room_access(request).manages_room(room):
+            return HttpResponseForbidden()
+        return render(request, 'room/gradebook.html', {
+            'room': room,
+            'gradebook': get_gradebook(room),
+        })
+
+
+class GradebookExportView(LoginRequiredMixin, View):
+    def get(self, request, code):
+        room = get_object_or_404(Room, code=code)
+        if not room_access(request).manages_room(room):
+            return HttpResponseForbidden()
+        response = StreamingHttpResponse(iter_gradebook_csv(get_gradebook(room)), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="gradebook-{room.code}.csv"'
+        return response
+
+
 class ManageMembersView(LoginRequiredMixin, View):
     def get(self, request, code):
         room = get_object_or_404(Room, code=code)
-        role = user_role_in_room(request.user, room)
+        role = room_access(request).role_in(room)
 
         members_qs = RoomMembership.objects.filter(room=room).select_related('user').order_by('role', 'user__username')
         owners = [m for m in members_qs if m.role == RoomMembership.ROLE_OWNER]
@@ -185,6 +231,20 @@ class ManageMembersView(LoginRequiredMixin, View):
         is_owner = (role == RoomMembership.ROLE_OWNER or role == 'owner')
         is_admin = (role == RoomMembership.ROLE_ADMIN or role == 'admin')
 
+        enroll_links = []
+        copy_sources = []
+        if is_owner or is_admin:
+            link_roles = [RoomMembership.ROLE_STUDENT] + ([RoomMembership.ROLE_ADMIN] if is_owner else [])
+            enroll_links = [
+                (link_role, request.build_absolute_uri(reverse('room:enroll', args=[enrollment.make_token(room, link_role)])))
+                for link_role in link_roles
+            ]
+            copy_sources = (
+                Room.objects.filter(pk__in=room_access(request).managed_room_ids)
+                .exclude(pk=room.pk)
+                .order_by('name')
+            )
+
         return render(request, 'room/manage_members.html', {
             'room': room,
             'role': role,
@@ -194,11 +254,14 @@ class ManageMembersView(LoginRequiredMixin, View):
             'invite_form': invite_form,
             'is_owner': is_owner,
             'is_admin': is_admin,
+            'enroll_links': enroll_links,
+            'enroll_days': enrollment.token_max_age().days,
+            'copy_sources': copy_sources,
         })
 
     def post(self, request, code):
         room = get_object_or_404(Room, code=code)
-        role = user_role_in_room(request.user, room)
+        role = room_access(request).role_in(room)
         if role not in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
             return HttpResponseForbidden()
 
@@ -247,10 +310,55 @@ class ManageMembersView(LoginRequiredMixin, View):
         return redirect('room:manage_members', code=room.code)
 
 
+class BulkInviteView(LoginRequiredMixin, View):
+    def get(self, request, code):
+        room = get_object_or_404(Room, code=code)
+        role = room_access(request).role_in(room)
+        if role not in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
+            return HttpResponseForbidden()
+        return render(request, 'room/bulk_invite.html', {'room': room, 'role': role, 'form': BulkInviteForm()})
+
+    def post(self, request, code):
+        room = get_object_or_404(Room, code=code)
+        role = room_access(request).role_in(room)
+        if role not in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
+            return HttpResponseForbidden()
+
+        form = BulkInviteForm(request.POST, request.FILES)
+        report = None
+        if form.is_valid():
+            invite_role = form.cleaned_data['role']
+            if role == RoomMembership.ROLE_ADMIN and invite_role == 'admin':
+                return HttpResponseForbidden()
+            report = invite_roster(room, form.cleaned_data['entries'], invite_role, request.user)
+            if report.invited:
+                messages.success(request, f'ส่งคำเชิญแล้ว {report.invited} คน')
+
+        return render(request, 'room/bulk_invite.html', {
+            'room': room,
+            'role': role,
+            'form': form,
+            'report': report,
+        })
+
+
+class CopyMembersView(LoginRequiredMixin, View):
+    def post(self, request, code):
+        room = get_object_or_404(Room, code=code)
+        source = get_object_or_404(Room, pk=request.POST.get('source_room') or 0)
+        access = room_access(request)
+        if not (access.manages_room(room) and access.manages_room(source)):
+            return HttpResponseForbidden()
+
+        added = enrollment.copy_members(source, room)
+        messages.success(request, f'เพิ่มสมาชิกจากห้อง {source.name} แล้ว {added} คน')
+        return redirect('room:manage_members', code=room.code)
+
+
 class RemoveMemberView(LoginRequiredMixin, View):
     def post(self, request, code):
         room = get_object_or_404(Room, code=code)
-        role = user_role_in_room(request.user, room)
+        role = room_access(request).role_in(room)
         if role not in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
             return HttpResponseForbidden()
 
@@ -285,7 +393,7 @@ class RemoveMemberView(LoginRequiredMixin, View):
 class ChangeMemberRoleView(LoginRequiredMixin, View):
     def post(self, request, code):
         room = get_object_or_404(Room, code=code)
-        actor_role = user_role_in_room(request.user, room)
+        actor_role = room_access(request).role_in(room)
         if actor_role != RoomMembership.ROLE_OWNER:
             return HttpResponseForbidden()
 
@@ -323,7 +431,7 @@ class ChangeMemberRoleView(LoginRequiredMixin, View):
 class RemoveMemberView(LoginRequiredMixin, View):
     def post(self, request, code):
         room = get_object_or_404(Room, code=code)
-        actor_role = user_role_in_room(request.user, room)
+        actor_role = room_access(request).role_in(room)
         if actor_role not in (RoomMembership.ROLE_OWNER, RoomMembership.ROLE_ADMIN):
             return HttpResponseForbidden()
 
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.grading import drain_submission_intake
+
+
+class Command(BaseCommand):
+    help = "Grade queued quiz submissions (QUIZ_ASYNC_GRADING) in batches. Several instances may run at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when the queue is empty.")
+        parser.add_argument("--sleep", type=float, default=0.5, help="Seconds to wait between polls in --loop mode.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = drain_submission_intake(options["batch_size"])
+            total += processed
+            if processed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} submissions."))
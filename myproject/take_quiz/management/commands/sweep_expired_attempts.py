@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.grading import finalize_expired_attempts
+
+
+class Command(BaseCommand):
+    help = "Finalize open attempts past their deadline, grading autosaved answers as an auto-submission."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--loop", action="store_true", help="Keep sweeping instead of exiting after one pass.")
+        parser.add_argument("--sleep", type=float, default=30.0, help="Seconds to wait between sweeps in --loop mode.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            total += finalize_expired_attempts(batch_size=options["batch_size"])
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Finalized {total} expired attempts."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import Quiz
+from take_quiz.paper import warm_paper
+
+
+class Command(BaseCommand):
+    help = "Pre-render and cache exam papers (defaults to every published quiz)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiz", type=int, action="append", dest="quiz_ids", help="Only this quiz (repeatable).")
+
+    def handle(self, *args, **options):
+        quizzes = Quiz.objects.filter(is_published=True)
+        if options["quiz_ids"]:
+            quizzes = Quiz.objects.filter(pk__in=options["quiz_ids"])
+
+        rendered = 0
+        total = 0
+        for quiz in quizzes.iterator():
+            total += 1
+            if warm_paper(quiz):
+                rendered += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Warmed {total} papers ({rendered} newly rendered)."))
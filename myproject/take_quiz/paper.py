@@ -0,0 +1,42 @@
+"""
+Cached exam paper markup.
+
+The question/choice part of the take_quiz page is identical for everyone
+taking the same quiz content, so it is rendered once per answer-key version (or snapshot)
+and served from the cache. Only the per-attempt wrapper (attempt id, timer,
+CSRF token, draft) is rendered live.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from myapp.answer_key import CACHE_TIMEOUT, get_answer_key, get_attempt_key, get_snapshot_key
+
+PAPER_TEMPLATE = "take_quiz/_paper.html"
+
+
+def paper_cache_key(key):
+    return f"quiz_paper:{key.cache_key}"
+
+
+def render_paper(key):
+    return render_to_string(PAPER_TEMPLATE, {"key": key})
+
+
+def get_paper(attempt):
+    key = get_attempt_key(attempt)
+    cache_key = paper_cache_key(key)
+    html = cache.get(cache_key)
+    if html is None:
+        html = render_paper(key)
+        cache.set(cache_key, html, CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def warm_paper(quiz):
+    """Render and store the paper new attempts of ``quiz`` will get. Returns True if it was not cached yet."""
+    if quiz.published_snapshot_id:
+        key = get_snapshot_key(quiz.published_snapshot_id)
+    else:
+        key = get_answer_key(quiz)
+    return cache.add(paper_cache_key(key), render_paper(key), CACHE_TIMEOUT)
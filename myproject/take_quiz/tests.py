@@ -1,14 +1,32 @@
-from django.test import TestCase, Client
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
 from django.utils import timezone
 
-from myapp.models import Quiz, Question, Choice, Attempt, Answer
+from django.core.cache import cache
+
+from myapp import answer_key
+from myapp.grading import drain_submission_intake
+from myapp.models import Quiz, Question, Choice, Attempt, Answer, AttemptDraft, QuizSnapshot, SubmissionIntake
+from room.models import Room, RoomMembership, RoomQuizAssignment
+from take_quiz import paper, views
 
 User = get_user_model()
 
 class TakeQuizFlowTests(TestCase):
     def setUp(self):
+        # Row ids are reused between tests, so cached keys/snapshots must not leak across them.
+        cache.clear()
+        answer_key._local_keys.clear()
+
         self.teacher = User.objects.create_user(username="teacher", password="teachpw")
         self.student = User.objects.create_user(username="student", password="studpw")
         self.other_student = User.objects.create_user(username="other", password="otherpw")
@@ -118,3 +136,278 @@ class TakeQuizFlowTests(TestCase):
             f"question_{self.q_short.id}": "answer"
         })
         self.assertEqual(r_other.status_code, 404)
+
+    def _submit_query_count(self, n_questions):
+        quiz = Quiz.objects.create(title=f"Q{n_questions}", creator=self.teacher, is_published=True)
+        post_data = {}
+        for i in range(n_questions):
+            q = Question.objects.create(quiz=quiz, text=f"q{i}", qtype="mcq", order=i + 1)
+            Choice.objects.create(question=q, text="no", is_correct=False)
+            right = Choice.objects.create(question=q, text="yes", is_correct=True)
+            post_data[f"question_{q.id}"] = str(right.id)
+        attempt = Attempt.objects.create(quiz=quiz, taker=self.student)
+
+        self.client.force_login(self.student)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(reverse("take_quiz:submit_quiz", args=[attempt.id]), post_data)
+        self.assertEqual(resp.status_code, 302)
+        attempt.refresh_from_db()
+        self.assertAlmostEqual(attempt.score, 100.0, places=3)
+        self.assertEqual(attempt.answers.count(), n_questions)
+        return len(ctx.captured_queries)
+
+    def test_submit_query_count_does_not_grow_with_questions(self):
+        self.assertEqual(self._submit_query_count(3), self._submit_query_count(30))
+
+    def test_autosaved_draft_is_graded_when_final_post_is_empty(self):
+        attempt = Attempt.objects.create(quiz=self.quiz, taker=self.student)
+        self.client.force_login(self.student)
+        autosave_url = reverse("take_quiz:autosave_attempt", args=[attempt.id])
+
+        r1 = self.client.post(autosave_url, json.dumps({"answers": {f"question_{self.q_mcq.id}": str(self.c_wrong.id)}}),
+                              content_type="application/json")
+        r2 = self.client.post(autosave_url, json.dumps({"answers": {
+            f"question_{self.q_mcq.id}": str(self.c_right.id),
+            f"question_{self.q_short.id}": "draft text",
+            "evil": "ignored",
+        }}), content_type="application/json")
+        self.assertEqual((r1.status_code, r2.status_code), (200, 200))
+
+        resp = self.client.post(reverse("take_quiz:submit_quiz", args=[attempt.id]), {"auto_submitted": "1"})
+        self.assertEqual(resp.status_code, 302)
+        attempt.refresh_from_db()
+        self.assertAlmostEqual(attempt.score, 100.0, places=3)
+        self.assertEqual(attempt.answers.get(question=self.q_short).text, "draft text")
+
+        r3 = self.client.post(autosave_url, json.dumps({"answers": {}}), content_type="application/json")
+        self.assertEqual(r3.status_code, 409)
+
+    def test_async_grading_queues_submission_for_worker(self):
+        attempt = Attempt.objects.create(quiz=self.quiz, taker=self.student)
+        self.client.force_login(self.student)
+        with override_settings(QUIZ_ASYNC_GRADING=True):
+            resp = self.client.post(reverse("take_quiz:submit_quiz", args=[attempt.id]), {
+                f"question_{self.q_mcq.id}": str(self.c_right.id),
+                f"question_{self.q_short.id}": "queued",
+            })
+        self.assertEqual(resp.status_code, 302)
+        attempt.refresh_from_db()
+        self.assertIsNone(attempt.finished_at)
+        self.assertEqual(SubmissionIntake.objects.filter(attempt=attempt).count(), 1)
+        self.assertTemplateUsed(self.client.get(resp.url), "take_quiz/grading.html")
+
+        call_command("process_submissions", stdout=StringIO())
+        attempt.refresh_from_db()
+        self.assertIsNotNone(attempt.finished_at)
+        self.assertAlmostEqual(attempt.score, 100.0, places=3)
+        self.assertEqual(attempt.answers.count(), 2)
+        self.assertFalse(SubmissionIntake.objects.filter(processed_at__isnull=True).exists())
+
+    def test_submission_workers_only_grade_the_rows_they_claimed(self):
+        mine = Attempt.objects.create(quiz=self.quiz, taker=self.student, submit_key="a")
+        theirs = Attempt.objects.create(quiz=self.quiz, taker=self.other_student, submit_key="b")
+        answers = {f"question_{self.q_mcq.id}": str(self.c_right.id)}
+        SubmissionIntake.objects.create(attempt=mine, payload=answers)
+        SubmissionIntake.objects.create(attempt=theirs, payload=answers, claim_token="other-worker")
+
+        self.assertEqual(drain_submission_intake(), 1)
+        self.assertEqual(drain_submission_intake(), 0)
+        mine.refresh_from_db()
+        theirs.refresh_from_db()
+        self.assertIsNotNone(mine.finished_at)
+        self.assertIsNone(theirs.finished_at)
+        self.assertEqual(SubmissionIntake.objects.filter(processed_at__isnull=True).count(), 1)
+
+    def test_async_submission_closes_attempt_before_grading(self):
+        self.client.force_login(self.student)
+        start_url = reverse("take_quiz:start_quiz", args=[self.quiz.id])
+        self.client.get(start_url)
+        attempt = Attempt.objects.get(quiz=self.quiz, taker=self.student)
+        autosave_url = reverse("take_quiz:autosave_attempt", args=[attempt.id])
+        self.client.post(autosave_url, json.dumps({"answers": {f"question_{self.q_short.id}": "draft"}}),
+                         content_type="application/json")
+
+        # The MCQ is left unanswered, so the radio is not posted at all.
+        with override_settings(QUIZ_ASYNC_GRADING=True):
+            self.client.post(reverse("take_quiz:submit_quiz", args=[attempt.id]), {})
+        result_url = reverse("take_quiz:attempt_result", args=[attempt.id])
+        self.assertRedirects(self.client.get(start_url), result_url, fetch_redirect_response=False)
+        take_url = reverse("take_quiz:take_quiz", args=[self.quiz.id, attempt.id])
+        self.assertRedirects(self.client.get(take_url), result_url, fetch_redirect_response=False)
+
+        late = {"answers": {f"question_{self.q_mcq.id}": str(self.c_right.id)}}
+        resp = self.client.post(autosave_url, json.dumps(late), content_type="application/json")
+        self.assertEqual(resp.status_code, 409)
+        # Even a save that slipped past the check is not graded.
+        AttemptDraft.objects.filter(attempt=attempt).update(answers=late["answers"])
+
+        call_command("process_submissions", stdout=StringIO())
+        attempt.refresh_from_db()
+        self.assertIsNone(attempt.answers.get(question=self.q_mcq).selected_choice_id)
+        self.assertEqual(attempt.answers.get(question=self.q_short).text, "draft")
+        self.assertAlmostEqual(attempt.score, 0.0, places=3)
+
+    def test_paper_is_rendered_once_per_content_version(self):
+        attempt = Attempt.objects.create(quiz=self.quiz, taker=self.student)
+        take_url = reverse("take_quiz:take_quiz", args=[self.quiz.id, attempt.id])
+        self.client.force_login(self.student)
+
+        call_command("warm_quiz_papers", quiz_ids=[self.quiz.id], stdout=StringIO())
+        with mock.patch.object(paper, "render_paper", wraps=paper.render_paper) as render:
+            r1 = self.client.get(take_url)
+            r2 = self.client.get(take_url)
+            self.assertEqual(render.call_count, 0)
+            self.assertContains(r1, self.c_right.text)
+            self.assertContains(r2, f'name="question_{self.q_short.id}"')
+
+            Choice.objects.create(question=self.q_mcq, text="five", is_correct=False)
+            r3 = self.client.get(take_url)
+            self.assertEqual(render.call_count, 1)
+            self.assertContains(r3, "five")
+
+    def test_attempt_uses_snapshot_frozen_at_publish(self):
+        self.client.force_login(self.teacher)
+        toggle_url = reverse("create_quiz:toggle_publish", args=[self.quiz.id])
+        self.client.post(toggle_url)  # unpublish
+        self.client.post(toggle_url)  # publish again, freezes a snapshot
+        self.client.post(toggle_url)
+        self.client.post(toggle_url)  # unchanged content reuses it
+        self.assertEqual(QuizSnapshot.objects.filter(quiz=self.quiz).count(), 1)
+
+        self.client.force_login(self.student)
+        r = self.client.get(reverse("take_quiz:start_quiz", args=[self.quiz.id]))
+        attempt = Attempt.objects.get(quiz=self.quiz, taker=self.student)
+        self.assertEqual(attempt.snapshot, QuizSnapshot.objects.get(quiz=self.quiz))
+
+        self.q_mcq.text = "Edited after the exam started"
+        self.q_mcq.save()
+        self.c_wrong.is_correct = True
+        self.c_wrong.save()
+
+        self.client.post(reverse("take_quiz:submit_quiz", args=[attempt.id]), {
+            f"question_{self.q_mcq.id}": str(self.c_right.id),
+        })
+        attempt.refresh_from_db()
+        self.assertAlmostEqual(attempt.score, 100.0, places=3)
+
+        result = self.client.get(reverse("take_quiz:attempt_result", args=[attempt.id]))
+        self.assertContains(result, "2 + 2 = ?")
+        self.assertNotContains(result, "Edited after the exam started")
+
+    def test_short_answer_is_graded_on_submit_by_match_mode(self):
+        self.q_short.correct_text = "four\n4"
+        self.q_short.match_mode = "normalized"
+        self.q_short.save()
+        attempt = Attempt.objects.create(quiz=self.quiz, taker=self.student)
+        self.client.force_login(self.student)
+
+        self.client.post(reverse("take_quiz:submit_quiz", args=[attempt.id]), {
+            f"question_{self.q_mcq.id}": str(self.c_wrong.id),
+            f"question_{self.q_short.id}": "  FOUR ",
+        })
+        attempt.refresh_from_db()
+        self.assertTrue(attempt.answers.get(question=self.q_short).is_correct)
+        self.assertEqual((attempt.correct_count, attempt.pending_short_count), (1, 0))
+        self.assertAlmostEqual(attempt.score, 50.0, places=3)
+
+    def test_start_is_idempotent_and_submit_retry_is_not_regraded(self):
+        self.client.force_login(self.student)
+        start_url = reverse("take_quiz:start_quiz", args=[self.quiz.id])
+        r1 = self.client.get(start_url)
+        r2 = self.client.get(start_url)
+        self.assertEqual(r1.url, r2.url)
+        attempt = Attempt.objects.get(quiz=self.quiz, taker=self.student)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Attempt.objects.create(quiz=self.quiz, taker=self.student)
+
+        submit_url = reverse("take_quiz:submit_quiz", args=[attempt.id])
+        data = {f"question_{self.q_mcq.id}": str(self.c_right.id), "idempotency_key": "k-1"}
+        self.client.post(submit_url, data)
+        attempt.refresh_from_db()
+        first_finished = attempt.finished_at
+
+        retry = self.client.post(submit_url, dict(data, **{f"question_{self.q_mcq.id}": str(self.c_wrong.id)}))
+        self.assertRedirects(retry, reverse("take_quiz:attempt_result", args=[attempt.id]), fetch_redirect_response=False)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.submit_key, "k-1")
+        self.assertEqual(attempt.finished_at, first_finished)
+        self.assertAlmostEqual(attempt.score, 100.0, places=3)
+        self.assertEqual(attempt.answers.get(question=self.q_mcq).selected_choice_id, self.c_right.id)
+
+    def test_submit_grades_outside_a_transaction_and_releases_claim_on_error(self):
+        attempt = Attempt.objects.create(quiz=self.quiz, taker=self.student)
+        submit_url = reverse("take_quiz:submit_quiz", args=[attempt.id])
+        data = {f"question_{self.q_mcq.id}": str(self.c_right.id)}
+        self.client.force_login(self.student)
+
+        depth = len(connection.atomic_blocks)  # TestCase's own blocks
+
+        def failing(submissions):
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            raise RuntimeError("grading failed")
+
+        with mock.patch.object(views, "finalize_attempts", side_effect=failing):
+            with self.assertRaises(RuntimeError):
+                self.client.post(submit_url, data)
+        attempt.refresh_from_db()
+        self.assertIsNone(attempt.submit_key)
+
+        self.client.post(submit_url, data)
+        attempt.refresh_from_db()
+        self.assertAlmostEqual(attempt.score, 100.0, places=3)
+
+    def test_sweeper_finalizes_expired_attempts_with_their_drafts(self):
+        self.quiz.time_limit_minutes = 10
+        self.quiz.save()
+        self.client.force_login(self.student)
+        self.client.get(reverse("take_quiz:start_quiz", args=[self.quiz.id]))
+        expired = Attempt.objects.get(quiz=self.quiz, taker=self.student)
+        self.assertAlmostEqual(expired.deadline, expired.started_at + timedelta(minutes=10), delta=timedelta(seconds=1))
+
+        past = timezone.now() - timedelta(minutes=30)
+        Attempt.objects.filter(pk=expired.pk).update(started_at=past, deadline=past + timedelta(minutes=10))
+        AttemptDraft.objects.create(attempt=expired, answers={f"question_{self.q_mcq.id}": str(self.c_right.id)})
+        still_open = Attempt.objects.create(quiz=self.quiz, taker=self.other_student,
+                                            deadline=timezone.now() + timedelta(minutes=5))
+
+        out = StringIO()
+        call_command("sweep_expired_attempts", stdout=out)
+        self.assertIn("Finalized 1 expired attempts", out.getvalue())
+        expired.refresh_from_db()
+        still_open.refresh_from_db()
+        self.assertEqual(expired.finished_at, past + timedelta(minutes=10))
+        self.assertAlmostEqual(expired.score, 100.0, places=3)
+        self.assertFalse(AttemptDraft.objects.filter(attempt=expired).exists())
+        self.assertIsNone(still_open.finished_at)
+
+        resp = self.client.post(reverse("take_quiz:submit_quiz", args=[expired.id]), {})
+        self.assertEqual(resp.status_code, 302)
+        expired.refresh_from_db()
+        self.assertAlmostEqual(expired.score, 100.0, places=3)
+
+    def test_start_links_attempt_to_room_and_membership(self):
+        rooms = [Room.objects.create(name=f"Room {i}", owner=self.teacher) for i in range(2)]
+        memberships = [
+            RoomMembership.objects.create(room=room, user=self.student, role=RoomMembership.ROLE_STUDENT)
+            for room in rooms
+        ]
+        RoomQuizAssignment.objects.create(room=rooms[0], quiz=self.quiz, assigned_by=self.teacher)
+        second_quiz = Quiz.objects.create(title="Second", creator=self.teacher, is_published=True)
+        for room in rooms:
+            RoomQuizAssignment.objects.create(room=room, quiz=second_quiz, assigned_by=self.teacher)
+
+        self.client.login(username="student", password="studpw")
+        # Only one of the student's rooms has the quiz, so no code is needed.
+        self.client.get(reverse("take_quiz:start_quiz", args=[self.quiz.id]))
+        attempt = Attempt.objects.get(quiz=self.quiz, taker=self.student)
+        self.assertEqual((attempt.room_id, attempt.room_membership_id), (rooms[0].pk, memberships[0].pk))
+
+        # Assigned in both rooms: the room code decides, and an unknown code decides nothing.
+        self.client.get(reverse("take_quiz:start_quiz", args=[second_quiz.id]) + f"?room={rooms[1].code.lower()}")
+        attempt = Attempt.objects.get(quiz=second_quiz, taker=self.student)
+        self.assertEqual((attempt.room_id, attempt.room_membership_id), (rooms[1].pk, memberships[1].pk))
+
+        attempt.delete()
+        self.client.get(reverse("take_quiz:start_quiz", args=[second_quiz.id]) + "?room=NOPE")
+        attempt = Attempt.objects.get(quiz=second_quiz, taker=self.student)
+        self.assertIsNone(attempt.room_id)
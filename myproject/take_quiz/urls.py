@@ -8,5 +8,6 @@ urlpatterns = [
     path("<int:quiz_id>/start/", views.start_quiz, name="start_quiz"),
     path("<int:quiz_id>/take/<int:attempt_id>/", views.take_quiz, name="take_quiz"),
     path("<int:attempt_id>/submit/", views.submit_quiz, name="submit_quiz"),
+    path("<int:attempt_id>/autosave/", views.autosave_attempt, name="autosave_attempt"),
     path("attempt/<int:attempt_id>/result/", views.attempt_result, name="attempt_result"),
 ]
\ No newline at end of file
@@ -1,14 +1,30 @@
+import json
+import re
+import uuid
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.views.generic import ListView
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from myapp.models import Quiz, Choice, Attempt, Answer
+from myapp.models import Quiz, Choice, Attempt, Answer, AttemptDraft, SubmissionIntake
+from myapp.answer_key import get_attempt_key, freeze_snapshot
+from myapp.grading import deadline_for, finalize_attempts
+from myapp.result_versions import bump_quiz_attempts
+from room.assigned import membership_for_attempt
+from .paper import get_paper
+from django.conf import settings
 from django.contrib import messages
 from django.db import transaction, IntegrityError
+from django.db.models import F
 from datetime import timedelta
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_POST
+
+AUTOSAVE_FIELD_RE = re.compile(r"^question_\d+$")
+AUTOSAVE_MAX_LENGTH = 1000
+AUTOSAVE_GRACE = timedelta(seconds=30)
 
 @method_decorator(login_required, name='dispatch')
 class QuizListView(ListView):
@@ -33,20 +49,48 @@ class QuizListView(ListView):
 
 @login_required
 def start_quiz(request, quiz_id):
-    quiz = get_object_or_404(Quiz, pk=quiz_id, is_published=True)
+    quiz = get_object_or_404(
+        Quiz.objects.select_related("published_snapshot").defer("published_snapshot__payload"),
+        pk=quiz_id,
+        is_published=True,
+    )
 
     room_code = request.GET.get("room") or request.POST.get("room")
-    
-    existing = Attempt.objects.filter(quiz=quiz, taker=request.user).first()
+
+    existing = (
+        Attempt.objects.filter(quiz=quiz, taker=request.user)
+        .order_by(F("finished_at").asc(nulls_first=True), "-id")
+        .only("id", "finished_at", "submit_key")
+        .first()
+    )
     if existing:
+        if existing.is_open:
+            return redirect("take_quiz:take_quiz", quiz_id=quiz.id, attempt_id=existing.id)
         return redirect("take_quiz:attempt_result", attempt_id=existing.id)
 
-    attempt = Attempt.objects.create(
-        quiz=quiz,
-        taker=request.user,
-        started_at=timezone.now(),
-        room_code=room_code
-    )
+    snapshot = quiz.published_snapshot
+    if snapshot is None or snapshot.content_version != quiz.content_version:
+        snapshot = freeze_snapshot(quiz)
+    membership = membership_for_attempt(quiz, request.user, room_code)
+
+    # The open-attempt constraint makes a double click or retried request
+    # land on the attempt the first request created.
+    try:
+        with transaction.atomic():
+            started_at = timezone.now()
+            attempt = Attempt.objects.create(
+                quiz=quiz,
+                taker=request.user,
+                started_at=started_at,
+                deadline=deadline_for(quiz, started_at),
+                room_code=room_code,
+                room=membership.room if membership else None,
+                room_membership=membership,
+                snapshot=snapshot,
+            )
+        bump_quiz_attempts(quiz.id)
+    except IntegrityError:
+        attempt = Attempt.objects.get(quiz=quiz, taker=request.user, finished_at__isnull=True)
 
     return redirect("take_quiz:take_quiz", quiz_id=quiz.id, attempt_id=attempt.id)
 
@@ -56,109 +100,135 @@ def take_quiz(request, quiz_id, attempt_id):
     quiz = get_object_or_404(Quiz, pk=quiz_id, is_published=True)
     attempt = get_object_or_404(Attempt, pk=attempt_id, quiz=quiz, taker=request.user)
 
-    if attempt.finished_at:
+    if not attempt.is_open:
         return redirect("take_quiz:attempt_result", attempt_id=attempt.id)
 
-    questions = quiz.questions.all().order_by("order", "id").prefetch_related("choices")
+    draft_answers = AttemptDraft.objects.filter(attempt=attempt).values_list("answers", flat=True).first() or {}
 
     return render(request, "take_quiz/take_quiz.html", {
         "quiz": quiz,
         "attempt": attempt,
-        "questions": questions,
+        "paper": get_paper(attempt),
+        "draft_answers": draft_answers,
+        "idempotency_key": uuid.uuid4().hex,
     })
 
 
 @login_required
-@transaction.atomic
+@require_POST
+def autosave_attempt(request, attempt_id):
+    attempt = get_object_or_404(Attempt, pk=attempt_id, taker=request.user)
+
+    if not attempt.is_open:
+        return JsonResponse({"ok": False, "error": "attempt finished"}, status=409)
+    if attempt.deadline and timezone.now() > attempt.deadline + AUTOSAVE_GRACE:
+        return JsonResponse({"ok": False, "error": "time limit exceeded"}, status=409)
+
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+        delta = payload.get("answers", {})
+        if not isinstance(delta, dict):
+            return JsonResponse({"ok": False, "error": "invalid payload"}, status=400)
+    except Exception:
+        return JsonResponse({"ok": False, "error": "invalid json"}, status=400)
+
+    delta = {
+        name: str(value)[:AUTOSAVE_MAX_LENGTH]
+        for name, value in delta.items()
+        if AUTOSAVE_FIELD_RE.match(str(name)) and value is not None
+    }
+    if not delta:
+        return JsonResponse({"ok": True, "saved": 0})
+
+    with transaction.atomic():
+        draft, _ = AttemptDraft.objects.select_for_update().get_or_create(attempt=attempt)
+        draft.answers.update(delta)
+        draft.save(update_fields=["answers", "updated_at"])
+
+    return JsonResponse({"ok": True, "saved": len(delta)})
+
+
+@login_required
 def submit_quiz(request, attempt_id):
     if request.method != "POST":
         return redirect("home")
 
-    attempt = get_object_or_404(Attempt, pk=attempt_id, taker=request.user)
-    quiz = attempt.quiz
+    attempt = get_object_or_404(Attempt.objects.select_related("quiz"), pk=attempt_id, taker=request.user)
 
     if attempt.finished_at:
         return redirect("take_quiz:attempt_result", attempt_id=attempt.id)
 
     auto_submitted = bool(request.POST.get("auto_submitted"))
-
-    questions = quiz.questions.all().order_by("order", "id").prefetch_related("choices")
-    correct_count = 0
-    total_questions = questions.count()
-
-    attempt.answers.all().delete()
-
-    for q in questions:
-        field_name = f"question_{q.id}"
-        selected_choice_id = request.POST.get(field_name)
-        if q.qtype == "mcq":
-            selected_choice = None
-            if selected_choice_id:
-                try:
-                    selected_choice = q.choices.get(pk=int(selected_choice_id))
-                except (Choice.DoesNotExist, ValueError):
-                    selected_choice = None
-
-            Answer.objects.create(
+    now = timezone.now()
+    posted = {name: value for name, value in request.POST.items() if AUTOSAVE_FIELD_RE.match(name)}
+    submit_key = (request.POST.get("idempotency_key") or "").strip()[:64] or uuid.uuid4().hex
+
+    # Claim the attempt for this submission with one autocommit UPDATE. A
+    # retry with the same key, or a racing second submit, finds it claimed
+    # and gets the stored result.
+    claimed = Attempt.objects.filter(
+        pk=attempt.pk, finished_at__isnull=True, submit_key__isnull=True,
+    ).update(submit_key=submit_key)
+    if not claimed:
+        return redirect("take_quiz:attempt_result", attempt_id=attempt.id)
+    attempt.submit_key = submit_key
+
+    try:
+        # Autosaved answers form the base; anything in the final POST overrides them.
+        responses = dict(AttemptDraft.objects.filter(attempt=attempt).values_list("answers", flat=True).first() or {})
+        responses.update(posted)
+
+        if getattr(settings, "QUIZ_ASYNC_GRADING", False):
+            # Accept now, grade shortly: one insert, then the worker takes over.
+            # The payload holds the merged answers, so autosaves racing this
+            # submit cannot change what gets graded.
+            SubmissionIntake.objects.create(
                 attempt=attempt,
-                question=q,
-                selected_choice=selected_choice,
-                text=""
+                payload=responses,
+                auto_submitted=auto_submitted,
+                received_at=now,
             )
-            if selected_choice and getattr(selected_choice, "is_correct", False):
-                correct_count += 1
+            return redirect("take_quiz:attempt_result", attempt_id=attempt.id)
+
+        # Grading runs outside any transaction; finalize_attempts opens the
+        # short one that writes the results.
+        late = finalize_attempts([{
+            "attempt": attempt,
+            "responses": responses,
+            "submitted_at": now,
+            "auto_submitted": auto_submitted,
+        }])
+    except Exception:
+        # Release the claim so the student can submit again.
+        Attempt.objects.filter(
+            pk=attempt.pk, submit_key=submit_key, finished_at__isnull=True,
+        ).update(submit_key=None)
+        raise
+
+    if late:
+        if auto_submitted:
+            messages.info(request, "Your answers were auto-submitted at the deadline.")
         else:
-            text_ans = request.POST.get(field_name, "").strip()
-            Answer.objects.create(
-                attempt=attempt,
-                question=q,
-                selected_choice=None,
-                text=text_ans
-            )
-
-    mcq_questions = questions.filter(qtype="mcq").count()
-    if mcq_questions > 0:
-        score = (correct_count / mcq_questions) * 100.0
-    else:
-        score = None
-
-    now = timezone.now()
-    if quiz.time_limit_minutes:
-        deadline = attempt.started_at + timedelta(minutes=quiz.time_limit_minutes)
-        if now > deadline:
-            if auto_submitted:
-                attempt.finished_at = now
-                attempt.score = score
-                attempt.save()
-                messages.info(request, "Your answers were auto-submitted at the deadline.")
-                return redirect("take_quiz:attempt_result", attempt_id=attempt.id)
-            else:
-                attempt.finished_at = now
-                attempt.score = None
-                attempt.save()
-                messages.error(request, "Time limit exceeded — submission not accepted.")
-                return redirect('take_quiz:attempt_result', attempt_id=attempt.id)
-
-    attempt.finished_at = now
-    attempt.score = score
-    attempt.save()
+            messages.error(request, "Time limit exceeded — submission not accepted.")
 
     return redirect("take_quiz:attempt_result", attempt_id=attempt.id)
 
 
 @login_required
 def attempt_result(request, attempt_id):
-    attempt = get_object_or_404(Attempt, pk=attempt_id, taker=request.user)
+    attempt = get_object_or_404(Attempt.objects.select_related("quiz"), pk=attempt_id, taker=request.user)
     quiz = attempt.quiz
 
-    questions = quiz.questions.all().order_by("order", "id")
-    answers_qs = attempt.answers.select_related("question", "selected_choice").all()
-    answers_map = {a.question_id: a for a in answers_qs}
+    if not attempt.finished_at and SubmissionIntake.objects.filter(attempt=attempt, processed_at__isnull=True).exists():
+        return render(request, "take_quiz/grading.html", {"attempt": attempt, "quiz": quiz})
+
+    key = get_attempt_key(attempt)
+    answers_map = {a.question_id: a for a in attempt.answers.all()}
 
     answer_rows = []
-    for q in questions:
-        a = answers_map.get(q.pk)  # may be None if user didn't answer
-        selected_choice = a.selected_choice if a else None
+    for q in key.questions:
+        a = answers_map.get(q.id)  # may be None if user didn't answer
+        selected_choice = key.choices.get(a.selected_choice_id) if a else None
         text = a.text if a else ""
 
         row = {
@@ -172,11 +242,11 @@ def attempt_result(request, attempt_id):
         }
 
         if q.qtype == "mcq":
-            row["is_correct"] = bool(selected_choice and getattr(selected_choice, "is_correct", False))
-            row["correct_choice"] = q.choices.filter(is_correct=True).first()
+            row["is_correct"] = bool(selected_choice and selected_choice.is_correct)
+            row["correct_choice"] = q.correct_choice
         else:
             row["is_correct"] = a.is_correct if a else None
-            row["correct_text"] = getattr(q, "correct_text", None)
+            row["correct_text"] = q.correct_text
 
         answer_rows.append(row)
 